@@ -9,6 +9,7 @@ setup(
     install_requires=[
         "fastapi",
         "uvicorn",
+        "gunicorn",
         "pydantic",
         "python-dotenv",
         "langchain",
@@ -25,7 +26,14 @@ setup(
         "lark",
         "beautifulsoup4",
         "html2text",
+        "prometheus-client",
+        "sqlalchemy[asyncio]>=2.0",
+        "aiosqlite",
     ],
+    extras_require={
+        # Speedscope output for request profiling (src/utils/profiling.py)
+        "profiling": ["pyinstrument"],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
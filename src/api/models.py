@@ -1,16 +1,21 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
 class UserQuery(BaseModel):
     text: str
 
 class Response(BaseModel):
     answer: str
+    # Steps skipped or shortened to answer within the request deadline (see utils/deadline.py)
+    degradations: List[str] = []
 
 class ChatHistory(BaseModel):
+    id: Optional[int] = None
     session_id: str
     role: str
     content: str
+    timestamp: Optional[datetime] = None
 
     class Config:
         orm_mode = True  # This allows Pydantic to work with SQLAlchemy models
@@ -21,4 +26,28 @@ class Message(BaseModel):
 
 class ConversationResponse(BaseModel):
     id: str
-    chat_name: str
\ No newline at end of file
+    chat_name: str
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class ThesisRecord(BaseModel):
+    """A thesis in the schema of the corpus file (src/data/data.json)"""
+    Title: str
+    Abstract: str
+    Year: int
+    full_text: str
+    clickable_url: str
+
+class IngestJob(BaseModel):
+    id: str
+    state: str  # queued, running, completed or failed
+    total: int
+    processed: int
+    abstracts: int
+    chunks: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
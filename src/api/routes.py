@@ -1,82 +1,180 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from ..models.history_models import ChatSession, ChatMessage, SessionLocal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi import Response as HTTPResponse
+from fastapi.responses import FileResponse
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from ..models.history_models import ChatSession, ChatMessage, AsyncSessionLocal
 from ..services.system_manager import SystemManager
-from .models import UserQuery, Response, ChatHistory, ConversationResponse
+from ..services.index_rebuilder import IndexRebuilder
+from ..services.ingestion import IngestWorker
+from ..services.history_writer import ChatHistoryWriter
+from ..config.settings import (
+    ADMIN_TOKEN, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE, REQUEST_DEADLINE, INGEST_MAX_RECORDS, PROFILE_DIR,
+)
+from .models import UserQuery, Response, ChatHistory, ConversationResponse, ThesisRecord, IngestJob
+from ..utils.logging_config import log_payload
+from ..utils.usage import tier_usage
+import hashlib
 import logging
+import os
+import secrets
 from uuid import uuid4
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def get_rag_system():
-    """Dependency to get the RAG system instance."""
+    """
+    Dependency to get the RAG system instance. It is held until the response
+    is sent, so that an index swap waits for the request before retiring it.
+    """
     try:
-        return SystemManager.get_instance()
+        SystemManager.get_instance()
     except Exception as e:
         logger.error(f"Error getting RAG system: {str(e)}")
         raise HTTPException(
             status_code=503,
             detail="Service not ready. Please wait for initialization to complete."
         )
+    with SystemManager.lease() as rag_system:
+        yield rag_system
+
+def is_admin_token(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and bool(token) and secrets.compare_digest(token, ADMIN_TOKEN)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency guarding the admin endpoints."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
     
-@router.put("/chats/{chatId}/changename")
-async def update_chat_name(chatId: str, chat_name: str = Query(...), db: Session = Depends(get_db)):
-    chat_session = db.query(ChatSession).filter(ChatSession.id == chatId).first()
+@router.put("/chats/{chatId}/changename", response_model=ConversationResponse)
+async def update_chat_name(chatId: str, chat_name: str = Query(...), db: AsyncSession = Depends(get_db)):
+    chat_session = await db.get(ChatSession, chatId)
     if not chat_session:
         raise HTTPException(status_code=404, detail="Chat session not found")
     
     chat_session.chat_name = chat_name  # Update the chat name
-    db.commit()
-    db.refresh(chat_session)  # Refresh the instance to get the updated data
+    chat_session.version += 1
+    await db.commit()
     return chat_session
 
+def history_etag(*parts) -> str:
+    """
+    Weak ETag of a history response, from the session versions it was built
+    from and its query parameters (weak: the body may be sent gzip-compressed).
+    """
+    digest = hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def not_modified(request: Request, response: HTTPResponse, etag: str) -> Optional[HTTPResponse]:
+    """A 304 response if the client already has this version, else tag `response` with it."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        if "*" in tags or etag in tags:
+            return HTTPResponse(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
 @router.get("/conversations", response_model=List[ConversationResponse])
-def get_conversations(db: Session = Depends(get_db)):
-    conversations = db.query(ChatSession).all()
-    return [{"id": conv.id, "chat_name": conv.chat_name} for conv in conversations]
+async def get_conversations(
+    request: Request,
+    response: HTTPResponse,
+    before: Optional[str] = Query(None, description="Id of the last conversation of the previous page"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Conversations, most recently active first (keyset-paginated on updated_at, id).
+    Answers 304 to a matching If-None-Match while no conversation has changed.
+    """
+    count, versions = (await db.execute(
+        select(func.count(ChatSession.id), func.coalesce(func.sum(ChatSession.version), 0))
+    )).one()
+    cached = not_modified(request, response, history_etag("conversations", count, versions, before, limit))
+    if cached:
+        return cached
+
+    stmt = (
+        select(ChatSession)
+        .order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        cursor = await db.get(ChatSession, before)
+        if cursor is None:
+            raise HTTPException(status_code=400, detail="Unknown pagination cursor")
+        stmt = stmt.where(
+            tuple_(ChatSession.updated_at, ChatSession.id) < tuple_(cursor.updated_at, cursor.id)
+        )
+    return (await db.scalars(stmt)).all()
 
 @router.get("/chats/{chatId}/messages", response_model=List[ChatHistory])
-def get_chat_messages(chatId: str, db: Session = Depends(get_db)):
-    messages = db.query(ChatMessage).filter(ChatMessage.session_id == chatId).all()
-    return messages
+async def get_chat_messages(
+    chatId: str,
+    request: Request,
+    response: HTTPResponse,
+    before: Optional[int] = Query(None, description="Id of the oldest message of the previous page"),
+    since: Optional[int] = Query(None, description="Id of the newest message the client already has"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    The latest `limit` messages older than `before`, or with `since`, the first
+    `limit` messages newer than it; returned in chronological order.
+    Answers 304 to a matching If-None-Match while the chat has not changed.
+    """
+    if before is not None and since is not None:
+        raise HTTPException(status_code=400, detail="Use either before or since, not both")
+    version = await db.scalar(select(ChatSession.version).where(ChatSession.id == chatId))
+    if version is not None:
+        cached = not_modified(request, response, history_etag("messages", chatId, version, before, since, limit))
+        if cached:
+            return cached
+
+    stmt = select(ChatMessage).where(ChatMessage.session_id == chatId)
+    if since is not None:
+        stmt = stmt.where(ChatMessage.id > since).order_by(ChatMessage.id).limit(limit)
+        return (await db.scalars(stmt)).all()
+
+    stmt = stmt.order_by(ChatMessage.id.desc()).limit(limit)
+    if before is not None:
+        stmt = stmt.where(ChatMessage.id < before)
+    messages = (await db.scalars(stmt)).all()
+    return messages[::-1]
 
 @router.post('/chats')
-async def create_new_chat(db: Session = Depends(get_db)):
+async def create_new_chat(db: AsyncSession = Depends(get_db)):
     chat_id = str(uuid4())[:8]
     timestamp_cur = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Format the timestamp
     new_session = ChatSession(id=chat_id, chat_name=timestamp_cur)  # Default name
     db.add(new_session)
-    db.commit()
+    await db.commit()
     return {'id': chat_id}
 
 @router.post("/chats/{chatId}/query", response_model=Response)
-async def process_query(chatId: str, query: UserQuery, db: Session = Depends(get_db), rag_system = Depends(get_rag_system)):
+async def process_query(chatId: str, query: UserQuery, rag_system = Depends(get_rag_system)):
     try:
-        logger.info(f"Processing query: {query.text}")
-        result = rag_system.process_query(query.text)
+        log_payload(logger, "Processing query: %s", query.text)
+        # The pipeline is synchronous; run it off the event loop, which serves the history
+        # endpoints and the write-behind writer meanwhile
+        result = await run_in_threadpool(rag_system.process_query, query.text, chatId, deadline=REQUEST_DEADLINE)
         
-        # Save the message to the database
-        new_message = ChatMessage(session_id=chatId, role='user', content=query.text)
-        db.add(new_message)
-        db.commit()
+        # Persist the turn; depending on HISTORY_DURABILITY this is queued for the write-behind writer
+        await ChatHistoryWriter.get_instance().save_turn(chatId, query.text, result['answer'])
 
-        # Save the response to the database
-        response_message = ChatMessage(session_id=chatId, role='assistant', content=result['answer'])
-        db.add(response_message)
-        db.commit()
-
-        return Response(answer=result['answer'])
+        return Response(answer=result['answer'], degradations=result['degradations'])
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -84,11 +182,11 @@ async def process_query(chatId: str, query: UserQuery, db: Session = Depends(get
 @router.post("/query", response_model=Response)
 async def process_query(query: UserQuery, rag_system = Depends(get_rag_system)):
     try:
-        logger.info(f"Processing query: {query.text}")
-        print(query.text)
-        result = rag_system.process_query(query.text)
+        log_payload(logger, "Processing query: %s", query.text)
+        result = await run_in_threadpool(rag_system.process_query, query.text, deadline=REQUEST_DEADLINE)
         return Response(
             answer=result['answer'],
+            degradations=result['degradations'],
         )
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
@@ -106,4 +204,51 @@ async def process_query(query: UserQuery, rag_system = Depends(get_rag_system)):
 #         )
 #     except Exception as e:
 #         logger.error(f"Error processing evaluation query: {str(e)}")
-#         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+#         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/admin/usage/tiers", dependencies=[Depends(require_admin)])
+async def get_tier_usage():
+    """LLM calls, latency and tokens per pipeline tier since startup."""
+    return tier_usage.report()
+
+@router.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+async def get_profile(name: str):
+    """A profile written for a profiled request (its name is in the X-Profile response header)."""
+    path = os.path.join(PROFILE_DIR, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=os.path.basename(path))
+
+@router.post("/admin/index/rebuild", status_code=202, dependencies=[Depends(require_admin)])
+async def rebuild_index():
+    """Re-ingest the corpus into a new index version in the background, then swap it in."""
+    try:
+        return IndexRebuilder.get_instance().start()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/admin/index/rebuild", dependencies=[Depends(require_admin)])
+async def get_index_rebuild():
+    """State of the last index rebuild."""
+    return IndexRebuilder.get_instance().status()
+
+@router.post("/documents", response_model=IngestJob, status_code=202, dependencies=[Depends(require_admin)])
+async def ingest_documents(records: List[ThesisRecord]):
+    """Queue theses for ingestion; they are searchable once the returned job has completed."""
+    if not records:
+        raise HTTPException(status_code=400, detail="No theses to ingest")
+    if len(records) > INGEST_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {INGEST_MAX_RECORDS} theses per job")
+    return IngestWorker.get_instance().submit([record.model_dump() for record in records])
+
+@router.get("/documents/jobs", response_model=List[IngestJob], dependencies=[Depends(require_admin)])
+async def get_ingest_jobs(limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE)):
+    """The most recently submitted ingestion jobs."""
+    return IngestWorker.get_instance().queue.recent(limit)
+
+@router.get("/documents/jobs/{jobId}", response_model=IngestJob, dependencies=[Depends(require_admin)])
+async def get_ingest_job(jobId: str):
+    job = IngestWorker.get_instance().queue.get(jobId)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
@@ -15,13 +15,30 @@ $ python -m src.app
 """
 
 import logging
-from fastapi import FastAPI
+import os
+import time
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from .services.system_manager import SystemManager
-from .api.routes import router
+from .services.history_writer import ChatHistoryWriter
+from .services.ingestion import IngestWorker
+from .api.routes import is_admin_token, router
+from .config.settings import GZIP_MIN_SIZE
+from .utils.logging_config import configure_logging
+from .utils.metrics import REQUEST_LATENCY
+from .utils.profiling import reset_profiling, sampled, set_profiling
+from .utils.tracing import (
+    new_request_id,
+    reset_debug_payloads,
+    reset_request_id,
+    set_debug_payloads,
+    set_request_id,
+)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Set up logging (every line carries the id of the request that produced it)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -34,15 +51,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend read the ETags of the history endpoints
+    expose_headers=["ETag"],
 )
 
+# Compress large responses (long chat histories) for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Bind a request id to the request context and record the request latency."""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = set_request_id(request_id)
+    admin = is_admin_token(request.headers.get("X-Admin-Token"))
+    # Full prompts/answers/documents are only logged for admin requests that ask for them
+    debug_token = set_debug_payloads(request.headers.get("X-Debug-Payloads") == "1" and admin)
+    # The pipeline is profiled on an admin's request, or for a sampled fraction of requests
+    profile_requested = "1" in (request.headers.get("X-Profile"), request.query_params.get("profile"))
+    profiles = None
+    if (profile_requested and admin) or sampled():
+        profiles = []
+    profile_token = set_profiling(profiles)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        if profiles:
+            response.headers["X-Profile"] = ", ".join(os.path.basename(path) for path in profiles)
+        return response
+    finally:
+        # Label by route template rather than raw path to keep the label set bounded
+        route = request.scope.get("route")
+        REQUEST_LATENCY.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        ).observe(time.perf_counter() - start)
+        reset_profiling(profile_token)
+        reset_debug_payloads(debug_token)
+        reset_request_id(token)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting up application...")
     # Initialize the RAG system through the manager
     SystemManager.initialize()
+    await ChatHistoryWriter.get_instance().start()
+    IngestWorker.get_instance().start()
     logger.info("Application startup complete")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Make sure queued chat turns reach the database before the process exits
+    await ChatHistoryWriter.get_instance().stop()
+    # An unfinished ingestion job is resumed from its last batch on the next start
+    IngestWorker.get_instance().stop()
+
 # Include API routes
 app.include_router(router, prefix="/api/v1")
 
@@ -23,36 +23,62 @@ Return False if it did not mention"""
 
 
 
+# Memory prompts
+MEMORY_SUMMARY_TEMPLATE = """Update the running summary of a conversation between a user and a climate research assistant.
+Keep the topics, questions, key findings and cited sources that later questions may refer to.
+Answer with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages to fold into the summary:
+{messages}
+"""
+
+
+# Digest prompts
+DIGEST_TEMPLATE = """Condense this climate research thesis abstract into a digest.
+Answer with a JSON object with the keys:
+ "key_findings": list of at most 4 short key findings
+ "methods": one sentence on the methods and data used
+ "region": the region or country studied, or "" if none
+
+Title: {title}
+Year: {year}
+Abstract:
+{abstract}
+"""
+
+
 # RAG Fusion prompts
-RAG_FUSION_QUERY_TEMPLATE = """Generate 4 progressive search queries for {question}:
-. Basic concept/overview
-. Key components/factors
-. Detailed analysis/process
-. Advanced implications/applications
-Response (4 queries): """
+RAG_FUSION_QUERY_TEMPLATE = """Generate exactly {num_queries} progressive search queries for {question}, one per line, without numbering.
+Start from the basic concept and move towards its key factors, the detailed process, and its implications, as far as {num_queries} queries allow.
+Response ({num_queries} queries): """
 
 
 # RAG prompts
+# The reference list is rendered from the documents' metadata (src/utils/citations.py),
+# so the model only writes the numbered citation markers
 RAG_TEMPLATE = """Answer the last message using only provided context. 
-Context:
+Context (numbered sources):
 {context}
 Chat History:
 {question}
 Requirements:
- Use numbered citations [1]
- Include references list at the end in APA REFERENCE STYLE, attach a clickable link to the source in the reference list.
+ Cite sources inline by their number, e.g. [1] or [2][3]
+ Do not write a reference list, it is added automatically
  Format in markdown
  Focus on relevant information only"""
 
 # RAG prompts
 EVALUATE_TEMPLATE = """Answer the last message using only provided context. 
-Context:
+Context (numbered sources):
 {context}
 Chat History:
 {question}
 Requirements:
- Use numbered citations [1]
- Include references in APA reference style, attach a clickable link to the source link, and return the 1-3 sentences of groundtruth of the references,Example: [1] Author. (Year). _Source Title._ [https://www.example.com](https://www.example.com) \n Groundtruth:""
+ Cite sources inline by their number, e.g. [1] or [2][3]
+ Do not write a reference list or groundtruth, they are added automatically
  Format in markdown
  Focus on relevant information only"""
 
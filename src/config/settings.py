@@ -6,17 +6,230 @@ load_dotenv()
 # API Keys
 RED_PILL_API_KEY = os.getenv("RED_PILL_API_KEY")
 
+# Admin endpoints require this token in the X-Admin-Token header (disabled when unset)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Upstream LLM API Settings
+REDPILL_API_URL = "https://api.red-pill.ai/v1/chat/completions"
+# Timeouts (seconds) for establishing the connection and for waiting on the response
+LLM_CONNECT_TIMEOUT = 5
+LLM_READ_TIMEOUT = 60
+# Retries of timeouts, 429s and 5xx responses, with jittered exponential backoff (seconds)
+# A Retry-After header from the provider is honored up to LLM_BACKOFF_MAX
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE = 0.5
+LLM_BACKOFF_MAX = 8
+# Hedged requests: when a call takes longer than the observed p95 latency (but at least
+# LLM_HEDGE_MIN_DELAY seconds), an identical second request is sent and the first answer wins
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false") == "true"
+LLM_HEDGE_MIN_DELAY = 1.0
+LLM_HEDGE_MIN_SAMPLES = 20
+# Identical LLM/retrieval requests that are in flight at the same time are sent only once
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true") == "true"
+# Circuit breaker: fail fast for LLM_CIRCUIT_RESET_TIMEOUT seconds after this many consecutive failed
+# calls (a call counts once, after its retries are used up)
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5
+LLM_CIRCUIT_RESET_TIMEOUT = 30
+
+# Routing Settings
+# Speculative retrieval: a plain vector search (no LLM call) of the stores of these routes
+# ("abstract_store", "content_store") runs concurrently with the router LLM call; the chosen
+# route reuses it if it searches for the same question (see src/services/speculation.py)
+SPECULATIVE_ROUTES = [route.strip() for route in os.getenv("SPECULATIVE_ROUTES", "").split(",") if route.strip()]
+
+# Request Deadline Settings
+# Time budget (seconds) of a query, from the API route to the answer (0 disables the deadline)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "30"))
+# Degradations, in the order they are taken: each applies when less than this many seconds
+# of the budget remain as the stage it affects starts (see utils/deadline.py)
+DEGRADATION_THRESHOLDS = {
+    "single_query": 20,
+    "lower_k": 15,
+    "skip_compression": 12,
+    "skip_web_search": 10,
+}
+# Documents passed to generation under the "lower_k" degradation
+DEGRADED_K = 2
+
 # Model Settings
 EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
 LLM_MODEL = "gpt-4o"
-CHUNK_SIZE = 1500
-CHUNK_OVERLAP = 100
+# Model and temperature of each pipeline stage: fast, cheap models handle the structural
+# steps (routing, self-query construction, fusion and web search questions, memory
+# summaries) and LLM_MODEL only writes the final answers
+STAGE_MODELS = {
+    "router": {"model": "gpt-4o-mini", "temperature": 0},
+    "self_query": {"model": "gpt-4o-mini", "temperature": 0},
+    "fusion": {"model": "gpt-4o-mini", "temperature": 0.5},
+    "web_search": {"model": "gpt-4o-mini", "temperature": 0.5},
+    "answer": {"model": LLM_MODEL, "temperature": 0.5},
+    "summary": {"model": "gpt-4o-mini", "temperature": 0},
+    "digest": {"model": "gpt-4o-mini", "temperature": 0},
+}
+# Chunking of full texts (see src/services/chunking.py): "character", "token" or "section"
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "character")
+# Chunk size and overlap in characters ("character" and "section" strategies)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
+# Chunk size and overlap in tokens of EMBEDDING_MODEL ("token" strategy; the model reads at most 384 tokens)
+CHUNK_TOKEN_SIZE = int(os.getenv("CHUNK_TOKEN_SIZE", "350"))
+CHUNK_TOKEN_OVERLAP = int(os.getenv("CHUNK_TOKEN_OVERLAP", "30"))
+# Worker processes used to split corpora of at least CHUNK_PARALLEL_MIN_DOCS documents (None = all CPUs)
+CHUNK_WORKERS = None
+CHUNK_PARALLEL_MIN_DOCS = 200
+
+# Adaptive RAG fusion for content store queries: "adaptive" first probes the store with the
+# question alone and only generates fusion sub-queries when the probe is not confident,
+# "always" runs fusion with FUSION_MAX_QUERIES sub-queries for every query
+FUSION_MODE = os.getenv("FUSION_MODE", "adaptive")
+# The probe is confident when its best cosine similarity (among FUSION_PROBE_K results) is at
+# least FUSION_MIN_TOP_SCORE and leads the FUSION_PROBE_K-th result by at least FUSION_MIN_SPREAD
+FUSION_PROBE_K = 5
+FUSION_MIN_TOP_SCORE = 0.6
+FUSION_MIN_SPREAD = 0.05
+# Sub-queries generated when fusion runs: FUSION_MIN_QUERIES just below the score threshold,
+# rising to FUSION_MAX_QUERIES at half of it
+FUSION_MIN_QUERIES = 2
+FUSION_MAX_QUERIES = 4
+
+# Extractive compression: before generation, each retrieved chunk is cut down to the sentences
+# most similar to the question (scored with EMBEDDING_MODEL), keeping this fraction of its
+# sentences but never fewer than COMPRESSION_MIN_SENTENCES
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true") == "true"
+COMPRESSION_KEEP_RATIO = 0.4
+COMPRESSION_MIN_SENTENCES = 2
+
+# Memory budget: the number of tokens of conversation history passed to the RAG chain
+# Once the history grows past the budget, the oldest messages are folded into a running
+# summary until the recent messages take at most half of the budget, so the prompt stays
+# bounded however long the conversation runs (this includes user messages and AI replies)
+MEMORY_TOKEN_BUDGET = 2000
+# Maximum length of the running summary of older turns, in tokens
+MEMORY_SUMMARY_MAX_TOKENS = 300
+# Conversation memory is checkpointed per chat in this SQLite file, so it survives restarts
+# and is shared by all server workers
+MEMORY_CHECKPOINT_DB_PATH = os.getenv("MEMORY_CHECKPOINT_DB_PATH", "checkpoints.db")
+# Number of conversations whose latest checkpoint is also kept deserialized in each process
+MEMORY_CHECKPOINT_CACHE_SIZE = 256
+# Conversations idle for longer than this (seconds) are pruned, checked at most every
+# MEMORY_CHECKPOINT_PRUNE_INTERVAL seconds; a pruned conversation that is resumed is
+# rebuilt from its stored chat messages
+MEMORY_CHECKPOINT_RETENTION = 7 * 24 * 3600
+MEMORY_CHECKPOINT_PRUNE_INTERVAL = 3600
 
-# Memory limit: the number of the last k messages to remember
-# This is used to limit the number of messages to remember in the memory
-# This includes the user messages and the replies from the AI
-MEMORY_LIMIT = 5
+# Quantized vector search: "none", "int8" (4x smaller) or "binary" (32x smaller)
+# The abstract and content collections are then searched through quantized codes held in
+# memory, and the shortlist of k * QUANTIZED_RESCORE_FACTOR candidates is rescored with the
+# full-precision vectors, which stay on disk (memory-mapped)
+QUANTIZATION = os.getenv("QUANTIZATION", "none")
+QUANTIZED_RESCORE_FACTOR = {"int8": 4, "binary": 10}
+# Index rows matching each of the most recent metadata filters (e.g. from self-query) are
+# cached per collection, so that Chroma evaluates a filter once per index change, not per query
+QUANTIZED_FILTER_CACHE_SIZE = int(os.getenv("QUANTIZED_FILTER_CACHE_SIZE", "128"))
+
+# Retrieval cache: identical vector searches (same collection, query, metadata filter and k)
+# are answered from an in-process LRU of ranked chunk ids (roughly 2 KB per entry) until
+# ingestion bumps the index generation stored in PERSIST_DIRECTORY
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true") == "true"
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "4096"))
 
 # Data Settings
 DATA_PATH = './src/data/data.json'
-PERSIST_DIRECTORY = "./src/chroma_db" 
\ No newline at end of file
+PERSIST_DIRECTORY = "./src/chroma_db" 
+# Per-thesis digests: built at ingestion (or with `python -m src.services.digest_builder`)
+# into a third collection; when enabled, Abstract_Store queries are answered from the digests
+DIGEST_ENABLED = os.getenv("DIGEST_ENABLED", "false") == "true"
+# Parallel digest LLM calls, and digests stored per write
+DIGEST_WORKERS = 8
+DIGEST_BATCH_SIZE = 50
+# Index rebuilds (POST /api/v1/admin/index/rebuild) ingest DATA_PATH into a new version under
+# PERSIST_DIRECTORY/versions while queries keep being served from the current one
+# A swapped-out version is closed once the requests using it have finished, waiting at most this
+# many seconds, and its directory removed once no server worker serves from it anymore (other
+# workers switch on their next request; versions left by idle ones are removed on a later start)
+INDEX_DRAIN_TIMEOUT = 180
+# Nice value of the rebuild thread, so that embedding the corpus yields the CPU to queries
+INDEX_REBUILD_NICE = 10
+
+# Document ingestion (POST /api/v1/documents): submitted theses are queued as jobs in this
+# SQLite file and added to the stores by a background worker in one server process (the leader)
+INGEST_QUEUE_DB_PATH = os.getenv("INGEST_QUEUE_DB_PATH", "ingest_jobs.db")
+# Maximum theses per submitted job
+INGEST_MAX_RECORDS = 500
+# Theses chunked, embedded and stored per batch; a job's progress is saved after each batch
+INGEST_BATCH_SIZE = 8
+# To leave the CPU to queries, the worker runs at this nice value and starts a batch only when
+# no query is in flight, or after waiting INGEST_MAX_DEFER seconds for one
+INGEST_NICE = 10
+INGEST_MAX_DEFER = 5
+# How often (seconds) an idle worker checks for jobs submitted to other processes
+INGEST_POLL_INTERVAL = 2
+# A running job whose worker saved no progress for this long (seconds) is taken over by another
+INGEST_STALE_AFTER = 600
+# A pause of ingestion (held during the final step of an index rebuild) lapses after this many
+# seconds unless its holder renews it, so a process dying mid-rebuild does not stop ingestion
+INGEST_PAUSE_TTL = 30
+
+# Web Research Settings
+# SQLite file caching Google search results and extracted page text
+WEB_CACHE_PATH = "./src/cache/web_cache.db"
+# How long (seconds) search results and extracted page text are reused
+WEB_SEARCH_CACHE_TTL = 24 * 3600
+WEB_PAGE_CACHE_TTL = 7 * 24 * 3600
+# Number of pages fetched concurrently, and per-page size (bytes) and time (seconds) limits
+WEB_FETCH_CONCURRENCY = 8
+WEB_PAGE_MAX_BYTES = 2_000_000
+WEB_PAGE_TIMEOUT = 10
+# Maximum page chunks embedded into the per-request scratch index
+WEB_SCRATCH_MAX_CHUNKS = 200
+
+# Chat History Settings
+# SQLite file holding chat sessions and messages
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "chatbot.db")
+# Default and maximum page sizes of the paginated history endpoints
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 500
+# Responses of at least this many bytes are gzip-compressed for clients that accept it
+GZIP_MIN_SIZE = 1000
+# "sync": a chat turn is committed before the query response returns
+# "async": turns are queued and written in batches by a background task (flushed on shutdown)
+HISTORY_DURABILITY = os.getenv("HISTORY_DURABILITY", "async")
+# Maximum number of queued turns before requests wait for the writer to catch up
+HISTORY_QUEUE_SIZE = 1000
+# Maximum number of turns written in one transaction, and how long (seconds)
+# the writer waits for more turns before committing a batch
+HISTORY_BATCH_SIZE = 100
+HISTORY_FLUSH_INTERVAL = 0.05
+# A batch that fails to commit is retried this many times, waiting HISTORY_RETRY_BACKOFF
+# seconds (doubled on each attempt), then written turn by turn so only a bad turn is dropped
+HISTORY_WRITE_RETRIES = 3
+HISTORY_RETRY_BACKOFF = 0.2
+
+# Logging Settings
+# When true, log records are handed to a background thread that formats and writes them,
+# so request handlers never block on stdout
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true") == "true"
+# Large payloads (prompts, answers, retrieved documents) are truncated to this many characters
+LOG_PAYLOAD_MAX_CHARS = 300
+# Fraction of payload log lines that are emitted at all (1.0 = all, 0.0 = none)
+# Requests sent with the `X-Debug-Payloads: 1` header and a valid X-Admin-Token always log full,
+# untruncated payloads
+LOG_PAYLOAD_SAMPLE_RATE = 1.0
+
+# Profiling (see src/utils/profiling.py): admins profile a query by sending `X-Profile: 1` (or
+# `?profile=1`) with their X-Admin-Token, and this fraction of all requests is profiled anyway
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Directory the profiles are written to, named after the request id (speedscope files when
+# pyinstrument is installed, `pip install rag_summarizer[profiling]`, cProfile stats otherwise)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# Sampling interval (seconds) of pyinstrument
+PROFILE_INTERVAL = 0.001
+
+# Server Settings (`python -m src.serve`)
+# Address the API listens on
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# Number of worker processes; the embedding model is loaded once in the master and shared with them
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "2"))
+# A worker silent for this many seconds is restarted (covers the slowest LLM-backed request)
+SERVER_TIMEOUT = 180
@@ -42,6 +42,10 @@ from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_core.utils.pydantic import is_basemodel_subclass
 from pydantic import BaseModel, Field
 
+from ..config.settings import REDPILL_API_URL
+from ..utils.logging_config import log_payload
+from .redpill_client import get_redpill_client
+
 # Initialize logging
 logging.basicConfig(
     level=logging.INFO,
@@ -129,7 +133,6 @@ class RedPillChatModel(BaseChatModel):
         """Generate a response based on the messages provided."""
         formatted_messages = _convert_messages_to_redpill_messages(messages)
         
-        url = "https://api.red-pill.ai/v1/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -144,14 +147,10 @@ class RedPillChatModel(BaseChatModel):
         if "tools" in kwargs:
             payload["tools"] = kwargs["tools"] if isinstance(kwargs["tools"], list) else [kwargs["tools"]]
         
-        _logger.info(f"Sending request to Red Pill AI: {payload}")
-        
-        response = requests.post(url, headers=headers, json=payload)
+        log_payload(_logger, "Sending request to Red Pill AI: %s", payload)
         
-        if response.status_code != 200:
-            raise ValueError(f"Error from API: {response.status_code} - {response.text}")
-        
-        response_data = response.json()
+        # Timeouts, retries, hedging and circuit breaking are handled by the shared client
+        response_data = get_redpill_client().post(REDPILL_API_URL, headers, payload)
         
         # Ensure we have a valid content string
         content = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
@@ -185,7 +184,14 @@ class RedPillChatModel(BaseChatModel):
             tool_calls=tool_calls if tool_calls else None  # Only include if we have tool calls
         )
         
-        return ChatResult(generations=[ChatGeneration(message=ai_message)])
+        # Token usage and model name are picked up by the tracing callback handler
+        return ChatResult(
+            generations=[ChatGeneration(message=ai_message)],
+            llm_output={
+                "token_usage": response_data.get("usage", {}),
+                "model_name": self.model,
+            },
+        )
 
     def bind_tools(
         self,
@@ -3,12 +3,18 @@ RedPillLLM.py
 
 Defines a RedPillLLM class for interacting with the RedPill API.
 """
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
-import json
+import logging
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
 from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, LLMResult
+
+from ..config.settings import REDPILL_API_URL
+from ..utils.logging_config import log_payload
+from .redpill_client import get_redpill_client
+
+_logger = logging.getLogger(__name__)
 
 
 class RedPillLLM(LLM):
@@ -28,9 +34,37 @@ class RedPillLLM(LLM):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> str:
+        generated_text, _ = self._request(prompt)
+        return generated_text
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        """
+        Same as the default implementation, but reports token usage and the
+        model name in `llm_output` so that callback handlers can record them.
+        """
+        generations = []
+        token_usage: Dict[str, int] = {}
+        for prompt in prompts:
+            generated_text, usage = self._request(prompt)
+            generations.append([Generation(text=generated_text)])
+            for key, value in usage.items():
+                if isinstance(value, int):
+                    token_usage[key] = token_usage.get(key, 0) + value
+        return LLMResult(
+            generations=generations,
+            llm_output={"token_usage": token_usage, "model_name": self.model},
+        )
+
+    def _request(self, prompt: str) -> Tuple[str, Dict[str, Any]]:
+        """Send a single prompt to the RedPill API. Returns the text and the usage block."""
 
         # Prepare the API request
-        url = "https://api.red-pill.ai/v1/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -41,22 +75,17 @@ class RedPillLLM(LLM):
             "temperature": self.temperature
         }
 
-        print("\n\nSending request to RedPill API in LLM:", payload)
+        log_payload(_logger, "Sending request to RedPill API in LLM: %s", payload)
+
+        # Send the request (timeouts, retries, hedging and circuit breaking are handled by the shared client)
+        response_data = get_redpill_client().post(REDPILL_API_URL, headers, payload)
 
-        # Send the request
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        if response.status_code != 200:
-            raise ValueError(
-                f"Error in API call: {response.status_code}, {response.text}"
-            )
-        
         # Parse the response
-        response_data = response.json()
         generated_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
 
-        print("\n\nReceived response from RedPill API in LLM:", generated_text)
+        log_payload(_logger, "Received response from RedPill API in LLM: %s", generated_text)
 
-        return generated_text
+        return generated_text, response_data.get("usage") or {}
 
     def _llm_type(self) -> str:
         """
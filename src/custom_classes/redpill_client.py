@@ -0,0 +1,300 @@
+"""
+redpill_client.py
+
+HTTP client shared by RedPillChatModel and RedPillLLM. Adds what a multi-call
+RAG pipeline needs from its upstream provider:
+
+- connect/read timeouts on every request
+- retries with jittered exponential backoff that honor `Retry-After`, and
+  are not attempted once they would run past the request's deadline
+- optional hedged requests: if a call is slower than the observed p95, a
+  second identical request is sent and the first response to arrive wins
+- a circuit breaker that fails fast while the provider is degraded
+- single-flight coalescing of identical requests that are in flight together
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import requests
+
+from ..config.settings import (
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_RESET_TIMEOUT,
+    SINGLE_FLIGHT_ENABLED,
+)
+from ..utils.deadline import remaining
+from ..utils.metrics import LLM_UPSTREAM_EVENTS
+from ..utils.singleflight import SingleFlight, canonical_key
+
+_logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: timeouts, rate limits and server-side failures
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(ValueError):
+    """The upstream LLM API failed. Subclasses ValueError, which callers used to catch."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open; the request was not sent."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = LLM_CIRCUIT_RESET_TIMEOUT) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._state() != "open":
+                    _logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures")
+                    LLM_UPSTREAM_EVENTS.labels(event="circuit_opened").inc()
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, used to pick the hedging delay."""
+
+    def __init__(self, size: int = 200) -> None:
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """`Retry-After` is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RedPillClient:
+    """Resilient JSON POST client for the RedPill chat completions API."""
+
+    def __init__(
+        self,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        read_timeout: float = LLM_READ_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        single_flight: bool = SINGLE_FLIGHT_ENABLED,
+    ) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.latencies = LatencyTracker()
+        self.single_flight = SingleFlight("llm") if single_flight else None
+        self._session = requests.Session()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+    def post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST `payload` and return the decoded JSON body, retrying transient failures."""
+        if self.single_flight is None:
+            return self._post(url, headers, payload)
+        key = canonical_key({"url": url, "auth": headers.get("Authorization"), "payload": payload})
+        return self.single_flight.do(key, lambda: self._post(url, headers, payload))
+
+    def _post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.circuit_breaker.allow():
+            LLM_UPSTREAM_EVENTS.labels(event="circuit_rejected").inc()
+            raise CircuitOpenError("Upstream LLM API is unavailable (circuit open)")
+
+        # The breaker counts failed calls, not attempts: a failure is recorded once the retries are used up
+        last_error: Optional[UpstreamError] = None
+        for attempt in range(self.max_retries + 1):
+
+            retry_after = None
+            try:
+                response = self._send(url, headers, payload)
+            except requests.RequestException as e:
+                last_error = UpstreamError(f"Error in API call: {type(e).__name__}: {e}")
+            except BaseException:
+                # Any other error still has to end a half-open trial, or the circuit never closes
+                self.circuit_breaker.record_failure()
+                raise
+            else:
+                if response.status_code == 200:
+                    self.circuit_breaker.record_success()
+                    return response.json()
+                last_error = UpstreamError(
+                    f"Error from API: {response.status_code} - {response.text}",
+                    status_code=response.status_code,
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # The request itself is bad; the provider is fine
+                    self.circuit_breaker.record_success()
+                    raise last_error
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+
+            if attempt == self.max_retries:
+                break
+            if self.circuit_breaker.state == "open":
+                # Other calls have found the provider down meanwhile; stop retrying
+                break
+            delay = self._backoff(attempt, retry_after)
+            left = remaining()
+            if left is not None and left < delay:
+                # The request's deadline would pass before the retry is even sent
+                LLM_UPSTREAM_EVENTS.labels(event="deadline_exceeded").inc()
+                break
+            _logger.warning(f"{last_error} - retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+            LLM_UPSTREAM_EVENTS.labels(event="retry").inc()
+            time.sleep(delay)
+
+        self.circuit_breaker.record_failure()
+        raise last_error
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter keeps many clients from retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _request(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> requests.Response:
+        start = time.perf_counter()
+        response = self._session.post(url, headers=headers, json=payload, timeout=self.timeout)
+        if response.status_code == 200:
+            self.latencies.add(time.perf_counter() - start)
+        return response
+
+    def hedge_delay(self) -> Optional[float]:
+        """Delay before a hedged request is sent, or None if hedging is off or still warming up."""
+        if not self.hedge_enabled or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self.latencies.percentile(0.95))
+
+    def _send(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> requests.Response:
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._request(url, headers, payload)
+
+        pending = {self._hedge_pool.submit(self._request, url, headers, payload)}
+        done, pending = wait(pending, timeout=delay)
+        if not done:
+            LLM_UPSTREAM_EVENTS.labels(event="hedge").inc()
+            pending.add(self._hedge_pool.submit(self._request, url, headers, payload))
+
+        # Return the first successful response; fall back to whatever finished last
+        error: Optional[BaseException] = None
+        result: Optional[requests.Response] = None
+        while True:
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                result = future.result()
+                if result.status_code == 200:
+                    return result
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if result is not None:
+            return result
+        raise error
+
+
+_default_client: Optional[RedPillClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_redpill_client() -> RedPillClient:
+    """Process-wide client, so that all models share one circuit breaker and latency history."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = RedPillClient()
+        return _default_client
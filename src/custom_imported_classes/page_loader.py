@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import html2text
+import requests
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+from urllib3.exceptions import HTTPError, ReadTimeoutError
+
+from ..config.settings import (
+    WEB_CACHE_PATH,
+    WEB_PAGE_CACHE_TTL,
+    WEB_FETCH_CONCURRENCY,
+    WEB_PAGE_MAX_BYTES,
+    WEB_PAGE_TIMEOUT,
+)
+from ..utils.disk_cache import TTLDiskCache
+
+logger = logging.getLogger(__name__)
+
+_page_cache: Optional[TTLDiskCache] = None
+
+def get_page_cache() -> TTLDiskCache:
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = TTLDiskCache(WEB_CACHE_PATH, "page_text", WEB_PAGE_CACHE_TTL)
+    return _page_cache
+
+
+class ConcurrentPageLoader:
+    """
+    Replacement for AsyncHtmlLoader + Html2TextTransformer.
+
+    Pages are fetched concurrently (at most `max_concurrency` at a time), each
+    limited to `max_bytes` and `timeout` seconds; slow, oversized or non-HTML
+    pages are truncated or skipped rather than holding up the answer. The
+    extracted text is cached per URL.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = WEB_FETCH_CONCURRENCY,
+        max_bytes: int = WEB_PAGE_MAX_BYTES,
+        timeout: float = WEB_PAGE_TIMEOUT,
+        cache: Optional[TTLDiskCache] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.cache = cache if cache is not None else get_page_cache()
+
+    def load(self, urls: List[str]) -> List[Document]:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aload(urls))
+        # Called from code running inside an event loop (e.g. an async route): use a separate thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aload(urls)).result()
+
+    async def aload(self, urls: List[str]) -> List[Document]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        docs = await asyncio.gather(*(self._load_one(url, semaphore) for url in urls))
+        return [doc for doc in docs if doc is not None]
+
+    async def _load_one(self, url: str, semaphore: asyncio.Semaphore) -> Optional[Document]:
+        cached = self.cache.get(url)
+        if cached is not None:
+            return Document(page_content=cached["text"], metadata=cached["metadata"])
+
+        # The slot is held until the fetch thread has returned, which `_fetch` bounds by `timeout`
+        async with semaphore:
+            try:
+                html = await asyncio.to_thread(self._fetch, url)
+            except (requests.Timeout, ReadTimeoutError, TimeoutError):
+                logger.warning(f"Skipping {url}: not loaded within {self.timeout}s")
+                return None
+            except (requests.RequestException, HTTPError, ValueError) as e:
+                logger.warning(f"Skipping {url}: {str(e)}")
+                return None
+
+        text, metadata = await asyncio.to_thread(self._extract, url, html)
+        self.cache.set(url, {"text": text, "metadata": metadata})
+        return Document(page_content=text, metadata=metadata)
+
+    def _fetch(self, url: str) -> str:
+        """
+        Download the page within `timeout` seconds in total. The `requests`
+        timeout only bounds each read, so the deadline is also checked
+        between reads and a slowly trickling download is abandoned; `read1`
+        returns whatever has arrived instead of waiting for a full chunk.
+        """
+        deadline = time.monotonic() + self.timeout
+        with requests.get(url, stream=True, timeout=(min(5, self.timeout), self.timeout)) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "")
+            if content_type and "html" not in content_type and "text" not in content_type:
+                raise ValueError(f"unsupported content type {content_type}")
+
+            body = bytearray()
+            while True:
+                chunk = response.raw.read1(64 * 1024, decode_content=True)
+                if not chunk:
+                    break
+                body.extend(chunk)
+                if len(body) >= self.max_bytes:
+                    logger.info(f"Truncating {url} at {self.max_bytes} bytes")
+                    break
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{url} not loaded within {self.timeout}s")
+            return bytes(body[:self.max_bytes]).decode(response.encoding or "utf-8", errors="replace")
+
+    @staticmethod
+    def _extract(url: str, html: str) -> Tuple[str, dict]:
+        soup = BeautifulSoup(html, "html.parser")
+        title = soup.title.get_text(strip=True) if soup.title else ""
+
+        converter = html2text.HTML2Text()
+        converter.ignore_links = True
+        converter.ignore_images = True
+        return converter.handle(html), {"source": url, "title": title}
@@ -3,24 +3,154 @@ from langchain_community.retrievers.web_research import (
     DEFAULT_LLAMA_SEARCH_PROMPT,
     DEFAULT_SEARCH_PROMPT
 )
+from langchain.retrievers.self_query.base import SelfQueryRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langchain_core.vectorstores import InMemoryVectorStore
 from pydantic import Field
-from typing import Any
+from typing import Any, Dict, List
+import logging
 from langchain.chains import LLMChain
 from langchain.chains.prompt_selector import ConditionalPromptSelector
 from langchain.llms import LlamaCpp
 from .search import FilteredGoogleSearchAPIWrapper
 from .parsers import QuestionListOutputParser
+from .page_loader import ConcurrentPageLoader
+from ..config.settings import SINGLE_FLIGHT_ENABLED, WEB_SCRATCH_MAX_CHUNKS
+from ..services.retrieval_cache import get_retrieval_cache
+from ..services.speculation import speculated_search
+from ..utils.singleflight import SingleFlight, canonical_key
+
+logger = logging.getLogger(__name__)
+
+# Identical retrievals that are in flight at the same time run only once
+_retrieval_flights = SingleFlight("retrieval")
+_web_research_flights = SingleFlight("web_research")
+
+
+def _coalesce(flights: SingleFlight, key: Dict[str, Any], fn):
+    if not SINGLE_FLIGHT_ENABLED:
+        return fn()
+    return flights.do(canonical_key(key), fn)
+
+
+class CustomSelfQueryRetriever(SelfQueryRetriever):
+    """SelfQueryRetriever that coalesces identical concurrent retrievals and caches vector searches"""
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+    ) -> List[Document]:
+        # Covers the self-query LLM call as well as the vector search
+        return _coalesce(
+            _retrieval_flights,
+            {"retriever": id(self), "query": query},
+            lambda: super(CustomSelfQueryRetriever, self)._get_relevant_documents(query, run_manager=run_manager),
+        )
+
+    def _get_docs_with_query(self, query: str, search_kwargs: Dict[str, Any]) -> List[Document]:
+        # Different questions often translate into the same search; share that too
+        return _coalesce(
+            _retrieval_flights,
+            {"store": id(self.vectorstore), "search_type": self.search_type, "query": query, "kwargs": search_kwargs},
+            lambda: self._search(query, search_kwargs),
+        )
+
+    def _search(self, query: str, search_kwargs: Dict[str, Any]) -> List[Document]:
+        if self.search_type == "similarity" and set(search_kwargs) <= {"k"}:
+            # The same search may already have run while the router was deciding
+            speculated = speculated_search(self.vectorstore, query, search_kwargs.get("k", 4))
+            if speculated is not None:
+                return [doc for doc, _ in speculated]
+        cache = get_retrieval_cache()
+        if cache is None or self.search_type != "similarity":
+            return super()._get_docs_with_query(query, search_kwargs)
+        return cache.similarity_search(self.vectorstore, query, search_kwargs)
+
 
 class CustomWebResearchRetriever(BaseWebResearchRetriever):
-    """Custom WebResearchRetriever that uses our FilteredGoogleSearchAPIWrapper"""
+    """
+    Custom WebResearchRetriever that uses our FilteredGoogleSearchAPIWrapper.
+
+    Search results are cached by FilteredGoogleSearchAPIWrapper, the searches
+    for the generated questions run concurrently, and pages are fetched by
+    ConcurrentPageLoader (bounded concurrency, size/time limits, cached text).
+
+    Page chunks are embedded into a scratch in-memory index that is discarded
+    after the request; `vectorstore` only supplies the embedding function and
+    is never written to.
+    """
     
     search: FilteredGoogleSearchAPIWrapper = Field(..., description="Google Search API Wrapper")
+    page_loader: ConcurrentPageLoader = Field(default_factory=ConcurrentPageLoader, description="Loads and extracts web pages")
+    max_scratch_chunks: int = Field(WEB_SCRATCH_MAX_CHUNKS, description="Maximum page chunks embedded per request")
     
     def __init__(self, **kwargs: Any) -> None:
         """Initialize with our custom search wrapper."""
         if not isinstance(kwargs.get('search'), FilteredGoogleSearchAPIWrapper):
             raise ValueError("search must be an instance of FilteredGoogleSearchAPIWrapper")
         super().__init__(**kwargs)
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+    ) -> List[Document]:
+        return _coalesce(
+            _web_research_flights,
+            {"retriever": id(self), "query": query},
+            lambda: self._research(query, run_manager),
+        )
+
+    def _research(self, query: str, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        # Get search questions
+        logger.info("Generating questions for Google Search ...")
+        result = self.llm_chain.invoke({"question": query}, config={"callbacks": run_manager.get_child()})
+        questions = result["text"]
+        logger.info(f"Questions for Google Search: {questions}")
+
+        # Get urls, searching for all questions at once
+        with ContextThreadPoolExecutor(max_workers=max(1, len(questions))) as executor:
+            search_results = list(executor.map(lambda q: self.search_tool(q, self.num_search_results), questions))
+        urls = {res["link"] for results in search_results for res in results if res.get("link")}
+
+        # Load and split the pages into a scratch index that lives for this request only
+        docs = self.page_loader.load(sorted(urls))
+        chunks = self._bounded(self.text_splitter.split_documents(docs))
+        logger.info(f"Indexing {len(chunks)} chunks from {len(docs)} pages")
+        scratch = InMemoryVectorStore(self.vectorstore.embeddings)
+        if chunks:
+            scratch.add_documents(chunks)
+
+        # Search for relevant splits
+        logger.info("Grabbing most relevant splits from urls...")
+        docs = []
+        for question in questions:
+            docs.extend(scratch.similarity_search(question))
+
+        # Get unique docs
+        unique_documents_dict = {
+            (doc.page_content, tuple(sorted(doc.metadata.items()))): doc for doc in docs
+        }
+        return list(unique_documents_dict.values())
+
+    def _bounded(self, chunks: List[Document]) -> List[Document]:
+        """Keep at most `max_scratch_chunks`, taking them round-robin so every page is represented"""
+        if len(chunks) <= self.max_scratch_chunks:
+            return chunks
+        by_source: Dict[str, List[Document]] = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk.metadata.get("source", ""), []).append(chunk)
+        bounded = []
+        for rank in range(max(len(group) for group in by_source.values())):
+            for group in by_source.values():
+                if rank < len(group):
+                    bounded.append(group[rank])
+        return bounded[:self.max_scratch_chunks]
     
     @classmethod
     def from_llm(
@@ -1,6 +1,22 @@
 from pydantic import BaseModel, ConfigDict, model_validator
 from typing import Optional, Dict, List, Any
 from langchain.utils import get_from_dict_or_env
+import re
+from ..config.settings import WEB_CACHE_PATH, WEB_SEARCH_CACHE_TTL
+from ..utils.disk_cache import TTLDiskCache
+from ..utils.singleflight import canonical_key
+
+_search_cache: Optional[TTLDiskCache] = None
+
+def get_search_cache() -> TTLDiskCache:
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = TTLDiskCache(WEB_CACHE_PATH, "search_results", WEB_SEARCH_CACHE_TTL)
+    return _search_cache
+
+def normalize_query(query: str) -> str:
+    """Case, punctuation and spacing differences should not cost another API call."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
 
 class FilteredGoogleSearchAPIWrapper(BaseModel):
     """Wrapper for Google Search API with YouTube filtering."""
@@ -16,6 +32,20 @@ class FilteredGoogleSearchAPIWrapper(BaseModel):
     )
 
     def _google_search_results(self, search_term: str, **kwargs: Any) -> List[dict]:
+        cache = get_search_cache()
+        key = canonical_key({
+            "q": normalize_query(search_term),
+            "cx": self.google_cse_id,
+            "siterestrict": self.siterestrict,
+            "params": kwargs,
+        })
+        items = cache.get(key)
+        if items is None:
+            items = self._google_search_api(search_term, **kwargs)
+            cache.set(key, items)
+        return items
+
+    def _google_search_api(self, search_term: str, **kwargs: Any) -> List[dict]:
         cse = self.search_engine.cse()
         if self.siterestrict:
             cse = cse.siterestrict()
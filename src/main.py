@@ -22,20 +22,22 @@ import logging
 from .config.settings import DATA_PATH, PERSIST_DIRECTORY
 from .services.business_logic import RAGSystem
 from .services.data_processor import preprocess_and_store_data, DataProcessor
+from .services.index_versions import active_persist_directory
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def main():
+    persist_directory = active_persist_directory(PERSIST_DIRECTORY)
     # Check if vector stores already exist
-    if not os.path.exists(PERSIST_DIRECTORY):
+    if not os.path.exists(persist_directory):
         logger.info("Vector stores not found. Processing data...")
-        abstract_store, content_store, stats = preprocess_and_store_data(DATA_PATH, PERSIST_DIRECTORY)
+        abstract_store, content_store, stats = preprocess_and_store_data(DATA_PATH, persist_directory)
         logger.info(f"Vector store statistics: {stats}")
     else:
         logger.info("Loading existing vector stores...")
-        processor = DataProcessor(PERSIST_DIRECTORY)
+        processor = DataProcessor(persist_directory)
         abstract_store, content_store = processor.create_vector_stores()
         stats = processor.get_store_stats()
         logger.info(f"Loaded vector store statistics: {stats}")
@@ -1,16 +1,28 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 
+from ..config.settings import HISTORY_DB_PATH
+
 Base = declarative_base()
 
 class ChatSession(Base):
     __tablename__ = 'chat_sessions'
     id = Column(String, primary_key=True)
     chat_name = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped on every turn so conversations can be listed by recency
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    # Incremented on every change to the session (new turn, rename); the history endpoints' ETags derive from it
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     messages = relationship("ChatMessage", back_populates="session")
 
+    __table_args__ = (
+        Index('ix_chat_sessions_updated_at_id', 'updated_at', 'id'),
+    )
+
 class ChatMessage(Base):
     __tablename__ = 'chat_messages'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -20,7 +32,66 @@ class ChatMessage(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     session = relationship("ChatSession", back_populates="messages")
 
+    # Serves both "messages of a session" and keyset pagination on (session_id, id)
+    __table_args__ = (
+        Index('ix_chat_messages_session_id_id', 'session_id', 'id'),
+    )
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers proceed while a turn is being written; NORMAL sync is durable across app crashes."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+# Schema migrations, applied in order and tracked with SQLite's `user_version`.
+# Each migration must be idempotent: a fresh database is created by `create_all`
+# with the latest schema and then runs every migration.
+def _migration_1_recency_and_indexes(conn):
+    columns = {c['name'] for c in inspect(conn).get_columns('chat_sessions')}
+    for column in ('created_at', 'updated_at'):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE chat_sessions ADD COLUMN {column} DATETIME"))
+    # Backfill from the message timestamps of existing conversations
+    conn.execute(text(
+        "UPDATE chat_sessions SET "
+        "created_at = COALESCE(created_at, (SELECT MIN(timestamp) FROM chat_messages WHERE session_id = chat_sessions.id), CURRENT_TIMESTAMP), "
+        "updated_at = COALESCE(updated_at, (SELECT MAX(timestamp) FROM chat_messages WHERE session_id = chat_sessions.id), CURRENT_TIMESTAMP)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated_at_id ON chat_sessions (updated_at, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_messages_session_id_id ON chat_messages (session_id, id)"))
+
+def _migration_2_session_versions(conn):
+    columns = {c['name'] for c in inspect(conn).get_columns('chat_sessions')}
+    if 'version' not in columns:
+        conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
+MIGRATIONS = [
+    _migration_1_recency_and_indexes,
+    _migration_2_session_versions,
+]
+
+def migrate(engine):
+    """Create missing tables and bring an existing database up to the latest schema."""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            if number > version:
+                migration(conn)
+        conn.execute(text(f"PRAGMA user_version = {len(MIGRATIONS)}"))
+
+
 # Create an SQLite database
-engine = create_engine('sqlite:///chatbot.db')
-Base.metadata.create_all(engine)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) 
\ No newline at end of file
+engine = create_engine(f'sqlite:///{HISTORY_DB_PATH}')
+event.listen(engine, "connect", _set_sqlite_pragmas)
+migrate(engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine for the API routes, so history I/O does not block the event loop
+async_engine = create_async_engine(f'sqlite+aiosqlite:///{HISTORY_DB_PATH}')
+event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
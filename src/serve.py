@@ -0,0 +1,129 @@
+"""
+Multi-worker server for the RAG API
+-----------------------------------
+
+Runs `src.app` under gunicorn with SERVER_WORKERS uvicorn workers. The app and
+the embedding model are loaded once in the master process before the workers
+are forked, so the model weights are shared copy-on-write between workers
+instead of being loaded (and held) once per worker.
+
+On a first start (no vector stores yet) the master builds them before forking,
+in a spawned child process so that no embedding inference runs in the master;
+the workers then only open them. `SystemManager.initialize` also takes the
+index lock, so workers started by other means do not build them concurrently.
+
+What is shared and what is not:
+- the embedding model (`services.embeddings.get_embeddings`) is loaded in the
+  master and inherited by every worker;
+- the quantized index files (QUANTIZATION=int8|binary) are memory-mapped
+  read-only by each worker, so all workers read one copy in the page cache;
+- Chroma clients, the RAG system and the history writer are created per worker
+  on startup, since SQLite connections and background threads must not cross
+  a fork.
+
+`src/tests/measure_worker_rss.py` reports the resident and proportional set
+size of the master and its workers, to check the savings.
+
+Typical usage:
+---------------
+$ SERVER_WORKERS=4 python -m src.serve
+"""
+
+import gc
+import logging
+import multiprocessing
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+from .config.settings import PERSIST_DIRECTORY, SERVER_HOST, SERVER_PORT, SERVER_TIMEOUT, SERVER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+def build_index(persist_directory: str = PERSIST_DIRECTORY) -> None:
+    """Build the vector stores if there are none yet, once, before any worker opens them."""
+    from .services.index_versions import active_persist_directory
+    from .services.system_manager import SystemManager
+
+    if os.path.exists(active_persist_directory(persist_directory)):
+        return
+    # Spawned rather than run here: the build embeds the corpus, and torch's thread pools
+    # (and Chroma's clients) must not be started in the master the workers are forked from
+    process = multiprocessing.get_context("spawn").Process(
+        target=SystemManager.build_index, args=(persist_directory,), name="index-build"
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Building the vector stores failed (exit code {process.exitcode})")
+
+
+def preload() -> None:
+    """Load what the workers share. Runs once, in the master, before forking."""
+    from .services.embeddings import get_embeddings
+
+    build_index()
+    # Only the weights are loaded here; no inference runs in the master, so torch's
+    # thread pools are first started in the workers, after the fork
+    get_embeddings()
+    # Objects that exist now are never freed; keeping them out of the collector stops
+    # it from touching (and so copying) their pages in every worker
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded shared state, forking workers")
+
+
+def post_fork(server, worker) -> None:
+    """Per-worker state that must not be inherited from the master."""
+    from .models.history_models import async_engine, engine
+    from .utils.logging_config import configure_logging
+
+    # The master's log listener thread does not exist in the child
+    configure_logging()
+    # Pooled connections opened by the schema migration belong to the master
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    # Split the cores between workers rather than letting each one use all of them
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(max(1, (os.cpu_count() or 1) // SERVER_WORKERS))
+    logger.info(f"Worker {worker.pid} started")
+
+
+class RAGServer(BaseApplication):
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key.lower(), value)
+
+    def load(self):
+        from .app import app
+
+        preload()
+        return app
+
+
+def server_options() -> dict:
+    """Gunicorn settings for the configured address and number of workers."""
+    return {
+        "bind": f"{SERVER_HOST}:{SERVER_PORT}",
+        "workers": SERVER_WORKERS,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "timeout": SERVER_TIMEOUT,
+        # Load the app in the master so the workers inherit it
+        "preload_app": True,
+        "post_fork": post_fork,
+    }
+
+
+def main() -> None:
+    RAGServer(server_options()).run()
+
+
+if __name__ == "__main__":
+    main()
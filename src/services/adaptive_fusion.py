@@ -0,0 +1,117 @@
+"""
+Adaptive RAG fusion for content store queries.
+
+Before any query generation, the question is probed with a plain similarity
+search of the content store (no LLM call). If the best match is close enough
+and stands out from the rest, the question is answered from a single
+retrieval; otherwise fusion runs with a number of generated sub-queries that
+grows as the probe's best score falls.
+
+Skipped fusions and the latency they saved (against a running average of the
+fusion path) are reported in the `climarag_fusion_*` metrics.
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from ..config.settings import (
+    FUSION_MAX_QUERIES,
+    FUSION_MIN_QUERIES,
+    FUSION_MIN_SPREAD,
+    FUSION_MIN_TOP_SCORE,
+    FUSION_PROBE_K,
+)
+from ..utils.metrics import FUSION_DECISIONS, FUSION_QUERIES, FUSION_SAVED
+from .speculation import speculated_search
+
+logger = logging.getLogger(__name__)
+
+
+def cosine_scores(results) -> List[float]:
+    """
+    Cosine similarities from (document, squared L2 distance) pairs, as Chroma and
+    QuantizedChroma return them; the embeddings of our model are unit-normalized.
+    """
+    return [1 - distance / 2 for _, distance in results]
+
+
+class AdaptiveFusion:
+    """
+    Content retrieval that only pays for RAG fusion when the question needs it.
+
+    `single` retrieves for the question alone; `fusion` takes
+    {"question", "num_queries"} and returns RRF-ranked (document, score) pairs.
+    """
+
+    def __init__(
+        self,
+        store,
+        single: Runnable,
+        fusion: Runnable,
+        probe_k: int = FUSION_PROBE_K,
+        min_top_score: float = FUSION_MIN_TOP_SCORE,
+        min_spread: float = FUSION_MIN_SPREAD,
+        min_queries: int = FUSION_MIN_QUERIES,
+        max_queries: int = FUSION_MAX_QUERIES,
+    ):
+        self.store = store
+        self.single = single
+        self.fusion = fusion
+        self.probe_k = probe_k
+        self.min_top_score = min_top_score
+        self.min_spread = min_spread
+        self.min_queries = min_queries
+        self.max_queries = max_queries
+        # Running average of the fusion path's latency, to estimate what a skip saves
+        self._fusion_latency: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def probe(self, question: str) -> Tuple[float, float]:
+        """Best cosine score of the question against the store, and its lead over the k-th best."""
+        results = speculated_search(self.store, question, self.probe_k)
+        if results is None:
+            results = self.store.similarity_search_with_score(question, k=self.probe_k)
+        scores = cosine_scores(results)
+        if not scores:
+            return 0.0, 0.0
+        return scores[0], scores[0] - scores[-1]
+
+    def num_queries(self, top: float, spread: float) -> int:
+        """Sub-queries to generate for a probe result; 0 skips fusion."""
+        if top >= self.min_top_score and spread >= self.min_spread:
+            return 0
+        # From min_queries just under the threshold up to max_queries at half of it
+        shortfall = min(1.0, max(0.0, (self.min_top_score - top) / (self.min_top_score / 2)))
+        return self.min_queries + math.ceil((self.max_queries - self.min_queries) * shortfall)
+
+    def invoke(self, question: str, config: Optional[RunnableConfig] = None):
+        start = time.perf_counter()
+        top, spread = self.probe(question)
+        queries = self.num_queries(top, spread)
+
+        if queries == 0:
+            docs = self.single.invoke(question, config)
+            elapsed = time.perf_counter() - start
+            FUSION_DECISIONS.labels(decision="skipped").inc()
+            with self._lock:
+                saved = None if self._fusion_latency is None else max(0.0, self._fusion_latency - elapsed)
+            if saved is not None:
+                FUSION_SAVED.observe(saved)
+            logger.info(f"Fusion skipped (top {top:.3f}, spread {spread:.3f}), "
+                        f"saved ~{saved if saved is not None else 0:.2f}s")
+            return docs
+
+        docs = self.fusion.invoke({"question": question, "num_queries": queries}, config)
+        elapsed = time.perf_counter() - start
+        FUSION_DECISIONS.labels(decision="fused").inc()
+        FUSION_QUERIES.observe(queries)
+        with self._lock:
+            previous = self._fusion_latency
+            self._fusion_latency = elapsed if previous is None else 0.9 * previous + 0.1 * elapsed
+        logger.info(f"Fusion with {queries} queries (top {top:.3f}, spread {spread:.3f}) took {elapsed:.2f}s")
+        return docs
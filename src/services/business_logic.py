@@ -6,19 +6,32 @@ import traceback
 from langchain.chains.qa_with_sources.retrieval import RetrievalQAWithSourcesChain
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableLambda
-from langchain.retrievers.self_query.base import SelfQueryRetriever
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda, RunnablePassthrough
+from langchain_core.vectorstores import InMemoryVectorStore
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.load import dumps, loads
 from operator import itemgetter
 
 from .memory_manager import RAGMemoryManager
+from .compression import ExtractiveCompressor
+from .speculation import SpeculativeRetrieval, use_speculation
+from .adaptive_fusion import AdaptiveFusion
+from .digest_builder import digest_id
+from .retrieval_cache import read_index_generation
 from ..models.data_models import METADATA_FIELD_INFO, RouteQuery
 from ..custom_classes.custom_chat_model import RedPillChatModel
 from ..custom_classes.customllm import RedPillLLM
 from ..custom_imported_classes.search import FilteredGoogleSearchAPIWrapper
-from ..custom_imported_classes.retrievers import CustomWebResearchRetriever
-from ..config.settings import RED_PILL_API_KEY, LLM_MODEL
+from ..custom_imported_classes.retrievers import CustomSelfQueryRetriever, CustomWebResearchRetriever
+from ..utils.citations import add_references, format_context
+from ..utils.deadline import degradations, request_deadline, should_degrade
+from ..utils.logging_config import log_payload
+from ..utils.profiling import profile
+from ..utils.tracing import trace_stage
+from ..config.settings import (
+    RED_PILL_API_KEY, STAGE_MODELS, SPECULATIVE_ROUTES, COMPRESSION_ENABLED, DEGRADED_K,
+    FUSION_MODE, FUSION_MAX_QUERIES, FUSION_PROBE_K,
+)
 from ..config.prompt_settings import (
     ROUTER_SYSTEM_PROMPT,
     ROUTER_HUMAN_PROMPT,
@@ -43,15 +56,19 @@ print("https_proxy", https_proxy)
 print("web_search_enabled", web_search_enabled)
 
 
+def parse_queries(text: str, num_queries: int) -> list[str]:
+    """The first `num_queries` non-empty lines of the model's answer, without list markers."""
+    queries = [re.sub(r"^(?:[-*.]|\d+[.)])\s*", "", line.strip()) for line in text.split("\n")]
+    return [query for query in queries if query][:num_queries]
 
 
 class RAGSystem:
     _instance = None
     
     @classmethod
-    def initialize(cls, abstract_store, content_store):
+    def initialize(cls, abstract_store, content_store, digest_store=None):
         if cls._instance is None:
-            cls._instance = cls(abstract_store, content_store)
+            cls._instance = cls(abstract_store, content_store, digest_store)
         return cls._instance
     
     @classmethod
@@ -60,10 +77,11 @@ class RAGSystem:
             raise RuntimeError("RAGSystem not initialized")
         return cls._instance
     
-    def __init__(self, abstract_store, content_store):
+    def __init__(self, abstract_store, content_store, digest_store=None):
         logger.info("Initializing RAGSystem")
         self.abstract_store = abstract_store
         self.content_store = content_store
+        self.digest_store = digest_store
         self.setup_components()
         
         # Initialize memory manager
@@ -91,6 +109,7 @@ class RAGSystem:
         try:
             self.setup_llms()
             self.setup_retrievers()
+            self.setup_compression()
             self.setup_rag_fusion()
             self.setup_chains()
             self.setup_router()
@@ -101,38 +120,78 @@ class RAGSystem:
 
     def setup_llms(self):
         logger.info("Setting up LLMs")
-        self.chat_llm = RedPillChatModel(
-            model=LLM_MODEL,
-            api_key=RED_PILL_API_KEY,
-            temperature=0
-        )
-        self.llm = RedPillLLM(
-            model=LLM_MODEL,
-            api_key=RED_PILL_API_KEY,
-            temperature=0.5
-        )
+        # One model per pipeline stage; the tier in the metadata attributes their usage
+        self.stage_llms = {}
+        for stage, config in STAGE_MODELS.items():
+            llm_class = RedPillChatModel if stage == "router" else RedPillLLM
+            self.stage_llms[stage] = llm_class(
+                model=config["model"],
+                api_key=RED_PILL_API_KEY,
+                temperature=config["temperature"],
+                metadata={"tier": stage},
+            )
+            logger.info(f"Stage {stage} uses {config['model']} (temperature {config['temperature']})")
+        self.chat_llm = self.stage_llms["router"]
+        self.llm = self.stage_llms["answer"]
 
     def setup_retrievers(self):
         logger.info("Setting up retrievers")
-        self.abstract_retriever = SelfQueryRetriever.from_llm(
-            self.llm,
-            self.abstract_store,
-            DOCUMENT_CONTENT_DESCRIPTION,
-            METADATA_FIELD_INFO,
-            verbose=True,
-            enable_limit=True,
-            search_kwargs={"k": 5}
-        )
-        
-        self.content_retriever = SelfQueryRetriever.from_llm(
-            self.llm,
-            self.content_store,
+        self.abstract_retriever = self._self_query_retriever(self.abstract_store)
+        self.content_retriever = self._self_query_retriever(self.content_store)
+        # Summary-style (Abstract_Store) queries use the precomputed digests once every thesis has one
+        self.digest_retriever = None
+        if self.digest_store is not None:
+            self.digest_retriever = self._self_query_retriever(self.digest_store)
+        # (index generation, whether the digests covered every thesis in it)
+        self._digest_coverage = (None, False)
+
+    def _self_query_retriever(self, store):
+        retriever = CustomSelfQueryRetriever.from_llm(
+            self.stage_llms["self_query"],
+            store,
             DOCUMENT_CONTENT_DESCRIPTION,
             METADATA_FIELD_INFO,
             verbose=True,
             enable_limit=True,
             search_kwargs={"k": 5}
         )
+        # Name the self-query construction step so it is traced as its own stage
+        retriever.query_constructor = retriever.query_constructor.with_config(run_name="self_query")
+        return retriever
+
+    def digests_complete(self):
+        """
+        Whether every thesis of the abstract store has a digest. A partial or interrupted
+        build, or failed digests, would otherwise hide theses from summary queries.
+        Checked again whenever the index generation changes (ingestion, rebuilds).
+        """
+        generation = read_index_generation()
+        checked, complete = self._digest_coverage
+        if checked == generation:
+            return complete
+        theses = {digest_id(metadata or {}) for metadata in self.abstract_store.get(include=["metadatas"])["metadatas"]}
+        missing = len(theses - set(self.digest_store.get(include=[])["ids"]))
+        complete = missing == 0
+        if complete:
+            logger.info("Answering Abstract_Store queries from the digest collection")
+        else:
+            logger.warning(f"{missing} of {len(theses)} theses have no digest, answering Abstract_Store queries from abstracts")
+        self._digest_coverage = (generation, complete)
+        return complete
+
+    def summary_retriever(self):
+        """Retriever of Abstract_Store queries: the digests if they cover every thesis, else the abstracts"""
+        if self.digest_retriever is not None and self.digests_complete():
+            return self.digest_retriever
+        return self.abstract_retriever
+
+    def retrieve_summaries(self, question, config: RunnableConfig):
+        return self.summary_retriever().with_config(run_name="abstract_retrieval").invoke(question, config)
+
+    def setup_compression(self):
+        # Both stores use the same sentence-transformer
+        self.compressor = ExtractiveCompressor(self.content_store.embeddings) if COMPRESSION_ENABLED else None
+        logger.info(f"Extractive compression {'enabled' if self.compressor else 'disabled'}")
 
     def setup_rag_fusion(self):
         """Setup RAG Fusion components"""
@@ -141,18 +200,48 @@ class RAGSystem:
         # Setup query generation prompt
         self.prompt_rag_fusion = ChatPromptTemplate.from_template(RAG_FUSION_QUERY_TEMPLATE)
         
-        # Setup query generation chain
+        # Setup query generation chain; the model may still answer with more lines (or blank
+        # ones) than asked for, so only the first num_queries non-empty ones are retrieved
         self.generate_queries = (
-            self.prompt_rag_fusion 
-            | self.llm
-            | StrOutputParser() 
-            | (lambda x: x.split("\n"))
-        )
+            {
+                "text": self.prompt_rag_fusion | self.stage_llms["fusion"] | StrOutputParser(),
+                "num_queries": itemgetter("num_queries"),
+            }
+            | RunnableLambda(lambda x: parse_queries(x["text"], x["num_queries"]))
+        ).with_config(run_name="fusion_query_generation")
         
         # Setup Content Retriever with RAG Fusion
-        self.content_retriever_with_rag_fusion = self.generate_queries | self.content_retriever.map() | self.reciprocal_rank_fusion
+        self.content_retriever_with_rag_fusion = (
+            self.generate_queries
+            | self.content_retriever.with_config(run_name="content_retrieval").map()
+            | RunnableLambda(self.reciprocal_rank_fusion).with_config(run_name="reciprocal_rank_fusion")
+        )
+
+        # Adaptive mode only runs fusion for questions a single retrieval does not answer confidently
+        self.adaptive_fusion = None
+        if FUSION_MODE == "adaptive":
+            self.adaptive_fusion = AdaptiveFusion(
+                self.content_store,
+                self.content_retriever.with_config(run_name="content_retrieval"),
+                self.content_retriever_with_rag_fusion,
+            )
         
-        logger.info("RAG Fusion setup complete")
+        logger.info(f"RAG Fusion setup complete (mode: {FUSION_MODE})")
+
+    def retrieve_content(self, inputs, config: RunnableConfig):
+        """
+        Content store retrieval with RAG fusion (adaptive or always, see FUSION_MODE), or
+        with the question alone when the request is short of time. Takes the question or
+        {"question": ...}.
+        """
+        question = inputs["question"] if isinstance(inputs, dict) else inputs
+        if should_degrade("single_query"):
+            return self.content_retriever.with_config(run_name="content_retrieval").invoke(question, config)
+        if self.adaptive_fusion is not None:
+            return self.adaptive_fusion.invoke(question, config)
+        return self.content_retriever_with_rag_fusion.invoke(
+            {"question": question, "num_queries": FUSION_MAX_QUERIES}, config
+        )
 
     def reciprocal_rank_fusion(self, results: list[list], k=60):
         """Reciprocal rank fusion that takes multiple lists of ranked documents"""
@@ -176,7 +265,8 @@ class RAGSystem:
             for doc, score in sorted(fused_scores.items(), key=lambda x: x[1], reverse=True)
         ]
         
-        logger.info(f"Done Reranking results: {reranked_results}")
+        logger.info(f"Done reranking {len(reranked_results)} documents")
+        log_payload(logger, "Reranked results: %s", reranked_results, level=logging.DEBUG)
 
         return reranked_results
 
@@ -191,9 +281,60 @@ class RAGSystem:
         ])
         
         routing_llm = self.chat_llm.with_structured_output(RouteQuery)
-        router = router_prompt | routing_llm
-        
-        self.full_chain = router | RunnableLambda(self.choose_route)
+        self.router = (router_prompt | routing_llm).with_config(run_name="router")
+
+        # Context retrieval of each route, keyed by the datasource the router returns
+        self.route_retrievers = {
+            "abstract_store": RunnableLambda(self.retrieve_summaries),
+            "content_store": RunnableLambda(self.retrieve_content),
+        }
+
+        if SPECULATIVE_ROUTES:
+            logger.info(f"Speculative retrieval enabled for routes: {SPECULATIVE_ROUTES}")
+            # Only the plain vector search of each route's store is speculated (no LLM calls)
+            route_stores = {
+                "abstract_store": lambda: self.summary_retriever().vectorstore,
+                "content_store": lambda: self.content_store,
+            }
+            k = max(self.content_retriever.search_kwargs.get("k", 4), FUSION_PROBE_K)
+            self.speculative_retrieval = SpeculativeRetrieval(route_stores, SPECULATIVE_ROUTES, k)
+            self.full_chain = RunnableLambda(self.route_with_speculation)
+        else:
+            self.full_chain = RunnableLambda(self.route_query)
+
+    @staticmethod
+    def last_question(inputs):
+        """The latest user question, used to retrieve before the router has restated it"""
+        if isinstance(inputs, dict):
+            inputs = inputs.get("messages", "")
+        if isinstance(inputs, list):
+            human = [m for m in inputs if getattr(m, "type", None) == "human"]
+            return human[-1].content if human else ""
+        return str(inputs).replace("[This is a evaluation process]", "").strip()
+
+    def route_with_speculation(self, inputs, config: RunnableConfig):
+        """
+        Run the router and a vector search of the configured routes' stores concurrently; the
+        chosen route then retrieves as usual, reusing the search if it asks for the same one
+        """
+        question = self.last_question(inputs)
+        speculation = self.speculative_retrieval.start(question)
+        result = self.router.invoke(inputs, config)
+        speculation.resolve(result.datasource)
+
+        with use_speculation(speculation):
+            return self.run_route(result, question, config)
+
+    def route_query(self, inputs, config: RunnableConfig):
+        """Run the router, then the chosen branch"""
+        result = self.router.invoke(inputs, config)
+        return self.run_route(result, self.last_question(inputs), config)
+
+    def run_route(self, result, question, config: RunnableConfig):
+        output = self.choose_route(result, question)
+        if isinstance(output, Runnable):
+            output = output.invoke(result, config)
+        return output
 
     def setup_web_research(self):
         """Initialize web research components"""
@@ -202,10 +343,11 @@ class RAGSystem:
             # Initialize our filtered Google Search
             self.search = FilteredGoogleSearchAPIWrapper()
             
-            # Use our custom retriever with our filtered search
+            # Use our custom retriever with our filtered search. Pages go into a
+            # per-request scratch index; the content store is only used for its embeddings
             self.web_research_retriever = CustomWebResearchRetriever.from_llm(
-                vectorstore=self.content_store,
-                llm=self.llm,
+                vectorstore=InMemoryVectorStore(self.content_store.embeddings),
+                llm=self.stage_llms["web_search"],
                 search=self.search,
                 allow_dangerous_requests=True,
                 num_search_results=1,
@@ -231,17 +373,16 @@ class RAGSystem:
         """Process a query using web search and format response with APA-style citations"""
         logger.info("Processing web search query")
         try:
-            logger.info(f"Messages: {messages}")
+            log_payload(logger, "Messages: %s", messages)
             
             if messages:
                 messages_str = str(messages)
-                logger.info(f"Messages string: {messages_str}")
                 
                 matches = re.findall(r"content='(.*?)'", messages_str)
                 
                 if matches:
                     question = matches[-1]
-                    logger.info(f"Extracted question: {question}")
+                    log_payload(logger, "Extracted question: %s", question)
                 else:
                     try: 
                         # User call for web search in the first message, didn't get formatted correctly, so try this format
@@ -254,16 +395,16 @@ class RAGSystem:
                 logger.warning("No messages found in result")
                 return "No question found to process."
 
-            logger.info(f"Question: {question}")
+            log_payload(logger, "Question: %s", question)
             
-            web_result = self.web_qa_chain.invoke({
-                "question": question
-            })
+            with trace_stage("web_search"):
+                web_result = self.web_qa_chain.invoke({
+                    "question": question
+                })
 
-            logger.info(f"Web result: {web_result}")
+            log_payload(logger, "Web result: %s", web_result)
             
             response = f"{web_result['answer']}\n\n### References\n"
-            logger.info(f"Response: {response}")
 
             # Deduplicate sources using a dictionary with URL as key
             sources = {}
@@ -271,8 +412,6 @@ class RAGSystem:
                 for doc in web_result['source_documents']:
                     metadata = doc.metadata
                     
-                    print("metadata", metadata)
-                    
                     source_url = metadata.get('source', '').strip()
                     title = metadata.get('title', '').strip()
                     
@@ -293,40 +432,82 @@ class RAGSystem:
             logger.error(f"Error in web research: {str(e)}")
             return "I apologize, it seems like there is likely a connection issue with the web search. Please try again later."
 
-    def choose_route(self, result):
-        logger.info(f"Choosing route for result: {result}")
+    def _generation_chain(self, template):
+        """Final answer generation, traced as the "generation" stage"""
+        return (ChatPromptTemplate.from_template(template)
+                | self.llm
+                | StrOutputParser()).with_config(run_name="generation")
+
+    def _cited_generation_chain(self, template, with_groundtruth=False):
+        """
+        Generation over numbered sources, followed by the reference list rendered from their metadata.
+        Takes {"docs": retrieved documents, "question": ..., "latest_question": ...}, where
+        "question" is the router's restatement of the conversation and "latest_question" the
+        user's current question alone.
+        """
+        generate = ({"context": lambda x: format_context(x["docs"]), "question": itemgetter("question")}
+                    | self._generation_chain(template))
+        chain = (RunnablePassthrough.assign(answer=generate)
+                 | RunnableLambda(lambda x: add_references(x["answer"], x["docs"], with_groundtruth)))
+        if self.compressor is not None:
+            def compress(x):
+                if should_degrade("skip_compression"):
+                    return x["docs"]
+                # Score sentences against the current question, not the whole conversation
+                return self.compressor.compress(x["latest_question"], x["docs"])
+            chain = RunnablePassthrough.assign(docs=RunnableLambda(compress)) | chain
+
+        def budget_docs(x):
+            # Documents come ranked, so a shorter context keeps the best ones
+            if len(x["docs"]) > DEGRADED_K and should_degrade("lower_k"):
+                return x["docs"][:DEGRADED_K]
+            return x["docs"]
+        return RunnablePassthrough.assign(docs=RunnableLambda(budget_docs)) | chain
+
+    def choose_route(self, result, latest_question=None):
+        log_payload(logger, "Choosing route for result: %s", result)
         logger.info(f"Result datasource: {result.datasource.lower()}")
         logger.info(f"Evaluation: {result.evaluation}")
         
         def return_messages(result):
             # helper function to return the messages
             if result.evaluation == False:
-                print("type(result.messages)", type(result.messages))
                 return result.messages
             else:
                 query_comp = result.messages
                 query_temp = query_comp.replace("[This is a evaluation process]", "")
-                print("type(query_temp)", type(query_temp))
                 return query_temp
         
+        latest = RunnableLambda(lambda _: latest_question or return_messages(result))
+
         # define the template
         template = RAG_TEMPLATE if result.evaluation == False else EVALUATE_TEMPLATE
+        generation = self._cited_generation_chain(template, with_groundtruth=result.evaluation)
 
         if "abstract_store" in result.datasource.lower():
             # Using abstract retriever for query
-            abstract_chain = ({"context": self.abstract_retriever, "question": RunnableLambda(return_messages)} 
-                             | ChatPromptTemplate.from_template(template)
-                             | self.llm
-                             | StrOutputParser())
+            abstract_chain = ({"docs": self.route_retrievers["abstract_store"],
+                               "question": RunnableLambda(return_messages),
+                               "latest_question": latest}
+                             | generation)
             return abstract_chain
         elif "content_store" in result.datasource.lower():
             # Using content retriever with RAG Fusion for query
             # Split into two variables to avoid python thinking | is an or operator
             input = {"question": RunnableLambda(return_messages)}
-            chain = {"context": self.content_retriever_with_rag_fusion, "question": itemgetter("question")} | ChatPromptTemplate.from_template(template) | self.llm | StrOutputParser()
+            chain = ({"docs": self.route_retrievers["content_store"], "question": itemgetter("question"),
+                      "latest_question": latest}
+                     | generation)
             content_chain = input | chain
             return content_chain
         else:
+            if self.web_search_enabled and should_degrade("skip_web_search"):
+                # No time left for a web search: answer from the theses instead
+                input = {"question": RunnableLambda(return_messages)}
+                chain = ({"docs": self.route_retrievers["content_store"], "question": itemgetter("question"),
+                          "latest_question": latest}
+                         | generation)
+                return input | chain
             if self.web_search_enabled:
                 # Use web research for other queries if web search is enabled
                 return self.process_web_search(return_messages(result))
@@ -348,17 +529,23 @@ class RAGSystem:
     #         history.append(f"{role}: {msg.content}")
     #     return "\n".join(history)
 
-    def process_query(self, query):
+    def process_query(self, query, chat_id=None, deadline=None):
         """
         Process a query with message history support
         
         Args:
             query: Can be either a string or a list of messages
+            chat_id: Optional id of the chat, whose conversation memory is used
+            deadline: Optional time budget in seconds; stages degrade as it runs out
+                      and the result lists the degradations taken
         """
         logger.info(f"Processing query")
         try:
             # Use the memory manager to process the query
-            return self.memory_manager.process_query_with_memory(query)
+            with request_deadline(deadline), profile("query"):
+                result = self.memory_manager.process_query_with_memory(query, chat_id)
+                result["degradations"] = degradations()
+            return result
                 
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
@@ -0,0 +1,309 @@
+"""
+Durable LangGraph checkpointer for conversation memory.
+
+`SQLiteCheckpointer` stores the memory graph's checkpoints in an SQLite file
+in WAL mode, so conversations survive restarts and every server worker sees
+the same state of a chat. Only the latest checkpoint of each thread is kept
+(the memory graph never resumes from older ones), serialized with the
+checkpointer's msgpack serde.
+
+A small LRU of deserialized checkpoints sits in front of the database. Entries
+are validated against the stored checkpoint id on every read, which only
+touches the primary-key index, so a checkpoint written by another worker is
+never served stale.
+
+Threads that have not been updated for `retention` seconds are pruned
+periodically; the memory manager rebuilds them from the chat history if the
+conversation is resumed.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from ..config.settings import (
+    MEMORY_CHECKPOINT_CACHE_SIZE,
+    MEMORY_CHECKPOINT_DB_PATH,
+    MEMORY_CHECKPOINT_PRUNE_INTERVAL,
+    MEMORY_CHECKPOINT_RETENTION,
+)
+from ..utils.metrics import CACHE_EVENTS
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS checkpoints (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        checkpoint_id TEXT NOT NULL,
+        parent_id TEXT,
+        type TEXT NOT NULL,
+        checkpoint BLOB NOT NULL,
+        metadata_type TEXT NOT NULL,
+        metadata BLOB NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (thread_id, checkpoint_ns)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_checkpoints_updated_at ON checkpoints (updated_at)",
+    """CREATE TABLE IF NOT EXISTS checkpoint_writes (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        type TEXT NOT NULL,
+        value BLOB NOT NULL,
+        task_path TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    )""",
+]
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    def __init__(
+        self,
+        path: str = MEMORY_CHECKPOINT_DB_PATH,
+        cache_size: int = MEMORY_CHECKPOINT_CACHE_SIZE,
+        retention: float = MEMORY_CHECKPOINT_RETENTION,
+        prune_interval: float = MEMORY_CHECKPOINT_PRUNE_INTERVAL,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.cache_size = cache_size
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self._cache: "OrderedDict[Tuple[str, str], CheckpointTuple]" = OrderedDict()
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+
+    # Hot cache --------------------------------------------------------------
+    def _cached(self, key: Tuple[str, str], checkpoint_id: str) -> Optional[CheckpointTuple]:
+        saved = self._cache.get(key)
+        if saved is None or saved.checkpoint["id"] != checkpoint_id:
+            return None
+        self._cache.move_to_end(key)
+        # The graph updates the version maps of the checkpoint it resumes from in place
+        return saved._replace(checkpoint=copy_checkpoint(saved.checkpoint))
+
+    def _remember(self, key: Tuple[str, str], saved: CheckpointTuple) -> None:
+        self._cache[key] = saved
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # Reads ------------------------------------------------------------------
+    def _pending_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        rows = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in rows]
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?", key
+            ).fetchone()
+            requested = get_checkpoint_id(config)
+            if row is None or (requested and requested != row[0]):
+                return None
+
+            cached = self._cached(key, row[0])
+            CACHE_EVENTS.labels(cache="checkpoint", result="hit" if cached else "miss").inc()
+            if cached is not None:
+                return cached
+
+            checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = self._conn.execute(
+                "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ?", key
+            ).fetchone()
+            saved = CheckpointTuple(
+                config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                         "checkpoint_id": checkpoint_id}},
+                checkpoint=self.serde.loads_typed((type_, checkpoint)),
+                metadata=self.serde.loads_typed((metadata_type, metadata)),
+                parent_config=(
+                    {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                      "checkpoint_id": parent_id}}
+                    if parent_id else None
+                ),
+                pending_writes=self._pending_writes(thread_id, checkpoint_ns, checkpoint_id),
+            )
+            self._remember(key, saved)
+            return saved._replace(checkpoint=copy_checkpoint(saved.checkpoint))
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """The latest checkpoint of the thread in `config` (only the latest one is kept)."""
+        if config is None or limit == 0:
+            return
+        saved = self.get_tuple(config)
+        if saved is None:
+            return
+        if before and get_checkpoint_id(before) and saved.checkpoint["id"] >= get_checkpoint_id(before):
+            return
+        if filter and any(saved.metadata.get(k) != v for k, v in filter.items()):
+            return
+        yield saved
+
+    # Writes -----------------------------------------------------------------
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        metadata = get_checkpoint_metadata(config, metadata)
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(metadata)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints "
+                    "(thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], parent_id, type_, blob, metadata_type, metadata_blob, now),
+                )
+                # Writes of the checkpoints this one replaces can no longer be resumed from
+                self._conn.execute(
+                    "DELETE FROM checkpoint_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?",
+                    (thread_id, checkpoint_ns, checkpoint["id"]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            new_config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                           "checkpoint_id": checkpoint["id"]}}
+            self._remember((thread_id, checkpoint_ns), CheckpointTuple(
+                config=new_config,
+                checkpoint=copy_checkpoint(checkpoint),
+                metadata=metadata,
+                parent_config=(
+                    {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                      "checkpoint_id": parent_id}}
+                    if parent_id else None
+                ),
+                pending_writes=[],
+            ))
+
+            if now - self._last_prune > self.prune_interval:
+                self._last_prune = now
+                self._prune(now - self.retention)
+        return new_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, blob, task_path))
+        # Special writes (errors, interrupts) replace earlier ones, regular writes are kept
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(
+                f"{verb} INTO checkpoint_writes "
+                "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            # The cached tuple no longer has all of its pending writes
+            cached = self._cache.get((thread_id, checkpoint_ns))
+            if cached is not None and cached.checkpoint["id"] == checkpoint_id:
+                del self._cache[(thread_id, checkpoint_ns)]
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM checkpoint_writes WHERE thread_id = ?", (thread_id,))
+            for key in [key for key in self._cache if key[0] == thread_id]:
+                del self._cache[key]
+
+    # Retention --------------------------------------------------------------
+    def _prune(self, cutoff: float) -> int:
+        stale = [row[0] for row in self._conn.execute(
+            "SELECT DISTINCT thread_id FROM checkpoints WHERE updated_at < ?", (cutoff,)
+        )]
+        if stale:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM checkpoints WHERE updated_at < ?", (cutoff,))
+            self._conn.execute("DELETE FROM checkpoint_writes WHERE thread_id NOT IN (SELECT thread_id FROM checkpoints)")
+            self._conn.execute("COMMIT")
+            stale = set(stale)
+            for key in [key for key in self._cache if key[0] in stale]:
+                del self._cache[key]
+        return len(stale)
+
+    def prune(self, retention: Optional[float] = None) -> int:
+        """Delete threads idle for longer than `retention` seconds. Returns the number of threads deleted."""
+        with self._lock:
+            return self._prune(time.time() - (self.retention if retention is None else retention))
+
+    # Async variants, for graphs run with `ainvoke` ----------------------------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[dict] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        for saved in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield saved
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
@@ -0,0 +1,158 @@
+"""
+Chunking of full texts before they are embedded into the content store.
+
+Strategies (CHUNK_STRATEGY):
+- "character": recursive character splitting (paragraphs, lines, words)
+- "token": the same, but sizes are counted in tokens of the embedding model,
+  so chunks never exceed what the model actually reads
+- "section": section- and sentence-aware; chunks never span a section
+  heading and only break between sentences
+
+Large corpora are split across worker processes.
+"""
+
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+from ..config.settings import (
+    CHUNK_OVERLAP,
+    CHUNK_PARALLEL_MIN_DOCS,
+    CHUNK_SIZE,
+    CHUNK_STRATEGY,
+    CHUNK_TOKEN_OVERLAP,
+    CHUNK_TOKEN_SIZE,
+    CHUNK_WORKERS,
+    EMBEDDING_MODEL,
+)
+from ..utils.helpers import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Numbered ("2.1 Study Area"), markdown ("## Results") or all-caps ("CONCLUSION") headings on their own line
+_HEADING = re.compile(r"^\s*(?:#{1,6}\s+\S.*|\d+(?:\.\d+)*\.?\s+[A-Z][^\n]{0,80}|[A-Z][A-Z \-&]{3,60})\s*$", re.MULTILINE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+
+
+@lru_cache(maxsize=1)
+def token_length_function() -> Callable[[str], int]:
+    """Token counter of the embedding model, or an estimate if its tokenizer is unavailable."""
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        logger.warning(f"Tokenizer of {EMBEDDING_MODEL} unavailable ({str(e)}), estimating token counts")
+        return estimate_tokens
+
+
+class SectionAwareSplitter(TextSplitter):
+    """Packs whole sentences into chunks of at most `chunk_size` characters, never across a section heading."""
+
+    def split_text(self, text: str) -> List[str]:
+        chunks = []
+        for section in self._sections(text):
+            chunks.extend(self._pack(self._sentences(section)))
+        return chunks
+
+    @staticmethod
+    def _sections(text: str) -> List[str]:
+        starts = [0] + [match.start() for match in _HEADING.finditer(text) if match.start() > 0]
+        bounds = zip(starts, starts[1:] + [len(text)])
+        return [text[start:end].strip() for start, end in bounds if text[start:end].strip()]
+
+    def _sentences(self, section: str) -> List[str]:
+        sentences = []
+        for paragraph in re.split(r"\n\s*\n", section):
+            for sentence in _SENTENCE_END.split(" ".join(paragraph.split())):
+                # A sentence longer than a chunk is cut at word boundaries
+                while self._length_function(sentence) > self._chunk_size:
+                    cut = sentence.rfind(" ", 0, self._chunk_size)
+                    cut = cut if cut > 0 else self._chunk_size
+                    sentences.append(sentence[:cut])
+                    sentence = sentence[cut:].strip()
+                if sentence:
+                    sentences.append(sentence)
+        return sentences
+
+    def _pack(self, sentences: List[str]) -> List[str]:
+        chunks, current = [], []
+        for sentence in sentences:
+            if current and self._length_function(" ".join(current + [sentence])) > self._chunk_size:
+                chunks.append(" ".join(current))
+                # Carry trailing sentences over as overlap
+                overlap = []
+                for previous in reversed(current):
+                    if self._length_function(" ".join([previous] + overlap)) > self._chunk_overlap:
+                        break
+                    overlap.insert(0, previous)
+                current = overlap
+            current.append(sentence)
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
+
+
+STRATEGIES = ("character", "token", "section")
+
+
+def get_splitter(strategy: str = CHUNK_STRATEGY, chunk_size: Optional[int] = None,
+                 chunk_overlap: Optional[int] = None) -> TextSplitter:
+    """
+    Text splitter for `strategy`. Sizes are in characters, or in tokens for the
+    "token" strategy, and default to the strategy's settings.
+    """
+    if chunk_size is None:
+        chunk_size = CHUNK_TOKEN_SIZE if strategy == "token" else CHUNK_SIZE
+    if chunk_overlap is None:
+        chunk_overlap = CHUNK_TOKEN_OVERLAP if strategy == "token" else CHUNK_OVERLAP
+    if strategy == "character":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if strategy == "token":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=token_length_function()
+        )
+    if strategy == "section":
+        return SectionAwareSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    raise ValueError(f"Unknown chunking strategy {strategy!r}, expected one of {STRATEGIES}")
+
+
+def _split_batch(docs: List[Document], strategy: str, chunk_size: Optional[int],
+                 chunk_overlap: Optional[int]) -> List[Document]:
+    # Runs in a worker process; module-level so it can be pickled
+    return get_splitter(strategy, chunk_size, chunk_overlap).split_documents(docs)
+
+
+def split_documents(
+    docs: List[Document],
+    strategy: str = CHUNK_STRATEGY,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    workers: Optional[int] = CHUNK_WORKERS,
+) -> List[Document]:
+    """Split `docs` into chunks, in document order, using worker processes for large corpora."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(docs) < CHUNK_PARALLEL_MIN_DOCS:
+        return _split_batch(docs, strategy, chunk_size, chunk_overlap)
+
+    # A few batches per worker balances uneven document lengths
+    batch_size = max(1, len(docs) // (workers * 4))
+    batches = [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)]
+    logger.info(f"Splitting {len(docs)} documents in {len(batches)} batches across {workers} processes")
+    # Spawned rather than forked: this also runs in background threads of the server (index
+    # rebuilds, ingestion), and forking a process with other threads running (torch, the
+    # request handlers) can leave a lock held forever in the child
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        results = executor.map(
+            _split_batch, batches,
+            [strategy] * len(batches), [chunk_size] * len(batches), [chunk_overlap] * len(batches),
+        )
+        return [chunk for batch in results for chunk in batch]
@@ -0,0 +1,77 @@
+import logging
+import re
+import time
+from typing import Any, List, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from ..config.settings import COMPRESSION_KEEP_RATIO, COMPRESSION_MIN_SENTENCES
+from ..utils.metrics import COMPRESSION_RATIO, STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_SPLIT.split(text) if sentence.strip()]
+
+
+class ExtractiveCompressor:
+    """
+    Shrinks retrieved chunks to the sentences most similar to the question.
+
+    Every sentence of every chunk is embedded together with the question in a
+    single batched call to the store's embedding model; each chunk keeps its
+    top `keep_ratio` sentences (at least `min_sentences`), in their original
+    order, and its metadata. Accepts documents or (document, score) pairs and
+    returns the same shape.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        keep_ratio: float = COMPRESSION_KEEP_RATIO,
+        min_sentences: int = COMPRESSION_MIN_SENTENCES,
+    ):
+        self.embeddings = embeddings
+        self.keep_ratio = keep_ratio
+        self.min_sentences = min_sentences
+
+    def compress(self, question: str, docs: Sequence[Any]) -> List[Any]:
+        start = time.perf_counter()
+        chunks = [split_sentences((item[0] if isinstance(item, tuple) else item).page_content) for item in docs]
+        sentences = [sentence for chunk in chunks for sentence in chunk]
+        if not sentences:
+            return list(docs)
+
+        vectors = np.asarray(self.embeddings.embed_documents([question] + sentences), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        scores = vectors[1:] @ vectors[0]
+
+        compressed, offset = [], 0
+        chars_in = chars_out = 0
+        for item, chunk in zip(docs, chunks):
+            doc = item[0] if isinstance(item, tuple) else item
+            chunk_scores = scores[offset:offset + len(chunk)]
+            offset += len(chunk)
+
+            keep = max(self.min_sentences, int(round(len(chunk) * self.keep_ratio)))
+            top = sorted(np.argsort(-chunk_scores)[:keep])
+            new_doc = Document(page_content=" ".join(chunk[i] for i in top), metadata=doc.metadata)
+            compressed.append((new_doc,) + item[1:] if isinstance(item, tuple) else new_doc)
+
+            chars_in += len(doc.page_content)
+            chars_out += len(new_doc.page_content)
+
+        elapsed = time.perf_counter() - start
+        ratio = chars_out / chars_in if chars_in else 1.0
+        STAGE_LATENCY.labels(stage="compression").observe(elapsed)
+        COMPRESSION_RATIO.observe(ratio)
+        logger.info(
+            f"Compressed {len(docs)} chunks ({len(sentences)} sentences) from {chars_in} to {chars_out} chars "
+            f"({ratio:.0%}) in {elapsed * 1000:.1f} ms"
+        )
+        return compressed
@@ -1,13 +1,16 @@
 import os
 import logging
-from typing import List, Dict, Any
-from langchain_huggingface import HuggingFaceEmbeddings
+from typing import List, Dict, Any, Tuple
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from uuid import uuid4
-from ..config.settings import EMBEDDING_MODEL, PERSIST_DIRECTORY
+from ..config.settings import PERSIST_DIRECTORY, DIGEST_ENABLED, QUANTIZATION
 from ..utils.helpers import load_corpus
+from .chunking import split_documents
+from .digest_builder import build_digests
+from .embeddings import get_embeddings
+from .quantized_index import QuantizedChroma
+from .retrieval_cache import bump_index_generation
 from chromadb.utils.batch_utils import create_batches
 
 # Set up logging
@@ -18,33 +21,60 @@ class DataProcessor:
     def __init__(self, persist_directory=PERSIST_DIRECTORY):
         """Initialize the data processor with embedding model and storage paths"""
         logger.info(f"Initializing DataProcessor with persist directory: {persist_directory}")
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        self.embeddings = get_embeddings()
         self.persist_directory = persist_directory
         
         # Create persist directories if they don't exist
         self.abstract_persist_dir = os.path.join(persist_directory, "abstract")
         self.content_persist_dir = os.path.join(persist_directory, "content")
+        self.digest_persist_dir = os.path.join(persist_directory, "digest")
         os.makedirs(self.abstract_persist_dir, exist_ok=True)
         os.makedirs(self.content_persist_dir, exist_ok=True)
+        os.makedirs(self.digest_persist_dir, exist_ok=True)
 
     def create_vector_stores(self):
         """Create or load vector stores for abstract and content"""
         logger.info("Creating vector stores")
         
-        self.abstract_store = Chroma(
-            collection_name="abstract_collection",
-            embedding_function=self.embeddings,
-            persist_directory=self.abstract_persist_dir
-        )
-        
-        self.content_store = Chroma(
-            collection_name="content_collection",
-            embedding_function=self.embeddings,
-            persist_directory=self.content_persist_dir
-        )
+        self.abstract_store = self.open_store("abstract_collection", self.abstract_persist_dir)
+        self.content_store = self.open_store("content_collection", self.content_persist_dir)
+
+        self.digest_store = self.open_digest_store(self.embeddings, self.persist_directory)
         
         return self.abstract_store, self.content_store
     
+    def open_store(self, collection_name, persist_dir):
+        """Chroma collection, searched through a quantized index when QUANTIZATION is enabled"""
+        if QUANTIZATION == "none":
+            return Chroma(
+                collection_name=collection_name,
+                embedding_function=self.embeddings,
+                persist_directory=persist_dir
+            )
+
+        store = QuantizedChroma(
+            collection_name=collection_name,
+            embedding_function=self.embeddings,
+            persist_directory=persist_dir,
+            index_path=os.path.join(persist_dir, f"quantized_{QUANTIZATION}"),
+            quantization=QUANTIZATION,
+        )
+        # Quantization enabled on an existing collection: index what is already stored
+        # (once, by whichever server worker gets there first)
+        with store.quantized_index.exclusive():
+            if not store.quantized_index.ids and store.get(limit=1)["ids"]:
+                store.rebuild_quantized_index()
+        return store
+
+    @staticmethod
+    def open_digest_store(embeddings, persist_directory=PERSIST_DIRECTORY):
+        """The collection of per-thesis digests (see digest_builder.py)"""
+        return Chroma(
+            collection_name="digest_collection",
+            embedding_function=embeddings,
+            persist_directory=os.path.join(persist_directory, "digest")
+        )
+
     def add_documents_in_batches(self, store, documents, ids, batch_size=5000):
         """
         Safely add documents to a vector store in multiple batches.
@@ -56,17 +86,9 @@ class DataProcessor:
             logging.info(f"Adding batch {i // batch_size + 1} with {len(batch_docs)} documents")
             store.add_documents(documents=batch_docs, ids=batch_ids)
 
-    def process_documents(self, corpus: List[Dict[str, Any]]):
-        """Process documents and store them in appropriate vector stores"""
-        logger.info("Processing documents")
-        
-        # Create text splitter for content documents
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500, 
-            chunk_overlap=100
-        )
-        
-        # Process both abstracts and content in one loop
+    @staticmethod
+    def to_documents(corpus: List[Dict[str, Any]]) -> Tuple[List[Document], List[Document]]:
+        """Abstract and full-text documents of the theses in `corpus` (theses without full text or a valid year are skipped)"""
         abstract_docs = []
         content_docs = []
         
@@ -102,10 +124,19 @@ class DataProcessor:
                 }
             )
             content_docs.append(content_doc)
+
+        return abstract_docs, content_docs
+
+    def process_documents(self, corpus: List[Dict[str, Any]]):
+        """Process documents and store them in appropriate vector stores"""
+        logger.info("Processing documents")
+        
+        # Process both abstracts and content in one loop
+        abstract_docs, content_docs = self.to_documents(corpus)
         
         # Split content documents into chunks
         logger.info("Splitting content documents into chunks")
-        content_splits = text_splitter.split_documents(content_docs)
+        content_splits = split_documents(content_docs)
         logger.info(f"Created {len(content_splits)} chunks from {len(content_docs)} documents")
         
         # Generate UUIDs for documents
@@ -118,6 +149,9 @@ class DataProcessor:
         
         logger.info(f"Adding {len(content_splits)} chunks to content store")
         self.add_documents_in_batches(self.content_store, content_splits, content_uuids)
+
+        # Cached retrieval results predate these documents
+        bump_index_generation(self.persist_directory)
         
         return abstract_docs, content_splits
     
@@ -127,16 +161,38 @@ class DataProcessor:
         
         abstract_count = len(self.abstract_store.get()['ids'])
         content_count = len(self.content_store.get()['ids'])
+        digest_count = len(self.digest_store.get()['ids'])
         
         stats = {
             'abstract_store_count': abstract_count,
             'content_store_count': content_count,
+            'digest_store_count': digest_count,
             'total_documents': abstract_count + content_count
         }
         
         logger.info(f"Vector store stats: {stats}")
         return stats
 
+def upsert_corpus(corpus: List[Dict[str, Any]], abstract_store, content_store) -> Tuple[List[Document], List[Document]]:
+    """
+    Add theses to the abstract and content stores, replacing the abstract and
+    chunks of any thesis already stored under the same source URL.
+    """
+    abstract_docs, content_docs = DataProcessor.to_documents(corpus)
+    sources = list(dict.fromkeys(doc.metadata["source"] for doc in abstract_docs))
+    if sources:
+        for store in (abstract_store, content_store):
+            stale = store.get(where={"source": {"$in": sources}}, include=[])["ids"]
+            if stale:
+                store.delete(ids=stale)
+
+    content_splits = split_documents(content_docs)
+    if abstract_docs:
+        abstract_store.add_documents(documents=abstract_docs, ids=[str(uuid4()) for _ in abstract_docs])
+    if content_splits:
+        content_store.add_documents(documents=content_splits, ids=[str(uuid4()) for _ in content_splits])
+    return abstract_docs, content_splits
+
 def preprocess_and_store_data(data_path: str, persist_directory: str = PERSIST_DIRECTORY):
     """
     Main function to preprocess and store data
@@ -153,6 +209,10 @@ def preprocess_and_store_data(data_path: str, persist_directory: str = PERSIST_D
         
         # Process and store documents
         abstract_docs, content_splits = processor.process_documents(corpus)
+
+        # Precompute the per-thesis digests
+        if DIGEST_ENABLED:
+            build_digests(processor)
         
         # Get store statistics
         stats = processor.get_store_stats()
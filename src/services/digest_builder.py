@@ -0,0 +1,155 @@
+"""
+Precomputed per-thesis digests for summary-style queries.
+
+At ingestion time every abstract is condensed by the digest-tier LLM into a
+short digest (key findings, methods, region, year) that is stored in a third
+collection. Abstract_Store queries are then answered from these small digests
+instead of re-summarizing raw abstracts on every request.
+
+The build is resumable (digests are keyed by the thesis source, so a rerun
+only processes theses that have none yet) and runs the LLM calls in parallel.
+
+Typical usage (build or resume the digests of an existing index):
+$ python -m src.services.digest_builder
+"""
+
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from ..config.prompt_settings import DIGEST_TEMPLATE
+from ..config.settings import DIGEST_BATCH_SIZE, DIGEST_WORKERS, PERSIST_DIRECTORY
+from .retrieval_cache import bump_index_generation
+
+logger = logging.getLogger(__name__)
+
+
+def digest_id(metadata: Dict[str, Any]) -> str:
+    """Stable id of a thesis digest, so that reruns can tell which digests exist."""
+    key = metadata.get("source") or metadata.get("title", "")
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+
+def render_digest(metadata: Dict[str, Any], digest: Dict[str, Any]) -> str:
+    findings = digest.get("key_findings") or []
+    if isinstance(findings, str):
+        findings = [findings]
+    lines = [
+        f"Title: {metadata.get('title', '')}",
+        f"Year: {metadata.get('year', '')}",
+        f"Region: {digest.get('region') or 'not specified'}",
+        f"Methods: {digest.get('methods') or 'not specified'}",
+        "Key findings:",
+    ]
+    lines.extend(f"- {finding}" for finding in findings)
+    return "\n".join(lines)
+
+
+class DigestBuilder:
+    def __init__(self, llm, store, max_workers: int = DIGEST_WORKERS, batch_size: int = DIGEST_BATCH_SIZE):
+        self.store = store
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.chain = (
+            ChatPromptTemplate.from_template(DIGEST_TEMPLATE)
+            | llm
+            | JsonOutputParser()
+        ).with_config(run_name="digest")
+
+    def pending(self, abstract_docs: List[Document]) -> List[Document]:
+        """Abstracts whose digest has not been stored yet."""
+        ids = list(dict.fromkeys(digest_id(doc.metadata) for doc in abstract_docs))
+        existing = set()
+        for i in range(0, len(ids), self.batch_size):
+            existing.update(self.store.get(ids=ids[i:i + self.batch_size], include=[])["ids"])
+        pending = {}
+        for doc in abstract_docs:
+            key = digest_id(doc.metadata)
+            if key not in existing and key not in pending:
+                pending[key] = doc
+        return list(pending.values())
+
+    def digest(self, abstract: Document) -> Document:
+        result = self.chain.invoke({
+            "title": abstract.metadata.get("title", ""),
+            "year": abstract.metadata.get("year", ""),
+            "abstract": abstract.page_content,
+        })
+        metadata = dict(abstract.metadata)
+        metadata["region"] = str(result.get("region") or "")
+        return Document(page_content=render_digest(metadata, result), metadata=metadata)
+
+    def build(self, abstract_docs: List[Document]) -> Dict[str, int]:
+        """Digest every abstract that has no digest yet. Failed theses are skipped and retried on the next run."""
+        pending = self.pending(abstract_docs)
+        logger.info(f"Building digests for {len(pending)} of {len(abstract_docs)} theses")
+
+        built, failed = 0, 0
+        batch: List[Document] = []
+
+        def flush():
+            # Stored batch by batch, so an interrupted build keeps its progress
+            nonlocal built
+            if batch:
+                self.store.add_documents(documents=batch, ids=[digest_id(doc.metadata) for doc in batch])
+                built += len(batch)
+                logger.info(f"Stored {built}/{len(pending)} digests")
+                batch.clear()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.digest, doc): doc for doc in pending}
+            for future in as_completed(futures):
+                try:
+                    batch.append(future.result())
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Digest failed for {futures[future].metadata.get('title')}: {str(e)}")
+                if len(batch) >= self.batch_size:
+                    flush()
+        flush()
+
+        stats = {"total": len(abstract_docs), "built": built, "failed": failed,
+                 "skipped": len(abstract_docs) - len(pending)}
+        logger.info(f"Digest build finished: {stats}")
+        return stats
+
+
+def build_digests(processor, llm: Optional[Any] = None, root: str = PERSIST_DIRECTORY) -> Dict[str, int]:
+    """
+    Build (or resume) the digests of the abstracts already stored by `processor`.
+    New digests bump the index generation of `root`, the persist root the
+    servers read it from, whichever version directory `processor` writes to.
+    """
+    if llm is None:
+        from ..custom_classes.customllm import RedPillLLM
+        from ..config.settings import RED_PILL_API_KEY, STAGE_MODELS
+
+        config = STAGE_MODELS["digest"]
+        llm = RedPillLLM(model=config["model"], api_key=RED_PILL_API_KEY,
+                         temperature=config["temperature"], metadata={"tier": "digest"})
+
+    stored = processor.abstract_store.get(include=["documents", "metadatas"])
+    abstract_docs = [
+        Document(page_content=text, metadata=metadata)
+        for text, metadata in zip(stored["documents"], stored["metadatas"])
+    ]
+    stats = DigestBuilder(llm, processor.digest_store).build(abstract_docs)
+    if stats["built"]:
+        bump_index_generation(root)
+    return stats
+
+
+if __name__ == "__main__":
+    from .data_processor import DataProcessor
+    from .index_versions import active_persist_directory
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # The index version the servers read from
+    processor = DataProcessor(active_persist_directory(PERSIST_DIRECTORY))
+    processor.create_vector_stores()
+    build_digests(processor)
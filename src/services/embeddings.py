@@ -0,0 +1,21 @@
+import logging
+from functools import lru_cache
+
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from ..config.settings import EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(model_name: str = EMBEDDING_MODEL) -> HuggingFaceEmbeddings:
+    """
+    The embedding model, loaded once per process.
+
+    When the server is started with `python -m src.serve` this is first called
+    in the master process before the workers are forked, so every worker reuses
+    the same copy-on-write model weights instead of loading its own.
+    """
+    logger.info(f"Loading embedding model {model_name}")
+    return HuggingFaceEmbeddings(model_name=model_name)
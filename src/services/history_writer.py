@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert, update
+
+from ..config.settings import (
+    HISTORY_DURABILITY,
+    HISTORY_QUEUE_SIZE,
+    HISTORY_BATCH_SIZE,
+    HISTORY_FLUSH_INTERVAL,
+    HISTORY_WRITE_RETRIES,
+    HISTORY_RETRY_BACKOFF,
+)
+from ..models.history_models import AsyncSessionLocal, ChatMessage, ChatSession
+from ..utils.metrics import HISTORY_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChatTurn:
+    """A question/answer pair waiting to be persisted."""
+    chat_id: str
+    question: str
+    answer: str
+    timestamp: datetime = field(default_factory=datetime.utcnow)
+
+
+class ChatHistoryWriter:
+    """
+    Write-behind persister for chat turns.
+
+    In "async" durability mode, turns are put on a bounded in-process queue and
+    a background task drains it, writing everything that accumulated (up to
+    `batch_size` turns) in a single transaction. A full queue applies
+    backpressure to the request instead of dropping turns. A batch that keeps
+    failing to commit is written turn by turn, so that one bad turn does not
+    lose the turns of other chats. In "sync" mode, or before the writer is
+    started, each turn is committed before returning.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls) -> "ChatHistoryWriter":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        durability: str = HISTORY_DURABILITY,
+        max_queue_size: int = HISTORY_QUEUE_SIZE,
+        batch_size: int = HISTORY_BATCH_SIZE,
+        flush_interval: float = HISTORY_FLUSH_INTERVAL,
+        retries: int = HISTORY_WRITE_RETRIES,
+        retry_backoff: float = HISTORY_RETRY_BACKOFF,
+    ):
+        if durability not in ("sync", "async"):
+            raise ValueError(f"Unknown history durability mode: {durability}")
+        self.session_factory = session_factory
+        self.durability = durability
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.durability != "async" or self.running:
+            return
+        logger.info(f"Starting chat history writer (queue size {self.max_queue_size}, batch size {self.batch_size})")
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop the background task."""
+        if not self.running:
+            return
+        logger.info(f"Stopping chat history writer, flushing {self._queue.qsize()} queued turns")
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def save_turn(self, chat_id: str, question: str, answer: str) -> None:
+        turn = ChatTurn(chat_id=chat_id, question=question, answer=answer)
+        if self.durability == "sync" or not self.running:
+            await self._write([turn])
+        else:
+            await self._queue.put(turn)
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            # Give concurrent chats a moment to add their turns to the same transaction
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._persist(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _persist(self, batch: List[ChatTurn]) -> None:
+        """Write a batch, retrying transient failures, then falling back to one turn at a time."""
+        for attempt in range(self.retries + 1):
+            try:
+                await self._write(batch)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    if len(batch) == 1:
+                        logger.error(f"Dropping chat turn of chat {batch[0].chat_id}: {str(e)}")
+                        return
+                    logger.warning(f"Failed to persist {len(batch)} chat turns, writing them one by one: {str(e)}")
+                    break
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning(f"Failed to persist {len(batch)} chat turns, retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+
+        for turn in batch:
+            try:
+                await self._write([turn])
+            except Exception as e:
+                logger.error(f"Dropping chat turn of chat {turn.chat_id}: {str(e)}")
+
+    async def _write(self, turns: List[ChatTurn]) -> None:
+        rows = []
+        last_activity = {}
+        for turn in turns:
+            rows.append({"session_id": turn.chat_id, "role": "user", "content": turn.question, "timestamp": turn.timestamp})
+            rows.append({"session_id": turn.chat_id, "role": "assistant", "content": turn.answer, "timestamp": turn.timestamp})
+            last_activity[turn.chat_id] = turn.timestamp
+
+        async with self.session_factory() as db:
+            await db.execute(insert(ChatMessage), rows)
+            for chat_id, timestamp in last_activity.items():
+                await db.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == chat_id)
+                    .values(updated_at=timestamp, version=ChatSession.version + 1)
+                )
+            await db.commit()
+        HISTORY_BATCH.observe(len(turns))
@@ -0,0 +1,126 @@
+"""
+Background rebuild of the vector stores without taking the API offline.
+
+The corpus, plus the theses submitted through the API (see ingestion.py), is
+ingested into a new index version (see index_versions.py) on a low-priority
+thread while queries are served from the current one. The theses submitted
+through the API are replayed last, with ingestion paused in every process, so
+none is missed. SystemManager then swaps in a RAG system over the new stores
+in one step: new requests use it at once, requests already running finish on
+the old version, which is closed after they have drained. Its directory is
+removed by whichever worker is the last to let go of it.
+"""
+
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from ..config.settings import (
+    DATA_PATH,
+    DIGEST_ENABLED,
+    INDEX_DRAIN_TIMEOUT,
+    INDEX_REBUILD_NICE,
+    PERSIST_DIRECTORY,
+)
+from ..utils.helpers import load_corpus, lower_thread_priority
+from .data_processor import DataProcessor, upsert_corpus
+from .digest_builder import build_digests
+from .index_versions import new_version_directory, remove_index_directory
+from .ingestion import IngestQueue, IngestWorker
+from .system_manager import SystemManager
+
+logger = logging.getLogger(__name__)
+
+
+class IndexRebuilder:
+    """Runs at most one rebuild at a time and reports the state of the last one."""
+    _instance = None
+
+    @classmethod
+    def get_instance(cls) -> "IndexRebuilder":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(
+        self,
+        root: str = PERSIST_DIRECTORY,
+        data_path: str = DATA_PATH,
+        drain_timeout: float = INDEX_DRAIN_TIMEOUT,
+    ):
+        self.root = root
+        self.data_path = data_path
+        self.drain_timeout = drain_timeout
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {"state": "idle"}
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            self._status.update(fields)
+
+    def start(self) -> Dict[str, Any]:
+        """Start a rebuild in the background; RuntimeError if one is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise RuntimeError("An index rebuild is already running")
+            self._status = {"state": "building", "started_at": datetime.utcnow().isoformat()}
+            self._thread = threading.Thread(target=self._run, name="index-rebuild", daemon=True)
+            self._thread.start()
+            return dict(self._status)
+
+    def build(self, directory: str):
+        """Ingest the corpus into `directory`."""
+        processor = DataProcessor(directory)
+        processor.create_vector_stores()
+        processor.process_documents(load_corpus(self.data_path))
+        return processor
+
+    def replay(self, processor: DataProcessor, queue: IngestQueue) -> Dict[str, Any]:
+        """Add the theses submitted through the API (and the digests) to a built version."""
+        for records in queue.ingested_records():
+            upsert_corpus(records, processor.abstract_store, processor.content_store)
+        if DIGEST_ENABLED:
+            build_digests(processor, root=self.root)
+        return processor.get_store_stats()
+
+    def _run(self) -> None:
+        lower_thread_priority(INDEX_REBUILD_NICE)
+        directory = new_version_directory(self.root)
+        self._update(version=directory)
+        logger.info(f"Rebuilding the index into {directory}")
+        worker = IngestWorker.get_instance()
+        with ExitStack() as paused:
+            try:
+                processor = self.build(directory)
+                # No API ingestion in any process from here to the swap, so that everything stored is in the
+                # new version; the ingested records are read once the batches already running have finished
+                paused.enter_context(worker.paused())
+                stats = self.replay(processor, worker.queue)
+                instance = SystemManager.create(processor.abstract_store, processor.content_store, directory)
+            except Exception as e:
+                logger.error(f"Index rebuild failed: {str(e)}")
+                remove_index_directory(directory, self.root)
+                self._update(state="failed", error=str(e), finished_at=datetime.utcnow().isoformat())
+                return
+
+            swapped_at = time.monotonic()
+            previous, previous_directory = SystemManager.activate(instance, directory)
+        self._update(state="draining", stats=stats, swapped_at=datetime.utcnow().isoformat())
+        if previous is not None:
+            self.retire(previous, previous_directory, swapped_at)
+        self._update(state="completed", finished_at=datetime.utcnow().isoformat())
+
+    def retire(self, instance, directory: str, swapped_at: float) -> None:
+        """Close a swapped-out index version once this worker's requests are done with it."""
+        remaining = max(0.0, swapped_at + self.drain_timeout - time.monotonic())
+        if not SystemManager.retire(instance, directory, remaining):
+            # Removed by the last of the other workers to switch over
+            logger.info(f"{directory} is still in use by another worker, which removes it when done")
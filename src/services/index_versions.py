@@ -0,0 +1,149 @@
+"""
+Layout of the versioned vector store directories.
+
+The original layout keeps the collections directly in PERSIST_DIRECTORY.
+Rebuilds write each new index to PERSIST_DIRECTORY/versions/<version>, and
+PERSIST_DIRECTORY/CURRENT names the version in use. Every process reads the
+CURRENT file, so a version that one worker swaps in is picked up by the others.
+
+Processes that build or change an index on disk hold `index_lock(root)`, a
+file lock next to the root, so that only one of them does so at a time. Every
+process serving from a directory holds a shared lock on the directory (see
+`hold_index_directory`), and a retired directory is only removed once no
+process holds it anymore. Chroma does not support several processes writing
+to the same collections, so only the process holding `ingest_leader_lock(root)`
+ingests submitted theses.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+from ..config.settings import PERSIST_DIRECTORY
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+# Lock file in each index directory, held shared by the processes serving from it
+IN_USE_FILE = ".in_use"
+# Subdirectories DataProcessor creates for its collections
+STORE_SUBDIRS = ("abstract", "content", "digest")
+
+
+@contextmanager
+def index_lock(root: str = PERSIST_DIRECTORY) -> Iterator[None]:
+    """
+    Exclusive lock across processes (and threads) for changing the index under
+    `root`. The lock file sits beside `root`, not in it, since an existing root
+    is what marks the original layout as built.
+    """
+    root = os.path.abspath(root)
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    with open(f"{root}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def active_persist_directory(root: str = PERSIST_DIRECTORY) -> str:
+    """The directory of the index in use: the version named in CURRENT, or `root` itself."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return root
+    return os.path.join(root, VERSIONS_DIR, version) if version else root
+
+
+def new_version_directory(root: str = PERSIST_DIRECTORY) -> str:
+    """A fresh directory to build the next index version in."""
+    versions = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    version = time.strftime("v%Y%m%d-%H%M%S")
+    path = os.path.join(versions, version)
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(versions, f"{version}-{suffix}")
+    os.makedirs(path)
+    return path
+
+
+def set_active_version(directory: str, root: str = PERSIST_DIRECTORY) -> None:
+    """Point CURRENT at `directory` (a version directory under `root`), atomically."""
+    path = os.path.join(root, CURRENT_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(os.path.basename(directory))
+    os.replace(tmp, path)
+
+
+def remove_index_directory(directory: str, root: str = PERSIST_DIRECTORY) -> None:
+    """Delete a retired index; for the original layout, only its collections."""
+    if os.path.abspath(directory) == os.path.abspath(root):
+        for subdir in STORE_SUBDIRS:
+            shutil.rmtree(os.path.join(root, subdir), ignore_errors=True)
+    else:
+        shutil.rmtree(directory, ignore_errors=True)
+    logger.info(f"Removed retired index at {directory}")
+
+
+def ingest_leader_lock(root: str = PERSIST_DIRECTORY) -> Optional[IO]:
+    """
+    Try to become the process that ingests into the index under `root`; the
+    returned file holds the lock until it is closed (or the process exits).
+    None if another process holds it. Like `index_lock`, it sits beside `root`.
+    """
+    root = os.path.abspath(root)
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    f = open(f"{root}.ingest.lock", "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def hold_index_directory(directory: str) -> IO:
+    """Mark `directory` as in use by this process until the returned file is closed."""
+    f = open(os.path.join(directory, IN_USE_FILE), "a")
+    fcntl.flock(f, fcntl.LOCK_SH)
+    return f
+
+
+def remove_if_unused(directory: str, root: str = PERSIST_DIRECTORY) -> bool:
+    """Remove a retired index unless a process still holds it; True if it is gone."""
+    try:
+        f = open(os.path.join(directory, IN_USE_FILE), "a")
+    except FileNotFoundError:
+        return True
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        remove_index_directory(directory, root)
+        return True
+
+
+def remove_retired_versions(root: str = PERSIST_DIRECTORY) -> None:
+    """Remove the versions older than the active one that no process holds anymore."""
+    active = active_persist_directory(root)
+    if active == root:
+        return
+    versions = os.path.join(root, VERSIONS_DIR)
+    # Version names sort by creation time; newer ones may still be being built
+    for name in sorted(os.listdir(versions)):
+        directory = os.path.join(versions, name)
+        if name < os.path.basename(active) and os.path.isdir(directory):
+            remove_if_unused(directory, root)
+    if os.path.isdir(os.path.join(root, "content")):
+        remove_if_unused(root, root)
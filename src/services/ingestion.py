@@ -0,0 +1,352 @@
+"""
+Background ingestion of theses submitted through the API.
+
+`POST /api/v1/documents` stores the submitted records as a job in a SQLite
+queue (INGEST_QUEUE_DB_PATH) and returns at once. Every server process runs
+an `IngestWorker` thread, but only the one holding the ingestion leader lock
+(see `index_versions.ingest_leader_lock`) claims queued jobs, since Chroma
+does not support several processes writing to the same collections; another
+worker takes over if the leader exits. The leader upserts the theses into
+the abstract and content stores (and digests, when enabled) in batches of
+INGEST_BATCH_SIZE, saving the job's progress after each batch and bumping the
+index generation, on which the other workers reopen their stores to see the
+new rows. A job interrupted by a restart is resumed from its last saved batch.
+
+To leave the CPU to queries, the worker runs at a raised nice value and only
+starts a batch when no query is in flight (or it has waited INGEST_MAX_DEFER
+seconds for one). Index rebuilds pause ingestion in every process sharing
+the queue (a pause row in the queue file, which claiming and starting a batch
+honour), wait for the batches already running, and replay every ingested
+record into the new version, so API submissions survive a rebuild.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..config.settings import (
+    INGEST_BATCH_SIZE,
+    INGEST_MAX_DEFER,
+    INGEST_NICE,
+    INGEST_PAUSE_TTL,
+    INGEST_POLL_INTERVAL,
+    INGEST_QUEUE_DB_PATH,
+    INGEST_STALE_AFTER,
+    PERSIST_DIRECTORY,
+)
+from ..utils.helpers import lower_thread_priority
+from .data_processor import upsert_corpus
+from .digest_builder import DigestBuilder, digest_id
+from .index_versions import ingest_leader_lock
+from .system_manager import SystemManager
+
+logger = logging.getLogger(__name__)
+
+# Columns reported by the job status endpoints
+JOB_FIELDS = ("id", "state", "total", "processed", "abstracts", "chunks", "error",
+              "created_at", "started_at", "finished_at")
+
+
+class IngestQueue:
+    """Persistent queue of ingestion jobs, shared by all processes using the same file."""
+
+    def __init__(self, path: str = INGEST_QUEUE_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            "id TEXT PRIMARY KEY, state TEXT NOT NULL, records TEXT NOT NULL, total INTEGER NOT NULL, "
+            "processed INTEGER NOT NULL DEFAULT 0, abstracts INTEGER NOT NULL DEFAULT 0, "
+            "chunks INTEGER NOT NULL DEFAULT 0, error TEXT, created_at TEXT NOT NULL, "
+            "started_at TEXT, finished_at TEXT, heartbeat REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ingest_jobs_state ON ingest_jobs (state, created_at)")
+        # Pauses in effect (until they expire, unless their holder renews them) and batches running
+        self._conn.execute("CREATE TABLE IF NOT EXISTS ingest_pauses (holder TEXT PRIMARY KEY, expires REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS ingest_batches (job_id TEXT PRIMARY KEY, started REAL NOT NULL)")
+
+    def _row(self, row) -> Dict[str, Any]:
+        return dict(zip(JOB_FIELDS, row))
+
+    def enqueue(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingest_jobs (id, state, records, total, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(records), len(records), datetime.utcnow().isoformat()),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM ingest_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    @contextmanager
+    def _immediate(self):
+        # IMMEDIATE takes the write lock up front, so the reads and writes of the block are
+        # atomic across processes
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _paused(self, now: float) -> bool:
+        return self._conn.execute("SELECT 1 FROM ingest_pauses WHERE expires > ? LIMIT 1", (now,)).fetchone() is not None
+
+    def claim(self, stale_after: float = INGEST_STALE_AFTER) -> Optional[Tuple[str, List[Dict[str, Any]], int]]:
+        """
+        Take the oldest queued job (or a running one whose worker stopped saving
+        progress): its id, records and the number of records already processed.
+        Nothing is claimed while ingestion is paused.
+        """
+        now = time.time()
+        with self._immediate():
+            if self._paused(now):
+                return None
+            row = self._conn.execute(
+                "SELECT id, records, processed FROM ingest_jobs "
+                "WHERE state = 'queued' OR (state = 'running' AND heartbeat < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - stale_after,),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE ingest_jobs SET state = 'running', heartbeat = ?, "
+                    "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (now, datetime.utcnow().isoformat(), row[0]),
+                )
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def pause(self, holder: str, ttl: float) -> None:
+        """Pause ingestion in every process for `ttl` seconds (renewed by calling again)."""
+        with self._immediate():
+            self._conn.execute("INSERT OR REPLACE INTO ingest_pauses VALUES (?, ?)", (holder, time.time() + ttl))
+
+    def resume(self, holder: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ingest_pauses WHERE holder = ?", (holder,))
+
+    def begin_batch(self, job_id: str) -> bool:
+        """Record that a batch of the job starts, unless ingestion is paused (False)."""
+        now = time.time()
+        with self._immediate():
+            # Waiting out a pause is not stalling: keep the job from being taken over
+            self._conn.execute("UPDATE ingest_jobs SET heartbeat = ? WHERE id = ?", (now, job_id))
+            if self._paused(now):
+                return False
+            self._conn.execute("INSERT OR REPLACE INTO ingest_batches VALUES (?, ?)", (job_id, now))
+        return True
+
+    def end_batch(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ingest_batches WHERE job_id = ?", (job_id,))
+
+    def batches_running(self, stale_after: float = INGEST_STALE_AFTER) -> int:
+        """Batches started in any process and not finished (ignoring those of dead workers)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM ingest_batches WHERE started > ?", (time.time() - stale_after,)
+            ).fetchone()[0]
+
+    def progress(self, job_id: str, processed: int, abstracts: int, chunks: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET processed = ?, abstracts = abstracts + ?, chunks = chunks + ?, "
+                "heartbeat = ? WHERE id = ?",
+                (processed, abstracts, chunks, time.time(), job_id),
+            )
+
+    def requeue(self, job_id: str) -> None:
+        """Hand a running job back to the queue, keeping its progress."""
+        with self._lock:
+            self._conn.execute("UPDATE ingest_jobs SET state = 'queued' WHERE id = ?", (job_id,))
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET state = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("failed" if error else "completed", error, datetime.utcnow().isoformat(), job_id),
+            )
+
+    def ingested_records(self) -> Iterator[List[Dict[str, Any]]]:
+        """The records already added to the stores, job by job in submission order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT records, processed FROM ingest_jobs WHERE processed > 0 ORDER BY created_at"
+            ).fetchall()
+        for records, processed in rows:
+            yield json.loads(records)[:processed]
+
+
+class IngestWorker:
+    """Processes the jobs of an `IngestQueue` on a low-priority background thread."""
+    _instance = None
+
+    @classmethod
+    def get_instance(cls) -> "IngestWorker":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(
+        self,
+        queue: Optional[IngestQueue] = None,
+        root: str = PERSIST_DIRECTORY,
+        batch_size: int = INGEST_BATCH_SIZE,
+        max_defer: float = INGEST_MAX_DEFER,
+        poll_interval: float = INGEST_POLL_INTERVAL,
+        pause_ttl: float = INGEST_PAUSE_TTL,
+    ):
+        self.queue = queue or IngestQueue()
+        self.root = root
+        self.batch_size = batch_size
+        self.max_defer = max_defer
+        self.poll_interval = poll_interval
+        self.pause_ttl = pause_ttl
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop after the current batch; an unfinished job is resumed by the next worker."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        job = self.queue.enqueue(records)
+        self._wakeup.set()
+        return job
+
+    @contextmanager
+    def paused(self):
+        """
+        Hold off new batches in every process sharing the queue for the duration
+        of the block, waiting for the batches already running.
+        """
+        holder = uuid.uuid4().hex
+        self.queue.pause(holder, self.pause_ttl)
+        # The pause expires unless renewed, so a process that dies while holding it does not stop ingestion
+        released = threading.Event()
+
+        def renew():
+            while not released.wait(self.pause_ttl / 3):
+                self.queue.pause(holder, self.pause_ttl)
+
+        renewer = threading.Thread(target=renew, name="ingest-pause", daemon=True)
+        renewer.start()
+        try:
+            while self.queue.batches_running():
+                time.sleep(0.05)
+            yield
+        finally:
+            released.set()
+            renewer.join()
+            self.queue.resume(holder)
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        lower_thread_priority(INGEST_NICE)
+        # Wait to become the leader, which holds the lock for as long as it runs
+        lead = ingest_leader_lock(self.root)
+        while lead is None:
+            if self._stopping.wait(self.poll_interval):
+                return
+            lead = ingest_leader_lock(self.root)
+        logger.info(f"Process {os.getpid()} is the ingestion leader")
+        with lead:
+            self._process_jobs()
+
+    def _process_jobs(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not claim an ingestion job: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.process(*job)
+
+    def process(self, job_id: str, records: List[Dict[str, Any]], processed: int = 0) -> None:
+        logger.info(f"Ingesting job {job_id}: {len(records) - processed} of {len(records)} theses left")
+        try:
+            while processed < len(records):
+                if self._stopping.is_set():
+                    self.queue.requeue(job_id)
+                    return
+                processed = self._run_batch(job_id, records, processed)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+            self.queue.finish(job_id, error=str(e))
+            return
+        self.queue.finish(job_id)
+        logger.info(f"Ingestion job {job_id} completed")
+
+    def _run_batch(self, job_id: str, records: List[Dict[str, Any]], processed: int) -> int:
+        # Let queries go first: wait (a bounded time) for the ones in flight to finish
+        SystemManager.wait_idle(self.max_defer)
+        while not self.queue.begin_batch(job_id):
+            # Paused by an index rebuild, possibly in another process
+            if self._stopping.is_set():
+                return processed
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+        try:
+            batch = records[processed:processed + self.batch_size]
+            with SystemManager.lease() as rag_system:
+                abstract_docs, chunks = upsert_corpus(batch, rag_system.abstract_store, rag_system.content_store)
+                if rag_system.digest_store is not None and abstract_docs:
+                    self._build_digests(rag_system, abstract_docs)
+            # Other workers reopen their stores on the new generation; this one already sees the rows
+            SystemManager.bump_generation(self.root)
+            processed += len(batch)
+            self.queue.progress(job_id, processed, len(abstract_docs), len(chunks))
+        finally:
+            self.queue.end_batch(job_id)
+        return processed
+
+    @staticmethod
+    def _build_digests(rag_system, abstract_docs) -> None:
+        # A replaced thesis gets a new digest
+        rag_system.digest_store.delete(ids=[digest_id(doc.metadata) for doc in abstract_docs])
+        DigestBuilder(rag_system.stage_llms["digest"], rag_system.digest_store).build(abstract_docs)
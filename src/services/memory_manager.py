@@ -1,70 +1,160 @@
 import logging
 import traceback
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, MessagesState, StateGraph
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-from ..config.settings import MEMORY_LIMIT
+from ..config.settings import MEMORY_TOKEN_BUDGET, MEMORY_SUMMARY_MAX_TOKENS
+from ..config.prompt_settings import MEMORY_SUMMARY_TEMPLATE
+from ..models.history_models import ChatMessage, SessionLocal
+from ..utils.helpers import estimate_tokens
+from ..utils.logging_config import log_payload
+from ..utils.tracing import StageTracingHandler, trace_stage
+from .checkpointer import SQLiteCheckpointer
+
+# Thread of queries sent without a chat id
+DEFAULT_THREAD_ID = "1"
+
+
+class MemoryState(MessagesState):
+    """Conversation state: recent messages kept verbatim plus a running summary of older turns."""
+    summary: str
+
+
+def count_tokens(messages) -> int:
+    return sum(estimate_tokens(m.content) for m in messages)
+
+
+def truncate_message(message, budget):
+    """A copy of `message` cut down to about `budget` tokens (same id, so it still matches the stored one)."""
+    if estimate_tokens(message.content) <= budget or not isinstance(message.content, str):
+        return message
+    content = message.content[:budget * 4] + " ... [truncated]"
+    return message.model_copy(update={"content": content})
+
+
+def split_window(messages, budget):
+    """
+    Split messages into (older, recent), where recent is the longest suffix
+    that fits in `budget` tokens. The last message is always recent, even if
+    it alone is over the budget (see `truncate_message`).
+    """
+    used = 0
+    start = len(messages)
+    while start > 0:
+        cost = estimate_tokens(messages[start - 1].content)
+        if start < len(messages) and used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    # Don't start the window on a tool message, it needs the call that produced it
+    while 0 < start < len(messages) and messages[start].type == "tool":
+        start -= 1
+    return messages[:start], messages[start:]
+
+
+def load_history(chat_id, budget=MEMORY_TOKEN_BUDGET):
+    """
+    The stored messages of a chat, as LangChain messages, for rebuilding its
+    memory when no checkpoint exists. Only the most recent messages that fit
+    in `budget` tokens are kept, so a rebuild never needs a summarization call.
+    """
+    with SessionLocal() as db:
+        rows = (
+            db.query(ChatMessage.role, ChatMessage.content)
+            .filter(ChatMessage.session_id == chat_id)
+            .order_by(ChatMessage.id)
+            .all()
+        )
+    messages = [
+        AIMessage(content=content) if role == "assistant" else HumanMessage(content=content)
+        for role, content in rows
+    ]
+    if not messages:
+        return []
+    _, recent = split_window(messages, budget)
+    # A rebuilt window starts with a question, as the live one does
+    while recent and recent[0].type != "human":
+        recent = recent[1:]
+    return recent[:-1] + [truncate_message(recent[-1], budget)] if recent else []
+
 
 class RAGMemoryManager:
-    def __init__(self, rag_system):
+    def __init__(self, rag_system, checkpointer=None):
         logger.info("Initializing RAGMemoryManager")
         self.rag_system = rag_system
-        self.memory = MemorySaver()
-        self.workflow = StateGraph(state_schema=MessagesState)
+        self.memory = checkpointer or SQLiteCheckpointer()
+        self.workflow = StateGraph(state_schema=MemoryState)
+        self.summary_chain = (
+            ChatPromptTemplate.from_template(MEMORY_SUMMARY_TEMPLATE)
+            | rag_system.stage_llms["summary"]
+            | StrOutputParser()
+        ).with_config(run_name="memory_summary")
         self.setup_workflow()
 
+    def summarize(self, summary, messages):
+        """Fold `messages` into the running summary."""
+        transcript = "\n".join(f"{m.type}: {truncate_message(m, MEMORY_TOKEN_BUDGET).content}" for m in messages)
+        new_summary = self.summary_chain.invoke({
+            "summary": summary or "(empty)",
+            "messages": transcript,
+            "max_words": int(MEMORY_SUMMARY_MAX_TOKENS * 0.75),
+        })
+        # The model does not always respect the length limit; the summary must stay bounded
+        return new_summary.strip()[:MEMORY_SUMMARY_MAX_TOKENS * 4]
+
     def setup_workflow(self):
         logger.info("Setting up workflow with memory")
         
         # Define the function that processes queries with memory
-        def process_with_memory(state: MessagesState):
+        def process_with_memory(state: MemoryState):
             logger.info("Processing query with memory")
-            # messages = state["messages"]
-            
-            # Limit to the last k messages
-            messages = []
-            for m in state["messages"][::-1]:
-                messages.append(m)
-                if len(messages) >= MEMORY_LIMIT:
-                    if messages[-1].type != "tool":
-                        break
-                    
-            messages = messages[::-1]
-
-            print("---messages--- in process_with_memory")
-            print(messages)
+            messages = state["messages"]
+            summary = state.get("summary", "")
+            removed = []
+
+            # Over budget: compact down to half the budget so that summarization
+            # only runs every few turns rather than on every turn
+            if count_tokens(messages) > MEMORY_TOKEN_BUDGET:
+                older, messages = split_window(messages, MEMORY_TOKEN_BUDGET // 2)
+                if older:
+                    logger.info(f"Summarizing {len(older)} older messages")
+                    summary = self.summarize(summary, older)
+                    removed = [RemoveMessage(id=m.id) for m in older]
+
+            # A single message over the whole budget is cut down for the model (the checkpoint keeps it whole)
+            messages = messages[:-1] + [truncate_message(messages[-1], MEMORY_TOKEN_BUDGET)]
+
+            context = messages
+            if summary:
+                context = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] + messages
+
+            log_payload(logger, "Memory context: %s", context)
             
             # Process the last message using RAG system
             query = messages[-1].content
-            logger.info(f"Current query in memory context: {query}")
-            logger.info(f"Total messages in memory: {len(messages)}")
+            log_payload(logger, "Current query in memory context: %s", query)
+            logger.info(f"Messages in memory window: {len(messages)} (~{count_tokens(context)} tokens)")
             
             # Use the direct processing method instead of process_query
-            answer = self.rag_system.full_chain.invoke({"messages": messages})
+            answer = self.rag_system.full_chain.invoke({"messages": context})
+
+            log_payload(logger, "Answer from RAG system: %s", answer)
 
-            print("---answer--- in process_with_memory")
-            print(answer)
-            
             logger.info("Query processed through RAG system")
             
             # Create an AI message with just the response
             ai_message = AIMessage(content=answer)
-
-            print("---ai_message--- in process_with_memory")
-            print(ai_message)
             
-            # Return both the message for memory and the full result
+            # Summarized messages are dropped from the checkpoint, the summary replaces them
             return {
-                "messages": [ai_message],
-                # only messages will actually be returned
-                # "type": result['type'],
-                # "docs": result['docs'] if 'docs' in result else [],
-                # "_result": result  # Use a different key that won't be processed as a message
+                "messages": removed + [ai_message],
+                "summary": summary,
             }
 
         # Define the workflow
@@ -75,28 +165,36 @@ class RAGMemoryManager:
         logger.info("Compiling workflow with memory checkpointing")
         self.app = self.workflow.compile(checkpointer=self.memory)
 
-    def process_query_with_memory(self, query, message_history=None):
+    def process_query_with_memory(self, query, chat_id=None):
         """
         Process a query while maintaining conversation history
         
         Args:
             query: Can be either a string or a list of messages
-            message_history: Optional previous conversation history
+            chat_id: Id of the chat the query belongs to; its memory is checkpointed under this id
         """
         try:
             logger.info(f"Processing query with memory")
+            thread_id = chat_id or DEFAULT_THREAD_ID
+            config = {"configurable": {"thread_id": thread_id}}
 
-            result = self.app.invoke(
-                {"messages": query},
-                config={"configurable": {"thread_id": "1"}}
-            )
-            logger.info("Successfully processed query with memory")
+            messages = [HumanMessage(content=query)] if isinstance(query, str) else list(query)
+            # No checkpoint yet (new worker, pruned or pre-existing chat): rebuild from the stored history
+            if chat_id and self.memory.get_tuple(config) is None:
+                history = load_history(chat_id)
+                if history:
+                    logger.info(f"Rebuilding memory of chat {chat_id} from {len(history)} stored messages")
+                    messages = history + messages
 
-            print("---result--- in process_query_with_memory")
-            print(result)
+            # The tracing handler is inherited by every runnable invoked inside the graph
+            with trace_stage("memory"):
+                result = self.app.invoke(
+                    {"messages": messages},
+                    config={**config, "callbacks": [StageTracingHandler()]},
+                )
+            logger.info("Successfully processed query with memory")
 
-            print("result['messages'][-1]")
-            print(result["messages"][-1])
+            log_payload(logger, "Last message in memory: %s", result["messages"][-1])
             
             # Return the full result dictionary that includes type, docs, and response
             return {
@@ -0,0 +1,400 @@
+"""
+Quantized first-pass vector search with full-precision rescoring.
+
+`QuantizedIndex` keeps int8 (4x smaller) or binary (32x smaller) codes of the
+embeddings in memory and the float32 vectors in a file on disk that is only
+memory-mapped. A query scans the codes for a shortlist of `k * rescore_factor`
+candidates, then rescores just that shortlist with the exact vectors, so only
+those pages of the vector file are ever read.
+
+A loaded index maps its code file read-only as well, so the server workers
+(see `src/serve.py`) share one copy of the codes through the page cache.
+
+Several processes may change the same index (every server worker runs an
+ingestion worker): a change takes a file lock in the index directory and
+first reloads what other processes saved, so rows are never numbered from a
+stale state, and a search reloads the index once another process has saved it.
+
+`QuantizedChroma` is a Chroma collection whose similarity searches go through
+such an index; Chroma still stores the documents and metadata and evaluates
+metadata filters, but its own (float32, in-memory) vector index is not queried.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from ..config.settings import QUANTIZED_FILTER_CACHE_SIZE, QUANTIZED_RESCORE_FACTOR
+
+logger = logging.getLogger(__name__)
+
+MODES = ("int8", "binary")
+# Number of set bits of every byte value, for Hamming distances between packed binary codes
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int32)
+# Rows scored per step of the first pass, which bounds its temporary memory
+_SCAN_BLOCK = 65536
+
+
+class QuantizedIndex:
+    def __init__(self, path: str, mode: str = "int8", dim: Optional[int] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.dim = dim
+        # Row order of the files; None marks a removed row
+        self.ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        # Rows of removed ids, left out of the first pass
+        self._removed = np.empty(0, dtype=np.int64)
+        self.codes: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+        self.center: Optional[np.ndarray] = None
+        self.vectors: Optional[np.memmap] = None
+        # Changes on every add or remove, so that derived data (e.g. filter results) can be cached
+        self.version = 0
+        # Mutations build new arrays and swap them in under the lock; a search takes a
+        # consistent snapshot of them under the lock and then runs without it
+        self._lock = threading.Lock()
+        # Serializes mutations (and reloads) within the process; `exclusive()` holds it together
+        # with the file lock, re-entrantly, so that waiting for another process does not hold up searches
+        self._mutation_lock = threading.RLock()
+        self._file_lock = None
+        # Identity of the index.json this process last loaded or saved
+        self._stamp: Optional[Tuple[int, ...]] = None
+
+    # Files ------------------------------------------------------------------
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, "index.json"))
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        with open(os.path.join(path, "index.json")) as f:
+            meta = json.load(f)
+        index = cls(path, meta["mode"], meta["dim"])
+        index._read()
+        return index
+
+    def _disk_stamp(self) -> Optional[Tuple[int, ...]]:
+        # index.json is replaced (new inode) on every save
+        try:
+            stat = os.stat(os.path.join(self.path, "index.json"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size
+
+    def _read(self) -> None:
+        stamp = self._disk_stamp()
+        with open(os.path.join(self.path, "index.json")) as f:
+            meta = json.load(f)
+        ids = meta["ids"]
+        rows = {id_: row for row, id_ in enumerate(ids) if id_ is not None}
+        removed = np.array([row for row, id_ in enumerate(ids) if id_ is None], dtype=np.int64)
+        codes = np.load(os.path.join(self.path, "codes.npy"), mmap_mode="r")
+        scale = np.load(os.path.join(self.path, "scale.npy")) if self.mode == "int8" else None
+        center = np.load(os.path.join(self.path, "center.npy")) if self.mode == "binary" else None
+        self.dim = meta["dim"]
+        vectors = self._map_vectors(len(ids))
+        self._swap(ids, rows, removed, codes, vectors, scale, center)
+        self._stamp = stamp
+
+    def _swap(self, ids, rows, removed, codes, vectors, scale, center) -> None:
+        with self._lock:
+            self.ids, self._rows, self._removed, self.codes, self.vectors = ids, rows, removed, codes, vectors
+            self.scale, self.center = scale, center
+            self.version += 1
+
+    def refresh(self) -> bool:
+        """Reload the index if another process has saved it since; True if it was reloaded."""
+        if self._disk_stamp() == self._stamp:
+            return False
+        with self._mutation_lock:
+            if self._disk_stamp() in (self._stamp, None):
+                return False
+            self._read()
+        logger.info(f"Reloaded the quantized index at {self.path}: {len(self.ids)} vectors")
+        return True
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Hold the index against changes by other threads and processes, with
+        what they saved loaded first. Every change runs inside it.
+        """
+        with self._mutation_lock:
+            if self._file_lock is not None:
+                # Nested in a block of this thread that holds it already
+                yield
+                return
+            os.makedirs(self.path, exist_ok=True)
+            self._file_lock = open(os.path.join(self.path, "index.lock"), "a")
+            try:
+                fcntl.flock(self._file_lock, fcntl.LOCK_EX)
+                self.refresh()
+                yield
+            finally:
+                self._file_lock.close()
+                self._file_lock = None
+
+    def _save_array(self, name: str, array: np.ndarray) -> None:
+        # Written next to the file and renamed over it, so processes that have the old file
+        # mapped keep reading it instead of a truncated one
+        tmp = os.path.join(self.path, f"{name}.tmp.npy")
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    def save(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        self._save_array("codes.npy", self.codes)
+        if self.scale is not None:
+            self._save_array("scale.npy", self.scale)
+        if self.center is not None:
+            self._save_array("center.npy", self.center)
+        tmp = os.path.join(self.path, "index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"mode": self.mode, "dim": self.dim, "ids": self.ids}, f)
+        os.replace(tmp, os.path.join(self.path, "index.json"))
+        self._stamp = self._disk_stamp()
+
+    def _map_vectors(self, rows: int) -> Optional[np.memmap]:
+        if not rows:
+            return None
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    # Building ---------------------------------------------------------------
+    def _quantize(self, vectors: np.ndarray, scale: Optional[np.ndarray], center: Optional[np.ndarray]) -> np.ndarray:
+        if self.mode == "binary":
+            return np.packbits(vectors > center, axis=1)
+        return np.clip(np.round(vectors / scale), -127, 127).astype(np.int8)
+
+    def build(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self.exclusive():
+            self.dim = vectors.shape[1]
+            # Calibrated on the vectors being indexed: a symmetric per-dimension scale for int8, and
+            # the mean vector for binary codes (so that each bit splits the corpus rather than the origin)
+            scale = center = None
+            if self.mode == "int8":
+                scale = np.maximum(np.abs(vectors).max(axis=0), 1e-6).astype(np.float32) / 127
+            else:
+                center = vectors.mean(axis=0)
+            vectors.tofile(self._vectors_path + ".tmp")
+            os.replace(self._vectors_path + ".tmp", self._vectors_path)
+            ids = list(ids)
+            rows = {id_: row for row, id_ in enumerate(ids)}
+            codes = self._quantize(vectors, scale, center)
+            self._swap(ids, rows, np.empty(0, dtype=np.int64), codes, self._map_vectors(len(ids)), scale, center)
+            self.save()
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """Append vectors (the quantization stays as calibrated at build time)."""
+        with self.exclusive():
+            if self.codes is None:
+                return self.build(ids, vectors)
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            with open(self._vectors_path, "r+b") as f:
+                # Rows an interrupted add appended without saving the ids are overwritten
+                f.truncate(len(self.ids) * self.dim * vectors.itemsize)
+                f.seek(0, os.SEEK_END)
+                vectors.tofile(f)
+            new_ids = self.ids + list(ids)
+            rows = dict(self._rows)
+            rows.update({id_: row for row, id_ in enumerate(ids, start=len(self.ids))})
+            codes = np.concatenate([self.codes, self._quantize(vectors, self.scale, self.center)])
+            self._swap(new_ids, rows, self._removed, codes, self._map_vectors(len(new_ids)), self.scale, self.center)
+            self.save()
+
+    def remove(self, ids: Sequence[str]) -> None:
+        """Drop ids from search results; their rows stay in the files until the next build."""
+        with self.exclusive():
+            removed = [self._rows[id_] for id_ in ids if id_ in self._rows]
+            if not removed:
+                return
+            new_ids = list(self.ids)
+            for row in removed:
+                new_ids[row] = None
+            rows = {id_: row for id_, row in self._rows.items() if new_ids[row] is not None}
+            removed = np.union1d(self._removed, np.asarray(removed, dtype=np.int64))
+            self._swap(new_ids, rows, removed, self.codes, self.vectors, self.scale, self.center)
+            self.save()
+
+    def rows_of(self, ids: Sequence[str]) -> np.ndarray:
+        """Rows of the given ids that are in the index, for `search(allowed_rows=...)`."""
+        rows = self._rows
+        return np.fromiter((rows[id_] for id_ in ids if id_ in rows), dtype=np.int64)
+
+    # Search -----------------------------------------------------------------
+    def memory_bytes(self) -> int:
+        """Bytes held in memory (the full-precision vectors are only mapped)."""
+        calibration = self.scale if self.mode == "int8" else self.center
+        return self.codes.nbytes + calibration.nbytes
+
+    def _first_pass(self, codes: np.ndarray, calibration: np.ndarray, query: np.ndarray,
+                    rows: Optional[np.ndarray]) -> np.ndarray:
+        """Approximate score of every candidate row, higher is closer."""
+        if rows is not None:
+            codes = codes[rows]
+        scores = np.empty(len(codes), dtype=np.float32)
+        if self.mode == "binary":
+            query_bits = np.packbits(query > calibration)
+            for start in range(0, len(codes), _SCAN_BLOCK):
+                block = codes[start:start + _SCAN_BLOCK]
+                scores[start:start + len(block)] = -_POPCOUNT[np.bitwise_xor(block, query_bits)].sum(axis=1)
+        else:
+            weights = query * calibration
+            for start in range(0, len(codes), _SCAN_BLOCK):
+                block = codes[start:start + _SCAN_BLOCK]
+                scores[start:start + len(block)] = block.astype(np.float32) @ weights
+        return scores
+
+    def search(self, query: Sequence[float], k: int = 4, rescore_factor: Optional[int] = None,
+               allowed_ids: Optional[Sequence[str]] = None,
+               allowed_rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        The `k` nearest ids with their squared L2 distance (Chroma's default
+        distance), optionally restricted to `allowed_ids` (or their `rows_of`).
+        """
+        # Documents added or removed by other processes
+        self.refresh()
+        with self._lock:
+            ids, codes, vectors, removed = self.ids, self.codes, self.vectors, self._removed
+            calibration = self.scale if self.mode == "int8" else self.center
+            if allowed_ids is not None:
+                allowed_rows = self.rows_of(allowed_ids)
+        if not ids or codes is None:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        rows = allowed_rows
+        if rows is not None:
+            # Rows of an older version may have been removed since
+            rows = rows[rows < len(ids)]
+            if len(removed):
+                rows = rows[~np.isin(rows, removed)]
+            if not len(rows):
+                return []
+
+        scores = self._first_pass(codes, calibration, query, rows)
+        if rows is None and len(removed):
+            # Removed rows must not take shortlist slots from live ones
+            scores[removed] = -np.inf
+        factor = rescore_factor or QUANTIZED_RESCORE_FACTOR[self.mode]
+        shortlist = min(len(scores), k * factor)
+        candidates = np.argpartition(-scores, shortlist - 1)[:shortlist]
+        if rows is not None:
+            candidates = rows[candidates]
+        candidates = candidates[[ids[row] is not None for row in candidates]]
+        candidates.sort()  # sequential reads from the mapped file
+
+        exact = np.asarray(vectors[candidates])
+        distances = ((exact - query) ** 2).sum(axis=1)
+        best = np.argsort(distances)[:k]
+        return [(ids[candidates[i]], float(distances[i])) for i in best]
+
+
+class QuantizedChroma(Chroma):
+    """Chroma collection searched through a `QuantizedIndex` stored in `index_path`."""
+
+    def __init__(self, *args: Any, index_path: str, quantization: str = "int8", **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        if QuantizedIndex.exists(index_path):
+            self._quantized = QuantizedIndex.load(index_path)
+        else:
+            self._quantized = QuantizedIndex(index_path, quantization)
+        # (filter, index version) -> rows of the index matching the filter
+        self._filter_rows: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+        self._filter_lock = threading.Lock()
+        logger.info(
+            f"Quantized ({self._quantized.mode}) index at {index_path}: {len(self._quantized.ids)} vectors, "
+            f"{(self._quantized.memory_bytes() if self._quantized.codes is not None else 0) / 1e6:.1f} MB in memory"
+        )
+
+    @property
+    def quantized_index(self) -> QuantizedIndex:
+        return self._quantized
+
+    def rebuild_quantized_index(self, batch_size: int = 5000) -> None:
+        """(Re)build the index from the embeddings stored in the collection."""
+        ids, vectors = [], []
+        offset = 0
+        while True:
+            batch = self.get(include=["embeddings"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            ids.extend(batch["ids"])
+            vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+            offset += len(batch["ids"])
+        if ids:
+            self._quantized.build(ids, np.concatenate(vectors))
+        logger.info(f"Built quantized ({self._quantized.mode}) index of {len(ids)} vectors")
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs: Any) -> List[str]:
+        ids = super().add_texts(texts, metadatas=metadatas, ids=ids, **kwargs)
+        stored = self.get(ids=ids, include=["embeddings"])
+        self._quantized.add(stored["ids"], np.asarray(stored["embeddings"], dtype=np.float32))
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        super().delete(ids=ids, **kwargs)
+        if ids:
+            self._quantized.remove(ids)
+
+    def _rows_matching(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Index rows of the documents matching a metadata filter, cached until the index changes."""
+        key = (json.dumps(filter, sort_keys=True, default=str), self._quantized.version)
+        with self._filter_lock:
+            rows = self._filter_rows.get(key)
+            if rows is not None:
+                self._filter_rows.move_to_end(key)
+                return rows
+        # Metadata filters (e.g. from self-query) are evaluated by Chroma, without touching its vectors
+        rows = self._quantized.rows_of(self.get(where=filter, include=[])["ids"])
+        with self._filter_lock:
+            self._filter_rows[key] = rows
+            while len(self._filter_rows) > QUANTIZED_FILTER_CACHE_SIZE:
+                self._filter_rows.popitem(last=False)
+        return rows
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k: int = 4, filter=None, where_document=None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        self._quantized.refresh()
+        if where_document is not None or self._quantized.codes is None:
+            return super().similarity_search_by_vector_with_relevance_scores(
+                embedding, k=k, filter=filter, where_document=where_document, **kwargs
+            )
+        allowed = self._rows_matching(filter) if filter else None
+        hits = self._quantized.search(embedding, k, allowed_rows=allowed)
+        if not hits:
+            return []
+        stored = self.get(ids=[id_ for id_, _ in hits], include=["documents", "metadatas"])
+        by_id = {
+            id_: Document(page_content=text, metadata=metadata or {}, id=id_)
+            for id_, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+        return [(by_id[id_], distance) for id_, distance in hits if id_ in by_id]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter=None, where_document=None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, filter=filter, where_document=where_document, **kwargs
+        )]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter=None, where_document=None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self._embedding_function.embed_query(query), k=k, filter=filter, where_document=where_document, **kwargs
+        )
@@ -0,0 +1,148 @@
+"""
+Cache of vector search results, invalidated by the index generation.
+
+Identical searches (same collection, query text, metadata filter and k) are
+answered from an in-process LRU that maps them to the ranked chunk ids and
+scores of the first search; the chunks themselves are read back from the
+collection by id, so neither the embedding model nor the vector index is
+touched.
+
+Every entry is tagged with the index generation, a number stored in
+PERSIST_DIRECTORY that ingestion bumps after writing to the collections
+(`bump_index_generation`). Entries of an older generation are never served,
+so re-indexing needs no manual flush, in this process or any other.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from ..config.settings import PERSIST_DIRECTORY, RETRIEVAL_CACHE_ENABLED, RETRIEVAL_CACHE_MAX_ENTRIES
+from ..utils.metrics import CACHE_EVENTS
+from ..utils.singleflight import canonical_key
+
+logger = logging.getLogger(__name__)
+
+GENERATION_FILE = "index_generation"
+
+
+def read_index_generation(persist_directory: str = PERSIST_DIRECTORY) -> int:
+    try:
+        with open(os.path.join(persist_directory, GENERATION_FILE)) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def bump_index_generation(persist_directory: str = PERSIST_DIRECTORY) -> int:
+    """
+    Start a new index generation, invalidating every cached search result.
+    Generations are nanosecond timestamps, so concurrent bumps never collide.
+    """
+    generation = max(time.time_ns(), read_index_generation(persist_directory) + 1)
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, GENERATION_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(generation))
+    os.replace(tmp, path)
+    logger.info(f"Index generation is now {generation}")
+    return generation
+
+
+def _store_name(store) -> str:
+    collection = getattr(store, "_collection", None)
+    if collection is None:
+        return f"store-{id(store)}"
+    return f"{getattr(store, '_persist_directory', None) or ''}:{collection.name}"
+
+
+class RetrievalCache:
+    def __init__(self, persist_directory: str = PERSIST_DIRECTORY, max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES):
+        self.persist_directory = persist_directory
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, List[Tuple[str, float]]]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        # Read on every search (a few microseconds), so a bump by another process is seen at once
+        generation = read_index_generation(self.persist_directory)
+        if generation != self._generation:
+            with self._lock:
+                # Entries of older generations can never be served again
+                self._entries.clear()
+                self._generation = generation
+        return generation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str, generation: int) -> Optional[List[Tuple[str, float]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != generation:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _store(self, key: str, generation: int, hits: List[Tuple[str, float]]) -> None:
+        with self._lock:
+            self._entries[key] = (generation, hits)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _fetch(store, ids: List[str]) -> Optional[List[Document]]:
+        if not ids:
+            return []
+        stored = store.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            id_: Document(page_content=text, metadata=metadata or {}, id=id_)
+            for id_, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+        # A chunk deleted without a generation bump: search again rather than return fewer chunks
+        if len(by_id) != len(ids):
+            return None
+        return [by_id[id_] for id_ in ids]
+
+    def similarity_search(self, store, query: str, search_kwargs: Dict[str, Any]) -> List[Document]:
+        """`store.similarity_search(query, **search_kwargs)`, answered from the cache when possible."""
+        generation = self.generation()
+        key = canonical_key({"store": _store_name(store), "query": query, "kwargs": search_kwargs})
+
+        hits = self._lookup(key, generation)
+        if hits is not None:
+            docs = self._fetch(store, [id_ for id_, _ in hits])
+            if docs is not None:
+                CACHE_EVENTS.labels(cache="retrieval", result="hit").inc()
+                return docs
+        CACHE_EVENTS.labels(cache="retrieval", result="miss").inc()
+
+        results = store.similarity_search_with_score(query, **search_kwargs)
+        docs = [doc for doc, _ in results]
+        if all(doc.id for doc in docs):
+            self._store(key, generation, [(doc.id, float(score)) for doc, score in results])
+        return docs
+
+
+_retrieval_cache: Optional[RetrievalCache] = None
+
+
+def get_retrieval_cache() -> Optional[RetrievalCache]:
+    """Process-wide retrieval cache, or None when RETRIEVAL_CACHE_ENABLED is off."""
+    global _retrieval_cache
+    if not RETRIEVAL_CACHE_ENABLED:
+        return None
+    if _retrieval_cache is None:
+        _retrieval_cache = RetrievalCache()
+    return _retrieval_cache
@@ -0,0 +1,131 @@
+"""
+Speculative vector search while the router decides.
+
+Only the cheap part of retrieval is speculated: the question is embedded and
+searched (plain similarity search, no LLM call) in the store of each
+configured route. Self-query and fusion query generation cost LLM calls, so
+they only run once the router has confirmed the route, on the router's
+restated question as without speculation.
+
+The speculated results are handed over through a context variable: a search
+of the chosen route's store for the same text (the self-query search when it
+kept the question unchanged, or the adaptive fusion probe) and no filter is
+answered from them (`speculated_search`). A search for any other text or with
+a filter runs normally, so speculation does not change what is retrieved.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from ..utils.metrics import SPECULATION_EVENTS, SPECULATION_SAVED
+
+logger = logging.getLogger(__name__)
+
+_speculation: ContextVar[Optional["Speculation"]] = ContextVar("speculation", default=None)
+
+
+class Speculation:
+    """Vector searches started for one query before its route was known."""
+
+    def __init__(self, question: str, futures, stores: Dict[str, object], k: int):
+        self.question = question
+        self.futures = futures
+        self.stores = stores
+        self.k = k
+        self.chosen: Optional[str] = None
+        self.used = False
+        self._lock = threading.Lock()
+
+    def resolve(self, datasource: str) -> Optional[str]:
+        """Record the router's decision; searches of the other routes' stores are discarded."""
+        self.chosen = next((route for route in self.futures if route in datasource.lower()), None)
+        for route, future in self.futures.items():
+            if route != self.chosen:
+                future.cancel()
+                SPECULATION_EVENTS.labels(route=route, result="wasted").inc()
+        return self.chosen
+
+    def lookup(self, store, query: str, k: int) -> Optional[List[Tuple[Document, float]]]:
+        """The speculated (document, score) results for this search, if it is the one speculated."""
+        route = self.chosen
+        if route is None or self.stores[route] is not store or query.strip() != self.question or k > self.k:
+            return None
+        looked_up_at = time.perf_counter()
+        try:
+            results, started_at, finished_at = self.futures[route].result()
+        except Exception as e:
+            # Don't fail the query because of the speculative run; search again normally
+            logger.warning(f"Speculative search for {route} failed, searching again: {str(e)}")
+            SPECULATION_EVENTS.labels(route=route, result="failed").inc()
+            return None
+        with self._lock:
+            first_use, self.used = not self.used, True
+        if first_use:
+            # Serially, the search would only have started when it was needed
+            saved = max(0.0, min(finished_at, looked_up_at) - started_at)
+            SPECULATION_EVENTS.labels(route=route, result="used").inc()
+            SPECULATION_SAVED.labels(route=route).observe(saved)
+            logger.info(f"Speculative search for {route} saved {saved:.3f}s")
+        return results[:k]
+
+    def finish(self) -> None:
+        """Count the chosen route's search as wasted if nothing asked for it (e.g. the question was restated)."""
+        if self.chosen is not None and not self.used:
+            SPECULATION_EVENTS.labels(route=self.chosen, result="wasted").inc()
+
+
+def speculated_search(store, query: str, k: int) -> Optional[List[Tuple[Document, float]]]:
+    """(document, score) results of `store.similarity_search_with_score(query, k=k)` if speculated, else None."""
+    speculation = _speculation.get()
+    if speculation is None:
+        return None
+    return speculation.lookup(store, query, k)
+
+
+@contextmanager
+def use_speculation(speculation: Speculation):
+    """Let the searches run inside the block take the speculated results."""
+    token = _speculation.set(speculation)
+    try:
+        yield speculation
+    finally:
+        _speculation.reset(token)
+        speculation.finish()
+
+
+class SpeculativeRetrieval:
+    """
+    Starts the vector search of the configured routes concurrently with the router LLM call.
+
+    `stores` maps a route name (as matched against the router's datasource) to
+    a function returning the vector store its retrieval currently searches;
+    `k` must cover the largest plain search of those retrievals.
+    """
+
+    def __init__(self, stores: Dict[str, Callable[[], object]], routes: Iterable[str], k: int,
+                 max_workers: int = 8):
+        unknown = set(routes) - set(stores)
+        if unknown:
+            raise ValueError(f"Speculative retrieval is not supported for routes: {sorted(unknown)}")
+        self.stores = stores
+        self.routes = list(routes)
+        self.k = k
+        self._pool = ContextThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+
+    def _search(self, store, question: str):
+        started_at = time.perf_counter()
+        results = store.similarity_search_with_score(question, k=self.k)
+        return results, started_at, time.perf_counter()
+
+    def start(self, question: str) -> Speculation:
+        question = question.strip()
+        stores = {route: self.stores[route]() for route in self.routes}
+        futures = {route: self._pool.submit(self._search, store, question) for route, store in stores.items()}
+        return Speculation(question, futures, stores, self.k)
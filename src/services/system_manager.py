@@ -1,51 +1,281 @@
 import os
 import logging
-from typing import Optional
-from ..config.settings import DATA_PATH, PERSIST_DIRECTORY
+import threading
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, Optional, Tuple
+from ..config.settings import DATA_PATH, PERSIST_DIRECTORY, DIGEST_ENABLED, INDEX_DRAIN_TIMEOUT
 from .data_processor import preprocess_and_store_data, DataProcessor
 from .business_logic import RAGSystem
+from .index_versions import (
+    active_persist_directory,
+    hold_index_directory,
+    index_lock,
+    remove_if_unused,
+    remove_retired_versions,
+    set_active_version,
+)
+from .retrieval_cache import bump_index_generation, read_index_generation
 
 logger = logging.getLogger(__name__)
 
 class SystemManager:
     _instance: Optional[RAGSystem] = None
-    
+    # Index directory the instance serves from, under the root it was initialized with
+    _directory: Optional[str] = None
+    _root: str = PERSIST_DIRECTORY
+    # Requests in flight per instance (by id), so a swapped-out instance can be drained
+    _in_flight: Dict[int, int] = {}
+    # Shared lock on the directory of each instance (by id) until it is closed
+    _holds: Dict[int, IO] = {}
+    # Index generation the instance's stores were opened at; another process writing
+    # to the directory bumps it, and its stores are then reopened to see the new rows
+    _generation: int = 0
+    # Set while the instance is being reopened; new requests wait for the reopened one
+    _reloading: bool = False
+    _cond = threading.Condition()
+    _swap_lock = threading.Lock()
+
     @classmethod
     def initialize(cls, persist_directory: str = PERSIST_DIRECTORY) -> RAGSystem:
         """Initialize the RAG system if it hasn't been initialized yet."""
         if cls._instance is None:
             logger.info("Initializing new RAG system...")
             try:
-                # Check if vector stores already exist
-                if not os.path.exists(persist_directory):
-                    logger.info("Vector stores not found. Processing data...")
-                    abstract_store, content_store, stats = preprocess_and_store_data(DATA_PATH, persist_directory)
-                    logger.info(f"Vector store statistics: {stats}")
-                else:
-                    logger.info("Loading existing vector stores...")
-                    processor = DataProcessor(persist_directory)
-                    abstract_store, content_store = processor.create_vector_stores()
-                    stats = processor.get_store_stats()
-                    logger.info(f"Loaded vector store statistics: {stats}")
-                
+                # Other workers may be starting too; only the first one to get here builds the stores
+                with index_lock(persist_directory):
+                    generation = read_index_generation(persist_directory)
+                    directory = active_persist_directory(persist_directory)
+                    # Check if vector stores already exist
+                    if not os.path.exists(directory):
+                        logger.info("Vector stores not found. Processing data...")
+                        abstract_store, content_store, stats = preprocess_and_store_data(DATA_PATH, directory)
+                        logger.info(f"Vector store statistics: {stats}")
+                    else:
+                        logger.info(f"Loading existing vector stores from {directory}...")
+                        abstract_store, content_store = cls._open_stores(directory)
+                    # Versions retired while a worker that was idle (and so never switched) still held them
+                    remove_retired_versions(persist_directory)
+
                 # Initialize RAG system
-                cls._instance = RAGSystem.initialize(abstract_store, content_store)
+                cls._root = persist_directory
+                cls.swap(cls.create(abstract_store, content_store, directory), directory, generation)
                 logger.info(f"RAG system initialized and ready. ID: {id(cls._instance)}")
-                
+
             except Exception as e:
                 logger.error(f"Error initializing RAG system: {str(e)}")
                 raise
-                
+
         return cls._instance
-    
+
+    @staticmethod
+    def build_index(persist_directory: str = PERSIST_DIRECTORY) -> bool:
+        """
+        Build the vector stores if there are none yet, without serving from them;
+        True if they were built. `src/serve.py` runs this before starting the workers.
+        """
+        with index_lock(persist_directory):
+            directory = active_persist_directory(persist_directory)
+            if os.path.exists(directory):
+                return False
+            logger.info("Vector stores not found. Processing data...")
+            _, _, stats = preprocess_and_store_data(DATA_PATH, directory)
+            logger.info(f"Vector store statistics: {stats}")
+            return True
+
+    @staticmethod
+    def _open_stores(directory: str):
+        processor = DataProcessor(directory)
+        abstract_store, content_store = processor.create_vector_stores()
+        stats = processor.get_store_stats()
+        logger.info(f"Loaded vector store statistics: {stats}")
+        return abstract_store, content_store
+
+    @staticmethod
+    def create(abstract_store, content_store, persist_directory: str) -> RAGSystem:
+        """A RAG system over the given stores, not yet serving requests."""
+        # Summary queries are answered from the precomputed digests, if enabled
+        digest_store = None
+        if DIGEST_ENABLED:
+            digest_store = DataProcessor.open_digest_store(abstract_store.embeddings, persist_directory)
+        return RAGSystem(abstract_store, content_store, digest_store)
+
+    @classmethod
+    def swap(
+        cls, instance: RAGSystem, directory: str, generation: Optional[int] = None
+    ) -> Tuple[Optional[RAGSystem], Optional[str]]:
+        """
+        Serve new requests from `instance`, whose stores were opened at index
+        `generation` (the current one if not given); returns the previous instance
+        and its directory. Requests already holding the previous instance keep using it.
+        """
+        if generation is None:
+            generation = read_index_generation(cls._root)
+        hold = hold_index_directory(directory)
+        with cls._cond:
+            previous = cls._instance, cls._directory
+            cls._instance = instance
+            cls._directory = directory
+            cls._generation = generation
+            cls._holds[id(instance)] = hold
+        RAGSystem._instance = instance
+        return previous
+
+    @classmethod
+    def activate(cls, instance: RAGSystem, directory: str) -> Tuple[Optional[RAGSystem], Optional[str]]:
+        """
+        Swap in a newly built index version and make it the one every worker
+        (and the next start) uses; cached retrieval results are invalidated.
+        """
+        with cls._swap_lock:
+            previous = cls.swap(instance, directory)
+            set_active_version(directory, cls._root)
+            cls._bump_generation(cls._root)
+        logger.info(f"Index version {directory} is now active. ID: {id(instance)}")
+        return previous
+
+    @classmethod
+    def _follow(cls) -> None:
+        """Load the index version another worker activated, if any."""
+        if cls._directory is None or active_persist_directory(cls._root) == cls._directory:
+            return
+        with cls._swap_lock:
+            # Read again: the version may have been activated by this process meanwhile
+            directory = active_persist_directory(cls._root)
+            if directory == cls._directory:
+                return
+            logger.info(f"Switching to index version {directory}")
+            generation = read_index_generation(cls._root)
+            abstract_store, content_store = cls._open_stores(directory)
+            previous, previous_directory = cls.swap(
+                cls.create(abstract_store, content_store, directory), directory, generation
+            )
+        # The worker that activated the version removes the old one only once every worker has let go of it
+        threading.Thread(
+            target=cls.retire, args=(previous, previous_directory, INDEX_DRAIN_TIMEOUT), name="index-retire", daemon=True
+        ).start()
+
+    @classmethod
+    def bump_generation(cls, root: Optional[str] = None) -> int:
+        """
+        Start a new index generation for a change this process made through its
+        own stores, which already show it, so they are not reopened for it.
+        """
+        with cls._swap_lock:
+            return cls._bump_generation(root or cls._root)
+
+    @classmethod
+    def _bump_generation(cls, root: str) -> int:
+        previous = read_index_generation(root)
+        generation = bump_index_generation(root)
+        with cls._cond:
+            if cls._generation == previous:
+                cls._generation = generation
+        return generation
+
+    @classmethod
+    def _reload(cls) -> None:
+        """
+        Reopen the stores of the current directory if another process (the
+        ingestion leader, the digest builder) wrote to it: Chroma only shows a
+        process the rows it wrote itself until its client is reopened.
+        """
+        if cls._directory is None or read_index_generation(cls._root) == cls._generation:
+            return
+        with cls._swap_lock:
+            generation = read_index_generation(cls._root)
+            if generation == cls._generation:
+                return
+            with cls._cond:
+                cls._reloading = True
+            try:
+                instance, directory = cls._instance, cls._directory
+                logger.info(f"Index generation is now {generation}, reopening {directory}")
+                # Chroma shares one client per directory in a process, so the old one must be closed first
+                if not cls.drain(instance, INDEX_DRAIN_TIMEOUT):
+                    logger.warning(f"Requests still running on {directory} after {INDEX_DRAIN_TIMEOUT}s, reopening anyway")
+                cls.close(instance)
+                abstract_store, content_store = cls._open_stores(directory)
+                cls.swap(cls.create(abstract_store, content_store, directory), directory, generation)
+            finally:
+                with cls._cond:
+                    cls._reloading = False
+                    cls._cond.notify_all()
+
     @classmethod
     def get_instance(cls) -> RAGSystem:
         """Get the RAG system instance, initializing it if necessary."""
         if cls._instance is None:
             return cls.initialize()
+        cls._follow()
+        cls._reload()
         return cls._instance
-    
+
+    @classmethod
+    @contextmanager
+    def lease(cls) -> Iterator[RAGSystem]:
+        """The RAG system instance, counted as in flight until the block exits."""
+        cls.get_instance()
+        with cls._cond:
+            cls._cond.wait_for(lambda: not cls._reloading)
+            instance = cls._instance
+            cls._in_flight[id(instance)] = cls._in_flight.get(id(instance), 0) + 1
+        try:
+            yield instance
+        finally:
+            with cls._cond:
+                cls._in_flight[id(instance)] -= 1
+                if not cls._in_flight[id(instance)]:
+                    del cls._in_flight[id(instance)]
+                cls._cond.notify_all()
+
+    @classmethod
+    def drain(cls, instance: RAGSystem, timeout: Optional[float] = None) -> bool:
+        """Wait until no request holds `instance`; False if it is still in use after `timeout` seconds."""
+        with cls._cond:
+            return cls._cond.wait_for(lambda: id(instance) not in cls._in_flight, timeout)
+
+    @classmethod
+    def close(cls, instance: RAGSystem) -> None:
+        """Close the stores of a swapped-out instance and let go of its directory."""
+        for store in (instance.abstract_store, instance.content_store, instance.digest_store):
+            client = getattr(store, "_client", None)
+            if client is not None:
+                client.close()
+        with cls._cond:
+            hold = cls._holds.pop(id(instance), None)
+        if hold is not None:
+            hold.close()
+
+    @classmethod
+    def retire(cls, instance: RAGSystem, directory: str, timeout: Optional[float] = None) -> bool:
+        """
+        Close a swapped-out instance once no request holds it (waiting at most
+        `timeout` seconds), then remove its directory unless another process
+        still serves from it; True if the directory is gone.
+        """
+        root = cls._root
+        if not cls.drain(instance, timeout):
+            logger.warning(f"Requests still running on {directory} after {timeout}s, closing it anyway")
+        cls.close(instance)
+        with index_lock(root):
+            if os.path.abspath(directory) == os.path.abspath(active_persist_directory(root)):
+                return False
+            return remove_if_unused(directory, root)
+
+    @classmethod
+    def wait_idle(cls, timeout: Optional[float] = None) -> bool:
+        """Wait until no request is in flight; False if there still is one after `timeout` seconds."""
+        with cls._cond:
+            return cls._cond.wait_for(lambda: not cls._in_flight, timeout)
+
     @classmethod
     def reset(cls) -> None:
         """Reset the RAG system instance (useful for testing)."""
-        cls._instance = None 
\ No newline at end of file
+        for hold in cls._holds.values():
+            hold.close()
+        cls._holds = {}
+        cls._instance = None
+        cls._directory = None
+        cls._root = PERSIST_DIRECTORY
+        cls._generation = 0
+        cls._reloading = False
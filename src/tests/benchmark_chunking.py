@@ -0,0 +1,89 @@
+"""
+Chunking benchmark: chunk counts, chunk size distribution and split throughput
+per strategy and worker count, to tune chunking for index size against recall.
+
+Uses the corpus at DATA_PATH if present, otherwise a synthetic corpus.
+
+Typical usage:
+---------------
+$ python -m src.tests.benchmark_chunking
+$ python -m src.tests.benchmark_chunking --strategies section token --chunk-size 1000 --workers 1 4
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from langchain_core.documents import Document
+
+from ..config.settings import DATA_PATH
+from ..services.chunking import STRATEGIES, split_documents
+
+WORDS = ("climate flood rainfall adaptation emissions temperature coastal urban policy drought "
+         "vulnerability resilience carbon forest monsoon heat community model scenario").split()
+
+
+def synthetic_corpus(n_docs, seed=0):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        sections = []
+        for number, heading in enumerate(("Introduction", "Methods", "Results", "Discussion"), start=1):
+            paragraphs = []
+            for _ in range(rng.randint(3, 8)):
+                sentences = [" ".join(rng.choices(WORDS, k=rng.randint(8, 30))).capitalize() + "."
+                             for _ in range(rng.randint(3, 9))]
+                paragraphs.append(" ".join(sentences))
+            sections.append(f"{number}. {heading}\n" + "\n\n".join(paragraphs))
+        docs.append(Document(page_content="\n\n".join(sections), metadata={"title": f"Thesis {i}", "year": 2020}))
+    return docs
+
+
+def load_docs(n_docs):
+    if os.path.exists(DATA_PATH):
+        with open(DATA_PATH, encoding="utf-8") as f:
+            corpus = json.load(f)
+        docs = [Document(page_content=t["full_text"], metadata={"title": t.get("Title", "")})
+                for t in corpus if t.get("full_text")]
+        return docs[:n_docs] if n_docs else docs
+    return synthetic_corpus(n_docs or 500)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    parser.add_argument("--chunk-size", type=int, default=None, help="Default: the strategy's setting")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="Default: the strategy's setting")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--docs", type=int, default=0, help="Number of documents (0 = whole corpus)")
+    args = parser.parse_args()
+
+    docs = load_docs(args.docs)
+    total_chars = sum(len(doc.page_content) for doc in docs)
+    print(f"{len(docs)} documents, {total_chars / 1e6:.1f} M characters\n")
+    print("Chunk sizes are in characters.")
+    print(f"{'strategy':<10} {'workers':>7} {'chunks':>8} {'min':>6} {'p50':>6} {'p90':>6} {'max':>6} "
+          f"{'mean':>7} {'index chars':>12} {'docs/s':>9} {'MB/s':>7}")
+
+    for strategy in args.strategies:
+        for workers in args.workers:
+            start = time.perf_counter()
+            chunks = split_documents(docs, strategy, args.chunk_size, args.chunk_overlap, workers=workers)
+            elapsed = time.perf_counter() - start
+
+            sizes = [len(chunk.page_content) for chunk in chunks]
+            print(f"{strategy:<10} {workers:>7} {len(chunks):>8} {min(sizes):>6} {percentile(sizes, 0.5):>6} "
+                  f"{percentile(sizes, 0.9):>6} {max(sizes):>6} {statistics.mean(sizes):>7.0f} "
+                  f"{sum(sizes):>12} {len(docs) / elapsed:>9.1f} {total_chars / 1e6 / elapsed:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
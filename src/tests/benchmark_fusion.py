@@ -0,0 +1,111 @@
+"""
+Adaptive RAG fusion benchmark: how often fusion is skipped, the retrieval time
+saved, and whether retrieval quality holds, against fusion on every query.
+
+For each question, content retrieval runs once with fusion always on
+(FUSION_MAX_QUERIES sub-queries) and once in adaptive mode. There are no
+relevance labels for the corpus, so the always-fusion results are the
+reference: quality is the share of the reference's top-k theses that the
+adaptive results also return (source recall@k), reported over all questions
+and over the questions where fusion was skipped.
+
+Needs the vector stores and RED_PILL_API_KEY (query generation and self-query
+call the LLM). Thresholds can be swept without changing the settings.
+
+Typical usage:
+---------------
+$ python -m src.tests.benchmark_fusion
+$ python -m src.tests.benchmark_fusion --questions questions.txt --min-top-score 0.55 --min-spread 0.03
+"""
+
+import argparse
+import statistics
+import time
+
+from ..config.settings import FUSION_MAX_QUERIES, FUSION_MIN_SPREAD, FUSION_MIN_TOP_SCORE
+from ..services.adaptive_fusion import AdaptiveFusion
+from ..services.business_logic import RAGSystem
+from ..services.data_processor import DataProcessor
+
+DEFAULT_QUESTIONS = [
+    "What are the impacts of climate change on rice yields in Malaysia?",
+    "How is flood risk modelled in Kelantan?",
+    "Which methods are used to downscale rainfall projections?",
+    "What drives urban heat islands in Kuala Lumpur?",
+    "How does sea level rise affect mangrove forests?",
+    "What is the effect of haze on public health?",
+    "How do land use changes influence river discharge?",
+    "What adaptation strategies do smallholder farmers use?",
+    "How has extreme rainfall changed over the last decades?",
+    "What are the carbon emissions of palm oil plantations?",
+]
+
+
+def sources(results, k):
+    docs = [item[0] if isinstance(item, tuple) else item for item in results]
+    ordered = []
+    for doc in docs:
+        source = doc.metadata.get("source") or doc.metadata.get("title")
+        if source not in ordered:
+            ordered.append(source)
+    return ordered[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("--k", type=int, default=5, help="theses compared per question")
+    parser.add_argument("--min-top-score", type=float, default=FUSION_MIN_TOP_SCORE)
+    parser.add_argument("--min-spread", type=float, default=FUSION_MIN_SPREAD)
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    processor = DataProcessor()
+    abstract_store, content_store = processor.create_vector_stores()
+    rag = RAGSystem(abstract_store, content_store)
+    adaptive = AdaptiveFusion(
+        content_store,
+        rag.content_retriever,
+        rag.content_retriever_with_rag_fusion,
+        min_top_score=args.min_top_score,
+        min_spread=args.min_spread,
+    )
+
+    rows = []
+    for question in questions:
+        start = time.perf_counter()
+        reference = rag.content_retriever_with_rag_fusion.invoke(
+            {"question": question, "num_queries": FUSION_MAX_QUERIES}
+        )
+        always_latency = time.perf_counter() - start
+
+        top, spread = adaptive.probe(question)
+        queries = adaptive.num_queries(top, spread)
+        start = time.perf_counter()
+        results = adaptive.invoke(question)
+        adaptive_latency = time.perf_counter() - start
+
+        expected = sources(reference, args.k)
+        found = set(sources(results, args.k))
+        recall = sum(source in found for source in expected) / len(expected) if expected else 1.0
+        rows.append((question, top, spread, queries, always_latency, adaptive_latency, recall))
+        print(f"top={top:.3f} spread={spread:.3f} queries={queries} always={always_latency:.2f}s "
+              f"adaptive={adaptive_latency:.2f}s recall@{args.k}={recall:.2f}  {question[:60]}")
+
+    skipped = [row for row in rows if row[3] == 0]
+    always_total = sum(row[4] for row in rows)
+    adaptive_total = sum(row[5] for row in rows)
+    print(f"\n{len(rows)} questions, fusion skipped for {len(skipped)} ({len(skipped) / len(rows):.0%})")
+    print(f"Mean latency: always {statistics.mean(row[4] for row in rows):.2f}s, "
+          f"adaptive {statistics.mean(row[5] for row in rows):.2f}s "
+          f"(saved {always_total - adaptive_total:.1f}s, {1 - adaptive_total / always_total:.0%})")
+    print(f"Source recall@{args.k} vs always-fusion: {statistics.mean(row[6] for row in rows):.2f} overall"
+          + (f", {statistics.mean(row[6] for row in skipped):.2f} where fusion was skipped" if skipped else ""))
+
+
+if __name__ == "__main__":
+    main()
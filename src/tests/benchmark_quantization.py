@@ -0,0 +1,119 @@
+"""
+Quantized index benchmark: memory, query latency and recall@k of the int8 and
+binary indexes (with full-precision rescoring) against exact float32 search
+and, with --chroma, against the current Chroma (HNSW, float32) setup.
+
+Uses the embeddings of an existing collection with --collection, otherwise
+synthetic 768-dim clustered vectors. Queries are perturbed copies of stored
+vectors, so that each has true near neighbours.
+
+Typical usage:
+---------------
+$ python -m src.tests.benchmark_quantization --vectors 50000 --chroma
+$ python -m src.tests.benchmark_quantization --collection content
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from ..config.settings import PERSIST_DIRECTORY
+from ..services.quantized_index import MODES, QuantizedIndex
+
+
+def synthetic_vectors(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, n // 200), dim))
+    vectors = centres[rng.integers(0, len(centres), n)] + 0.6 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def collection_vectors(name):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=os.path.join(PERSIST_DIRECTORY, name))
+    collection = client.get_collection(f"{name}_collection")
+    stored = collection.get(include=["embeddings"])
+    return np.asarray(stored["embeddings"], dtype=np.float32)
+
+
+def make_queries(vectors, n, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), n)]
+    queries = queries + 0.03 * rng.normal(size=queries.shape)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def measure(search, queries, truth, k):
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(expected) & set(found[:k]))
+    latencies.sort()
+    return (hits / (k * len(queries)), latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+
+def report(name, memory_mb, build_s, recall, p50, p95):
+    print(f"{name:<22} {memory_mb:>10.1f} {build_s:>9.2f} {recall:>9.3f} {p50:>9.2f} {p95:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000, help="Number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--collection", choices=["abstract", "content"], help="Use a stored collection instead")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--chroma", action="store_true", help="Also measure Chroma's HNSW index")
+    args = parser.parse_args()
+
+    vectors = collection_vectors(args.collection) if args.collection else synthetic_vectors(args.vectors, args.dim)
+    queries = make_queries(vectors, args.queries)
+    ids = [str(i) for i in range(len(vectors))]
+    truth = [[str(i) for i in np.argsort(((vectors - q) ** 2).sum(axis=1))[:args.k]] for q in queries]
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dims, {args.queries} queries, recall@{args.k}\n")
+    print(f"{'index':<22} {'memory MB':>10} {'build s':>9} {'recall':>9} {'p50 ms':>9} {'p95 ms':>9}")
+
+    recall, p50, p95 = measure(
+        lambda q: [str(i) for i in np.argsort(((vectors - q) ** 2).sum(axis=1))[:args.k]], queries, truth, args.k
+    )
+    report("float32 exact", vectors.nbytes / 1e6, 0.0, recall, p50, p95)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for mode in MODES:
+            start = time.perf_counter()
+            index = QuantizedIndex(os.path.join(tmpdir, mode), mode)
+            index.build(ids, vectors)
+            build = time.perf_counter() - start
+            recall, p50, p95 = measure(lambda q: [id_ for id_, _ in index.search(q, args.k)], queries, truth, args.k)
+            report(f"{mode} + rescoring", index.memory_bytes() / 1e6, build, recall, p50, p95)
+
+        if args.chroma:
+            import chromadb
+
+            client = chromadb.PersistentClient(path=os.path.join(tmpdir, "chroma"))
+            collection = client.create_collection("benchmark")
+            start = time.perf_counter()
+            for i in range(0, len(vectors), 5000):
+                collection.add(ids=ids[i:i + 5000], embeddings=vectors[i:i + 5000].tolist())
+            build = time.perf_counter() - start
+            recall, p50, p95 = measure(
+                lambda q: collection.query(query_embeddings=[q.tolist()], n_results=args.k, include=[])["ids"][0],
+                queries, truth, args.k,
+            )
+            # HNSW keeps the float32 vectors plus its graph in memory
+            report("chroma hnsw (float32)", vectors.nbytes / 1e6, build, recall, p50, p95)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
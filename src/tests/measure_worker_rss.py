@@ -0,0 +1,73 @@
+"""
+Per-worker memory of a running multi-worker server (`python -m src.serve`).
+
+For the gunicorn master and each of its workers, prints:
+- RSS: resident memory, counting shared pages in full in every process
+- PSS: proportional set size, where each shared page is split between the
+  processes sharing it (the sum over processes is the real footprint)
+- Shared / Private: resident pages shared with other processes or not
+
+With the model preloaded in the master, a worker's Private memory is what it
+costs on top of the others; compare the PSS total against a run with
+SERVER_WORKERS=1 (or against `python -m src.app`) times the worker count.
+Send a few queries first so every worker has initialized and served requests.
+Reads /proc/<pid>/smaps_rollup, so Linux only.
+
+Typical usage:
+---------------
+$ python -m src.tests.measure_worker_rss --pid $(pgrep -of "src.serve")
+"""
+
+import argparse
+import os
+from typing import Dict, List
+
+FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "private",
+    "Private_Dirty": "private",
+}
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    usage = {"rss": 0, "pss": 0, "shared": 0, "private": 0}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in FIELDS:
+                usage[FIELDS[name]] += int(rest.split()[0])
+    return usage
+
+
+def children(pid: int) -> List[int]:
+    found = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            found.extend(int(child) for child in f.read().split())
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, required=True, help="pid of the gunicorn master")
+    args = parser.parse_args()
+
+    rows = [("master", args.pid)] + [("worker", pid) for pid in children(args.pid)]
+    total = {"rss": 0, "pss": 0, "shared": 0, "private": 0}
+    print(f"{'process':<8} {'pid':>8} {'RSS MB':>9} {'PSS MB':>9} {'Shared MB':>10} {'Private MB':>11}")
+    for role, pid in rows:
+        usage = memory_kb(pid)
+        for key in total:
+            total[key] += usage[key]
+        print(f"{role:<8} {pid:>8} {usage['rss'] / 1024:>9.1f} {usage['pss'] / 1024:>9.1f} "
+              f"{usage['shared'] / 1024:>10.1f} {usage['private'] / 1024:>11.1f}")
+    print(f"{'total':<8} {'':>8} {total['rss'] / 1024:>9.1f} {total['pss'] / 1024:>9.1f} "
+          f"{total['shared'] / 1024:>10.1f} {total['private'] / 1024:>11.1f}")
+    print("\nPSS total is the actual memory used by the server; RSS total counts shared pages once per process.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import logging
+import unittest
+from unittest import mock
+
+from langchain_core.documents import Document
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.runnables import RunnableLambda
+
+from ..services import business_logic
+from ..services.adaptive_fusion import AdaptiveFusion
+from ..services.business_logic import RAGSystem
+from ..utils.metrics import FUSION_DECISIONS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class ProbeStore:
+    """Returns fixed cosine similarities per question, as Chroma's squared L2 distances"""
+
+    def __init__(self, similarities):
+        self.similarities = similarities
+
+    def similarity_search_with_score(self, question, k=4):
+        return [(Document(page_content=f"{question} {i}"), 2 * (1 - s))
+                for i, s in enumerate(self.similarities[question][:k])]
+
+
+class TestAdaptiveFusion(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        store = ProbeStore({
+            "clear": [0.82, 0.70, 0.65, 0.61, 0.60],
+            "ambiguous": [0.64, 0.63, 0.63, 0.62, 0.62],
+            "weak": [0.50, 0.47, 0.45, 0.41, 0.40],
+            "unknown": [0.20, 0.18, 0.17, 0.15, 0.11],
+        })
+        single = RunnableLambda(lambda q: self.calls.append(("single", q)) or [Document(page_content=q)])
+        fusion = RunnableLambda(lambda x: self.calls.append(("fusion", x["num_queries"])) or [])
+        self.fusion = AdaptiveFusion(store, single, fusion, probe_k=5, min_top_score=0.6, min_spread=0.05,
+                                     min_queries=2, max_queries=4)
+
+    def decisions(self, decision):
+        return FUSION_DECISIONS.labels(decision=decision)._value.get()
+
+    def test_confident_probe_skips_fusion(self):
+        skipped = self.decisions("skipped")
+        docs = self.fusion.invoke("clear")
+        self.assertEqual(self.calls, [("single", "clear")])
+        self.assertEqual(docs[0].page_content, "clear")
+        self.assertEqual(self.decisions("skipped"), skipped + 1)
+
+    def test_sub_queries_scale_with_confidence(self):
+        fused = self.decisions("fused")
+        for question in ("ambiguous", "weak", "unknown"):
+            self.fusion.invoke(question)
+        # Close scores with a good match need only a couple of rephrasings; poor matches get the most
+        self.assertEqual(self.calls, [("fusion", 2), ("fusion", 3), ("fusion", 4)])
+        self.assertEqual(self.decisions("fused"), fused + 3)
+
+    def test_empty_store_fuses_with_most_queries(self):
+        self.fusion.store = ProbeStore({"anything": []})
+        self.fusion.invoke("anything")
+        self.assertEqual(self.calls, [("fusion", 4)])
+
+
+class TestFusionQueryCount(unittest.TestCase):
+    def test_only_the_requested_queries_are_retrieved(self):
+        # The model ignores the count and pads its list with blank lines
+        answer = "1. What is ENSO?\n\n2. What drives ENSO?\n3. How does ENSO form?\n\n4. ENSO impacts\n"
+        retrieved = []
+        rag = RAGSystem.__new__(RAGSystem)
+        rag.stage_llms = {"fusion": FakeListLLM(responses=[answer] * 3)}
+        rag.content_store = None
+        rag.content_retriever = RunnableLambda(lambda q: retrieved.append(q) or [Document(page_content=q)])
+        with mock.patch.object(business_logic, "FUSION_MODE", "always"):
+            rag.setup_rag_fusion()
+
+        for num_queries, expected in ((1, ["What is ENSO?"]), (2, ["What is ENSO?", "What drives ENSO?"])):
+            retrieved.clear()
+            rag.content_retriever_with_rag_fusion.invoke({"question": "ENSO", "num_queries": num_queries})
+            self.assertEqual(retrieved, expected)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
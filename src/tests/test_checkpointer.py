@@ -0,0 +1,104 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from uuid import uuid4
+
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.runnables import RunnableLambda
+
+from ..models.history_models import ChatMessage, ChatSession, SessionLocal
+from ..services.checkpointer import SQLiteCheckpointer
+from ..services.memory_manager import RAGMemoryManager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class RecordingRAG:
+    """Stands in for RAGSystem: answers with the number of messages it was given"""
+
+    def __init__(self):
+        self.contexts = []
+        self.stage_llms = {"summary": FakeListLLM(responses=["summary"])}
+        self.full_chain = RunnableLambda(self.answer)
+
+    def answer(self, inputs):
+        self.contexts.append(inputs["messages"])
+        return f"answer {len(self.contexts)}"
+
+
+class TestSQLiteCheckpointer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, "checkpoints.db")
+
+    def manager(self, rag=None):
+        # Every manager has its own checkpointer on the same file, like separate workers
+        return RAGMemoryManager(rag or RecordingRAG(), checkpointer=SQLiteCheckpointer(self.path))
+
+    def test_conversation_continues_on_another_worker(self):
+        worker_a, worker_b = self.manager(), self.manager()
+        worker_a.process_query_with_memory("What causes floods?", "chat-a")
+        worker_b.process_query_with_memory("And in Malaysia?", "chat-a")
+
+        context = worker_b.rag_system.contexts[-1]
+        self.assertEqual(
+            [m.content for m in context],
+            ["What causes floods?", "answer 1", "And in Malaysia?"],
+        )
+        # Worker A reads the state written by worker B rather than its own cached copy
+        state = worker_a.app.get_state({"configurable": {"thread_id": "chat-a"}})
+        self.assertEqual(len(state.values["messages"]), 4)
+
+    def test_chats_are_separate_threads(self):
+        manager = self.manager()
+        manager.process_query_with_memory("First chat question", "chat-1")
+        manager.process_query_with_memory("Second chat question", "chat-2")
+        self.assertEqual([m.content for m in manager.rag_system.contexts[-1]], ["Second chat question"])
+
+    def test_memory_rebuilt_from_chat_history(self):
+        chat_id = f"test-{uuid4().hex[:8]}"
+        with SessionLocal() as db:
+            db.add(ChatSession(id=chat_id, chat_name="rebuild"))
+            db.add_all([
+                ChatMessage(session_id=chat_id, role="user", content="Where is Kelantan?"),
+                ChatMessage(session_id=chat_id, role="assistant", content="In Peninsular Malaysia."),
+            ])
+            db.commit()
+        self.addCleanup(self.delete_chat, chat_id)
+
+        manager = self.manager()
+        manager.process_query_with_memory("Does it flood there?", chat_id)
+        self.assertEqual(
+            [(m.type, m.content) for m in manager.rag_system.contexts[-1]],
+            [("human", "Where is Kelantan?"), ("ai", "In Peninsular Malaysia."), ("human", "Does it flood there?")],
+        )
+
+        # Once checkpointed, the history is not loaded again
+        manager.process_query_with_memory("Since when?", chat_id)
+        self.assertEqual(len(manager.rag_system.contexts[-1]), 5)
+
+    def test_idle_threads_pruned(self):
+        manager = self.manager()
+        manager.process_query_with_memory("Old question", "chat-old")
+        config = {"configurable": {"thread_id": "chat-old"}}
+        self.assertIsNotNone(manager.memory.get_tuple(config))
+
+        self.assertEqual(manager.memory.prune(retention=0), 1)
+        self.assertIsNone(manager.memory.get_tuple(config))
+        self.assertIsNone(SQLiteCheckpointer(self.path).get_tuple(config))
+
+    @staticmethod
+    def delete_chat(chat_id):
+        with SessionLocal() as db:
+            db.query(ChatMessage).filter(ChatMessage.session_id == chat_id).delete()
+            db.query(ChatSession).filter(ChatSession.id == chat_id).delete()
+            db.commit()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,52 @@
+import logging
+import threading
+import unittest
+
+from langchain_core.documents import Document
+
+from ..services.chunking import SectionAwareSplitter, get_splitter, split_documents
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TEXT = """1. Introduction
+Floods are increasing in Kuala Lumpur. Drainage was designed for older rainfall patterns. This thesis studies both.
+
+2. Methods
+We modelled rainfall from 1990 to 2020. Gauges were calibrated against radar. The model ran hourly.
+"""
+
+
+class TestChunking(unittest.TestCase):
+    def test_section_chunks_respect_headings_and_sentences(self):
+        chunks = SectionAwareSplitter(chunk_size=120, chunk_overlap=40).split_text(TEXT)
+        self.assertTrue(all(len(chunk) <= 120 for chunk in chunks))
+        # No chunk spans the heading, and every chunk ends at a sentence boundary
+        self.assertFalse(any("Introduction" in chunk and "Methods" in chunk for chunk in chunks))
+        self.assertTrue(all(chunk.endswith(".") for chunk in chunks))
+        self.assertTrue(chunks[-1].endswith("The model ran hourly."))
+
+    def test_parallel_split_matches_serial(self):
+        docs = [Document(page_content=TEXT * (i % 5 + 1), metadata={"title": f"Thesis {i}"}) for i in range(240)]
+        serial = split_documents(docs, "section", 200, 50, workers=1)
+        parallel = split_documents(docs, "section", 200, 50, workers=2)
+        self.assertEqual([(c.page_content, c.metadata) for c in serial], [(c.page_content, c.metadata) for c in parallel])
+
+    def test_parallel_split_from_background_thread(self):
+        """Rebuilds and ingestion chunk from a server thread; the worker processes are spawned, not forked"""
+        docs = [Document(page_content=TEXT, metadata={"title": f"Thesis {i}"}) for i in range(240)]
+        result = []
+        thread = threading.Thread(target=lambda: result.extend(split_documents(docs, "section", 200, 50, workers=2)))
+        thread.start()
+        thread.join(timeout=60)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(result), len(split_documents(docs, "section", 200, 50, workers=1)))
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            get_splitter("paragraph")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
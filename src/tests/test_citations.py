@@ -0,0 +1,53 @@
+import logging
+import unittest
+
+from langchain_core.documents import Document
+
+from ..utils.citations import add_references, cited_numbers, format_context
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FLOODS = {"title": "Urban Flood Resilience in Kuala Lumpur", "year": 2021, "source": "https://example.edu/floods"}
+HEAT = {"title": "Heat Stress Among Outdoor Workers", "year": 2019, "source": "https://example.edu/heat"}
+
+
+class TestCitations(unittest.TestCase):
+    def setUp(self):
+        # RAG fusion output: (document, score) pairs, two chunks of the same thesis
+        self.docs = [
+            (Document(page_content="Flash floods increased. Drainage is undersized. Retention ponds help. More text.", metadata=FLOODS), 0.03),
+            (Document(page_content="Wet bulb temperatures exceed 30C.", metadata=HEAT), 0.02),
+            (Document(page_content="Green roofs reduce runoff.", metadata=FLOODS), 0.01),
+        ]
+
+    def test_context_numbers_sources_not_chunks(self):
+        context = format_context(self.docs)
+        self.assertIn("[1] Urban Flood Resilience in Kuala Lumpur (2021)", context)
+        self.assertIn("[2] Heat Stress Among Outdoor Workers (2019)", context)
+        self.assertNotIn("[3]", context)
+        self.assertIn("Green roofs reduce runoff.", context.split("[2]")[0])
+
+    def test_references_rendered_for_cited_sources_only(self):
+        answer = add_references("Floods are worsening [1], and green roofs help [1, 7].", self.docs)
+        self.assertEqual(cited_numbers(answer.split("### References")[0]), [1, 7])
+        self.assertIn(
+            "[1] _Urban Flood Resilience in Kuala Lumpur._ (2021). [https://example.edu/floods](https://example.edu/floods)",
+            answer,
+        )
+        # Uncited and unknown sources are not listed
+        self.assertNotIn("Heat Stress", answer)
+        self.assertNotIn("[7] _", answer)
+
+    def test_groundtruth_and_uncited_answers(self):
+        answer = add_references("Heat [2] and floods [1].", self.docs, with_groundtruth=True)
+        self.assertTrue(answer.index("[2] _Heat") < answer.index("[1] _Urban"))
+        self.assertIn('Groundtruth: "Flash floods increased. Drainage is undersized. Retention ponds help."', answer)
+
+        self.assertEqual(add_references("I could not find this in the context.", self.docs),
+                         "I could not find this in the context.")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
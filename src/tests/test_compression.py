@@ -0,0 +1,87 @@
+import logging
+import unittest
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.runnables import RunnableLambda
+
+from ..models.data_models import RouteQuery
+from ..services.business_logic import RAGSystem
+from ..services.compression import ExtractiveCompressor, split_sentences
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+VOCABULARY = ["flood", "rain", "drainage", "heat", "worker", "policy"]
+
+
+class KeywordEmbeddings(Embeddings):
+    """Bag-of-keywords vectors, so that similarity is predictable; records each batch"""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return [[text.lower().count(word) + 0.01 for word in VOCABULARY] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class TestExtractiveCompressor(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = KeywordEmbeddings()
+        self.compressor = ExtractiveCompressor(self.embeddings, keep_ratio=0.4, min_sentences=1)
+        metadata = {"title": "Urban Flood Resilience", "year": 2021, "source": "https://example.edu/floods"}
+        self.chunk = Document(
+            page_content=(
+                "Heat waves affect outdoor workers. Flood events followed heavy rain. "
+                "The policy review took two years. Drainage capacity limits flood control.\n"
+                "Interviews were held with workers."
+            ),
+            metadata=metadata,
+        )
+
+    def test_keeps_most_relevant_sentences_in_order(self):
+        (doc, score), = self.compressor.compress("Why do floods follow heavy rain and poor drainage?", [(self.chunk, 0.5)])
+        self.assertEqual(doc.page_content, "Flood events followed heavy rain. Drainage capacity limits flood control.")
+        self.assertEqual(doc.metadata, self.chunk.metadata)
+        self.assertEqual(score, 0.5)
+
+    def test_single_batched_embedding_call(self):
+        docs = [self.chunk, Document(page_content="Rain gauges failed. Heat was extreme.", metadata={})]
+        compressed = self.compressor.compress("rain and floods", docs)
+        self.assertEqual(len(compressed), 2)
+        self.assertEqual(self.embeddings.batches, [1 + len(split_sentences(self.chunk.page_content)) + 2])
+        self.assertEqual(compressed[1].page_content, "Rain gauges failed.")
+
+
+class TestCompressionInPipeline(unittest.TestCase):
+    def test_sentences_scored_against_latest_question(self):
+        """The router restates the whole conversation; compression only looks at the current question"""
+        rag = RAGSystem.__new__(RAGSystem)
+        rag.llm = FakeListLLM(responses=["Drainage matters [1]."])
+        rag.compressor = ExtractiveCompressor(KeywordEmbeddings(), keep_ratio=0.2, min_sentences=1)
+        chunk = Document(
+            page_content="Heat waves affect outdoor workers. Drainage capacity limits flood control.",
+            metadata={"title": "Urban Flood Resilience", "source": "https://example.edu/floods"},
+        )
+        seen = []
+        rag.route_retrievers = {"content_store": RunnableLambda(lambda _: [chunk])}
+        compress = rag.compressor.compress
+        rag.compressor.compress = lambda question, docs: seen.append(question) or compress(question, docs)
+
+        result = RouteQuery(
+            datasource="Content_Store",
+            messages="human: Do heat waves affect outdoor workers?\nai: Yes.\nhuman: And what limits flood control?",
+            evaluation=False,
+        )
+        rag.choose_route(result, "And what limits flood control?").invoke(result)
+        self.assertEqual(seen, ["And what limits flood control?"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+import logging
+import unittest
+
+from langchain_core.documents import Document
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.runnables import RunnableLambda
+
+from ..config.settings import DEGRADED_K
+from ..services.business_logic import RAGSystem
+from ..utils.deadline import degradations, remaining, request_deadline, should_degrade
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class RecordingCompressor:
+    def __init__(self):
+        self.calls = 0
+
+    def compress(self, question, docs):
+        self.calls += 1
+        return docs
+
+
+def thesis(i):
+    return Document(page_content=f"Finding {i}.", metadata={"title": f"Thesis {i}", "source": f"https://example.edu/{i}"})
+
+
+class TestDeadline(unittest.TestCase):
+    def test_no_deadline_never_degrades(self):
+        self.assertIsNone(remaining())
+        with request_deadline(None):
+            self.assertFalse(should_degrade("single_query"))
+            self.assertEqual(degradations(), [])
+
+    def test_degradations_follow_remaining_budget(self):
+        with request_deadline(11):
+            taken = [step for step in ("single_query", "lower_k", "skip_compression", "skip_web_search")
+                     if should_degrade(step)]
+            self.assertEqual(taken, ["single_query", "lower_k", "skip_compression"])
+            # Asking again does not record a step twice
+            should_degrade("lower_k")
+            self.assertEqual(degradations(), taken)
+        with request_deadline(60):
+            self.assertFalse(should_degrade("single_query"))
+            self.assertEqual(degradations(), [])
+
+    def test_degradations_in_worker_threads_are_reported(self):
+        with request_deadline(5):
+            RunnableLambda(lambda step: should_degrade(step)).batch(["skip_web_search", "single_query"])
+            self.assertEqual(sorted(degradations()), ["single_query", "skip_web_search"])
+
+
+class TestDegradedGeneration(unittest.TestCase):
+    def setUp(self):
+        # Only what the generation chain uses, without stores or upstream models
+        self.rag = RAGSystem.__new__(RAGSystem)
+        self.rag.llm = FakeListLLM(responses=["Floods increased [1]."])
+        self.rag.compressor = RecordingCompressor()
+        self.chain = self.rag._cited_generation_chain("{context}\n\n{question}")
+        self.docs = [thesis(i) for i in range(1, 6)]
+
+    def test_full_budget_uses_every_document(self):
+        with request_deadline(60):
+            answer = self.chain.invoke({"docs": self.docs, "question": "Floods?", "latest_question": "Floods?"})
+            self.assertEqual(degradations(), [])
+        self.assertEqual(self.rag.compressor.calls, 1)
+        self.assertIn("Thesis 1", answer)
+
+    def test_short_budget_lowers_k_and_skips_compression(self):
+        with request_deadline(5):
+            answer = self.chain.invoke({"docs": self.docs, "question": "Floods?", "latest_question": "Floods?"})
+            self.assertEqual(degradations(), ["lower_k", "skip_compression"])
+        self.assertEqual(self.rag.compressor.calls, 0)
+        self.assertIn("Thesis 1", answer)
+
+    def test_lower_k_keeps_the_best_ranked_documents(self):
+        seen = []
+        self.rag.compressor.compress = lambda question, docs: seen.extend(docs) or docs
+        with request_deadline(14):
+            self.chain.invoke({"docs": self.docs, "question": "Floods?", "latest_question": "Floods?"})
+            self.assertEqual(degradations(), ["lower_k"])
+        self.assertEqual(seen, self.docs[:DEGRADED_K])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from typing import Any, List, Optional
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.llms import LLM
+
+from ..services import business_logic
+from ..services.business_logic import RAGSystem
+from ..services.digest_builder import DigestBuilder, build_digests, digest_id
+from ..services.retrieval_cache import read_index_generation
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class StubDigestLLM(LLM):
+    """Answers every digest prompt with a fixed JSON digest; fails for titles listed in `failing`"""
+
+    failing: List[str] = []
+    prompts: List[str] = []
+    lock: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-digest"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        with self.lock:
+            self.prompts.append(prompt)
+        if any(title in prompt for title in self.failing):
+            raise RuntimeError("upstream timeout")
+        return "```json\n" + json.dumps({
+            "key_findings": ["Flood frequency doubled since 2000"],
+            "methods": "Hydrological modelling of rainfall records",
+            "region": "Malaysia",
+        }) + "\n```"
+
+
+def abstract(i):
+    return Document(
+        page_content=f"Abstract of thesis {i} about floods.",
+        metadata={"title": f"Thesis {i}", "year": 2020 + i, "source": f"https://example.edu/thesis/{i}"},
+    )
+
+
+class TestDigestBuilder(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.store = Chroma(
+            collection_name="digest_collection",
+            embedding_function=DeterministicFakeEmbedding(size=16),
+            persist_directory=self.tmpdir,
+        )
+        self.abstracts = [abstract(i) for i in range(6)]
+
+    def test_build_is_parallel_and_resumable(self):
+        llm = StubDigestLLM(failing=["Thesis 3"], prompts=[], lock=threading.Lock())
+        builder = DigestBuilder(llm, self.store, max_workers=4, batch_size=2)
+
+        stats = builder.build(self.abstracts)
+        self.assertEqual(stats, {"total": 6, "built": 5, "failed": 1, "skipped": 0})
+
+        digest = self.store.get(ids=[digest_id(self.abstracts[0].metadata)])
+        self.assertIn("Region: Malaysia", digest["documents"][0])
+        self.assertIn("- Flood frequency doubled since 2000", digest["documents"][0])
+        self.assertEqual(digest["metadatas"][0]["year"], 2020)
+        self.assertEqual(digest["metadatas"][0]["region"], "Malaysia")
+
+        # A rerun only digests the thesis that failed
+        llm.failing = []
+        llm.prompts.clear()
+        stats = builder.build(self.abstracts)
+        self.assertEqual(stats, {"total": 6, "built": 1, "failed": 0, "skipped": 5})
+        self.assertEqual(len(llm.prompts), 1)
+        self.assertIn("Thesis 3", llm.prompts[0])
+        self.assertEqual(len(self.store.get()["ids"]), 6)
+
+    def test_summaries_switch_to_digests_only_when_every_thesis_has_one(self):
+        abstract_store = Chroma(
+            collection_name="abstract_collection",
+            embedding_function=DeterministicFakeEmbedding(size=16),
+            persist_directory=f"{self.tmpdir}/abstract",
+        )
+        abstract_store.add_documents(self.abstracts)
+        # Only what the summary retriever choice uses, without the LLMs
+        rag = RAGSystem.__new__(RAGSystem)
+        rag.abstract_store, rag.digest_store = abstract_store, self.store
+        rag.abstract_retriever, rag.digest_retriever = "abstracts", "digests"
+        rag._digest_coverage = (None, False)
+        generation = mock.patch.object(business_logic, "read_index_generation", return_value=1)
+        generation.start()
+        self.addCleanup(generation.stop)
+
+        llm = StubDigestLLM(failing=["Thesis 3"], prompts=[], lock=threading.Lock())
+        DigestBuilder(llm, self.store).build(self.abstracts)
+        self.assertEqual(rag.summary_retriever(), "abstracts")
+
+        # Coverage is checked again once the index generation changes
+        llm.failing = []
+        DigestBuilder(llm, self.store).build(self.abstracts)
+        self.assertEqual(rag.summary_retriever(), "abstracts")
+        business_logic.read_index_generation.return_value = 2
+        self.assertEqual(rag.summary_retriever(), "digests")
+
+    def test_built_digests_bump_the_root_generation(self):
+        abstract_store = Chroma(
+            collection_name="abstract_collection",
+            embedding_function=DeterministicFakeEmbedding(size=16),
+            persist_directory=f"{self.tmpdir}/versions/v1/abstract",
+        )
+        abstract_store.add_documents(self.abstracts)
+        # Written into the active version, as after an index rebuild
+        processor = SimpleNamespace(abstract_store=abstract_store, digest_store=self.store,
+                                    persist_directory=f"{self.tmpdir}/versions/v1")
+        llm = StubDigestLLM(failing=[], prompts=[], lock=threading.Lock())
+
+        build_digests(processor, llm=llm, root=self.tmpdir)
+        self.assertGreater(read_index_generation(self.tmpdir), 0)
+        self.assertEqual(os.listdir(processor.persist_directory), ["abstract"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
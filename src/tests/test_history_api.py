@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+import unittest
+
+import httpx
+from fastapi.testclient import TestClient
+
+from ..api.routes import get_rag_system
+from ..app import app
+from ..services.history_writer import ChatHistoryWriter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TestHistoryConditionalGet(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+
+    def setUp(self):
+        self.chat_id = self.client.post("/api/v1/chats").json()["id"]
+        self.messages_url = f"/api/v1/chats/{self.chat_id}/messages"
+
+    def save_turn(self, question, answer="An answer."):
+        asyncio.run(ChatHistoryWriter(durability="sync").save_turn(self.chat_id, question, answer))
+
+    def test_unchanged_chat_answers_304(self):
+        self.save_turn("What is ENSO?")
+        first = self.client.get(self.messages_url)
+        etag = first.headers["ETag"]
+        self.assertEqual(len(first.json()), 2)
+
+        repeat = self.client.get(self.messages_url, headers={"If-None-Match": etag})
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b"")
+        self.assertEqual(repeat.headers["ETag"], etag)
+
+        # A new turn or a rename changes the version
+        self.save_turn("And La Nina?")
+        changed = self.client.get(self.messages_url, headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()), 4)
+        self.client.put(f"/api/v1/chats/{self.chat_id}/changename", params={"chat_name": "ENSO"})
+        renamed = self.client.get(self.messages_url, headers={"If-None-Match": changed.headers["ETag"]})
+        self.assertEqual(renamed.status_code, 200)
+
+    def test_conversation_list_revalidates(self):
+        etag = self.client.get("/api/v1/conversations").headers["ETag"]
+        self.assertEqual(self.client.get("/api/v1/conversations", headers={"If-None-Match": etag}).status_code, 304)
+        self.save_turn("What is ENSO?")
+        self.assertEqual(self.client.get("/api/v1/conversations", headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_since_returns_only_newer_messages(self):
+        self.save_turn("What is ENSO?")
+        last_id = self.client.get(self.messages_url).json()[-1]["id"]
+        self.assertEqual(self.client.get(self.messages_url, params={"since": last_id}).json(), [])
+
+        self.save_turn("And La Nina?")
+        newer = self.client.get(self.messages_url, params={"since": last_id}).json()
+        self.assertEqual([m["content"] for m in newer], ["And La Nina?", "An answer."])
+        both = self.client.get(self.messages_url, params={"since": last_id, "before": last_id})
+        self.assertEqual(both.status_code, 400)
+
+    def test_large_history_compressed(self):
+        self.save_turn("What is ENSO?", answer="El Nino " * 500)
+        response = self.client.get(self.messages_url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+        self.assertEqual(response.json()[1]["content"], "El Nino " * 500)
+
+
+class SlowRAGSystem:
+    def process_query(self, text, chat_id=None, deadline=None):
+        time.sleep(0.5)
+        return {"answer": "An answer.", "degradations": []}
+
+
+class TestQueryOffTheEventLoop(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        app.dependency_overrides[get_rag_system] = SlowRAGSystem
+        self.addCleanup(app.dependency_overrides.pop, get_rag_system, None)
+
+    async def test_history_served_while_a_query_runs(self):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            start = time.perf_counter()
+            query = asyncio.create_task(client.post("/api/v1/query", json={"text": "What is ENSO?"}))
+            await asyncio.sleep(0.1)
+            conversations = await client.get("/api/v1/conversations")
+            # Answered before the query's 0.5s pipeline finishes
+            self.assertLess(time.perf_counter() - start, 0.4)
+            self.assertEqual(conversations.status_code, 200)
+            self.assertEqual((await query).json()["answer"], "An answer.")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
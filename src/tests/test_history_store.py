@@ -0,0 +1,111 @@
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..api.routes import get_db
+from ..app import app
+from ..models.history_models import MIGRATIONS, ChatMessage, ChatSession, _set_sqlite_pragmas, migrate
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TestHistoryMigrations(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, "chatbot.db")
+
+    def test_original_schema_upgraded_and_backfilled(self):
+        # The schema the history store shipped with, before any migration
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE chat_sessions (id VARCHAR PRIMARY KEY, chat_name VARCHAR)")
+            conn.execute(
+                "CREATE TABLE chat_messages (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id VARCHAR, "
+                "role VARCHAR, content VARCHAR, timestamp DATETIME)"
+            )
+            conn.execute("INSERT INTO chat_sessions VALUES ('old', 'Old chat')")
+            conn.execute("INSERT INTO chat_messages (session_id, role, content, timestamp) VALUES "
+                         "('old', 'user', 'Hi', '2024-01-01 10:00:00'), ('old', 'bot', 'Hello', '2024-01-02 10:00:00')")
+
+        engine = create_engine(f"sqlite:///{self.path}")
+        self.addCleanup(engine.dispose)
+        migrate(engine)
+        migrate(engine)  # a second start is a no-op
+
+        inspector = inspect(engine)
+        self.assertTrue({"created_at", "updated_at", "version"} <= {c["name"] for c in inspector.get_columns("chat_sessions")})
+        self.assertIn("ix_chat_messages_session_id_id", {i["name"] for i in inspector.get_indexes("chat_messages")})
+        self.assertIn("ix_chat_sessions_updated_at_id", {i["name"] for i in inspector.get_indexes("chat_sessions")})
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA user_version")).scalar(), len(MIGRATIONS))
+            created, updated, version = conn.execute(
+                text("SELECT created_at, updated_at, version FROM chat_sessions WHERE id = 'old'")
+            ).one()
+        self.assertEqual((created, updated, version), ("2024-01-01 10:00:00", "2024-01-02 10:00:00", 0))
+
+
+class TestHistoryPagination(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        path = os.path.join(self.tmpdir, "chatbot.db")
+        engine = create_engine(f"sqlite:///{path}")
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        self.addCleanup(engine.dispose)
+        migrate(engine)
+
+        # Five conversations, the later ones more recently active, and 25 messages in the first
+        start = datetime(2024, 1, 1)
+        with sessionmaker(bind=engine)() as db:
+            for n in range(5):
+                db.add(ChatSession(id=f"chat{n}", chat_name=f"Chat {n}", updated_at=start + timedelta(hours=n)))
+            db.add_all(ChatMessage(session_id="chat0", role="user", content=f"m{n}") for n in range(25))
+            db.commit()
+
+        # The routes read through the async session, here on the temporary file
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+        async def temporary_db():
+            async with sessions() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = temporary_db
+        self.addCleanup(app.dependency_overrides.pop, get_db, None)
+        self.client = TestClient(app)
+
+    def test_conversations_paginated_by_recency(self):
+        first = self.client.get("/api/v1/conversations", params={"limit": 2}).json()
+        self.assertEqual([c["id"] for c in first], ["chat4", "chat3"])
+        rest = self.client.get("/api/v1/conversations", params={"limit": 10, "before": "chat3"}).json()
+        self.assertEqual([c["id"] for c in rest], ["chat2", "chat1", "chat0"])
+
+        unknown = self.client.get("/api/v1/conversations", params={"before": "missing"})
+        self.assertEqual(unknown.status_code, 400)
+
+    def test_messages_paginated_backwards_in_chronological_order(self):
+        url = "/api/v1/chats/chat0/messages"
+        latest = self.client.get(url, params={"limit": 10}).json()
+        self.assertEqual([m["content"] for m in latest], [f"m{n}" for n in range(15, 25)])
+        older = self.client.get(url, params={"limit": 10, "before": latest[0]["id"]}).json()
+        self.assertEqual([m["content"] for m in older], [f"m{n}" for n in range(5, 15)])
+        oldest = self.client.get(url, params={"limit": 10, "before": older[0]["id"]}).json()
+        self.assertEqual([m["content"] for m in oldest], [f"m{n}" for n in range(5)])
+
+        self.assertEqual(self.client.get(url, params={"limit": 1000}).status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..models.history_models import ChatMessage, ChatSession, _set_sqlite_pragmas, migrate
+from ..services.history_writer import ChatHistoryWriter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TestChatHistoryWriter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        path = os.path.join(self.tmpdir, "chatbot.db")
+        engine = create_engine(f"sqlite:///{path}")
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        migrate(engine)
+        with sessionmaker(bind=engine)() as db:
+            db.add_all(ChatSession(id=f"chat{n}", chat_name=f"Chat {n}") for n in range(3))
+            db.commit()
+        engine.dispose()
+
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        event.listen(self.engine.sync_engine, "connect", _set_sqlite_pragmas)
+        sessions = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        # Number of transactions opened by the writer
+        self.transactions = 0
+
+        def session_factory():
+            self.transactions += 1
+            return sessions()
+
+        self.session_factory = session_factory
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    def writer(self, **kwargs):
+        kwargs.setdefault("durability", "async")
+        return ChatHistoryWriter(session_factory=self.session_factory, retry_backoff=0, **kwargs)
+
+    async def stored(self):
+        async with self.engine.connect() as conn:
+            rows = await conn.execute(select(ChatMessage.session_id, ChatMessage.content).order_by(ChatMessage.id))
+            versions = await conn.execute(select(ChatSession.id, ChatSession.version))
+            return rows.all(), dict(versions.all())
+
+    async def test_sync_mode_commits_before_returning(self):
+        writer = self.writer(durability="sync")
+        await writer.start()
+        self.assertFalse(writer.running)
+        await writer.save_turn("chat0", "What is ENSO?", "A climate pattern.")
+        messages, versions = await self.stored()
+        self.assertEqual(messages, [("chat0", "What is ENSO?"), ("chat0", "A climate pattern.")])
+        self.assertEqual(versions["chat0"], 1)
+
+    async def test_async_mode_batches_and_flushes_on_stop(self):
+        writer = self.writer(batch_size=10, flush_interval=0.5)
+        await writer.start()
+        for n in range(3):
+            await writer.save_turn(f"chat{n}", f"Question {n}", f"Answer {n}")
+        # Still waiting for more turns to join the batch
+        self.assertEqual((await self.stored())[0], [])
+
+        await writer.stop()
+        messages, versions = await self.stored()
+        self.assertEqual(len(messages), 6)
+        self.assertEqual(self.transactions, 1)
+        self.assertEqual(versions, {"chat0": 1, "chat1": 1, "chat2": 1})
+
+    async def test_bad_turn_dropped_alone(self):
+        writer = self.writer(batch_size=10, flush_interval=0.5, retries=1)
+        await writer.start()
+        await writer.save_turn("chat0", "Question 0", "Answer 0")
+        # SQLite cannot bind a dict, so every transaction containing this turn fails
+        await writer.save_turn("chat1", {"not": "text"}, "Answer 1")
+        await writer.save_turn("chat2", "Question 2", "Answer 2")
+        await writer.stop()
+
+        messages, versions = await self.stored()
+        self.assertEqual([content for _, content in messages], ["Question 0", "Answer 0", "Question 2", "Answer 2"])
+        self.assertEqual(versions, {"chat0": 1, "chat1": 0, "chat2": 1})
+        # Batch, one retry, then one transaction per turn
+        self.assertEqual(self.transactions, 5)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
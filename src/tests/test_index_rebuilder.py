@@ -0,0 +1,139 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from ..services.index_rebuilder import IndexRebuilder
+from ..services.index_versions import (
+    active_persist_directory,
+    hold_index_directory,
+    new_version_directory,
+    remove_index_directory,
+    remove_retired_versions,
+    set_active_version,
+)
+from ..services.retrieval_cache import read_index_generation
+from ..services.system_manager import SystemManager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class FakeRAGSystem:
+    abstract_store = content_store = digest_store = None
+
+
+class TestIndexVersions(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_original_layout_until_a_version_is_activated(self):
+        self.assertEqual(active_persist_directory(self.root), self.root)
+        directory = new_version_directory(self.root)
+        self.assertEqual(active_persist_directory(self.root), self.root)
+        set_active_version(directory, self.root)
+        self.assertEqual(active_persist_directory(self.root), directory)
+        self.assertNotEqual(new_version_directory(self.root), directory)
+
+    def test_removing_the_original_layout_keeps_the_versions(self):
+        for subdir in ("abstract", "content", "digest"):
+            os.makedirs(os.path.join(self.root, subdir))
+        directory = new_version_directory(self.root)
+        set_active_version(directory, self.root)
+        remove_index_directory(self.root, self.root)
+        self.assertEqual(sorted(os.listdir(self.root)), ["CURRENT", "versions"])
+        remove_index_directory(directory, self.root)
+        self.assertFalse(os.path.exists(directory))
+
+
+class TestIndexSwap(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.addCleanup(SystemManager.reset)
+        self.old = FakeRAGSystem()
+        SystemManager._root = self.root
+        SystemManager.swap(self.old, self.root)
+
+    def test_swap_waits_for_in_flight_requests(self):
+        started, finish = threading.Event(), threading.Event()
+        served = []
+
+        def request():
+            with SystemManager.lease() as rag_system:
+                started.set()
+                finish.wait()
+                served.append(rag_system)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        started.wait()
+
+        new = FakeRAGSystem()
+        directory = new_version_directory(self.root)
+        previous, previous_directory = SystemManager.activate(new, directory)
+        self.assertIs(previous, self.old)
+        self.assertEqual(previous_directory, self.root)
+        self.assertGreater(read_index_generation(self.root), 0)
+
+        # New requests use the new version while the running one drains on the old
+        with SystemManager.lease() as rag_system:
+            self.assertIs(rag_system, new)
+        self.assertFalse(SystemManager.drain(self.old, timeout=0.1))
+        finish.set()
+        thread.join()
+        self.assertTrue(SystemManager.drain(self.old, timeout=1))
+        self.assertEqual(served, [self.old])
+
+    def test_retired_directory_removed_after_drain(self):
+        directory = new_version_directory(self.root)
+        SystemManager.activate(FakeRAGSystem(), directory)
+        os.makedirs(os.path.join(self.root, "content"))
+
+        rebuilder = IndexRebuilder(root=self.root, drain_timeout=1)
+        rebuilder.retire(self.old, self.root, swapped_at=0)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "content")))
+        self.assertTrue(os.path.exists(directory))
+
+    def test_directory_kept_while_another_worker_serves_from_it(self):
+        directory = new_version_directory(self.root)
+        SystemManager.activate(FakeRAGSystem(), directory)
+        os.makedirs(os.path.join(self.root, "content"))
+        other_worker = hold_index_directory(self.root)
+
+        IndexRebuilder(root=self.root, drain_timeout=1).retire(self.old, self.root, swapped_at=0)
+        self.assertTrue(os.path.exists(os.path.join(self.root, "content")))
+        self.assertNotIn(id(self.old), SystemManager._holds)
+
+        # Once the other worker lets go, the next start removes it
+        other_worker.close()
+        remove_retired_versions(self.root)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "content")))
+        self.assertTrue(os.path.exists(directory))
+
+    def test_other_workers_follow_the_active_version(self):
+        directory = new_version_directory(self.root)
+        set_active_version(directory, self.root)
+        opened = []
+        with mock.patch.object(SystemManager, "_open_stores", lambda path: opened.append(path) or (None, None)), \
+                mock.patch.object(SystemManager, "create", lambda abstract, content, path: FakeRAGSystem()):
+            instance = SystemManager.get_instance()
+        self.assertIsNot(instance, self.old)
+        self.assertIs(SystemManager.get_instance(), instance)
+        self.assertEqual(opened, [directory])
+
+        # The follower closes its previous instance in the background
+        deadline = time.monotonic() + 5
+        while id(self.old) in SystemManager._holds and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertNotIn(id(self.old), SystemManager._holds)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,204 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ..services.index_versions import ingest_leader_lock
+from ..services.ingestion import IngestQueue, IngestWorker
+from ..services.retrieval_cache import read_index_generation
+from ..services.system_manager import SystemManager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def thesis(n, text="Rainfall trends in Sabah."):
+    return {
+        "Title": f"Thesis {n}",
+        "Abstract": f"Abstract of thesis {n}.",
+        "Year": 2020,
+        "full_text": text,
+        "clickable_url": f"https://theses.example/{n}",
+    }
+
+
+def open_fake_stores(directory):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    return (Chroma("abstract_collection", embeddings, persist_directory=f"{directory}/abstract"),
+            Chroma("content_collection", embeddings, persist_directory=f"{directory}/content"))
+
+
+class FakeRAGSystem:
+    digest_store = None
+
+    def __init__(self, abstract_store, content_store, persist_directory=None):
+        self.abstract_store = abstract_store
+        self.content_store = content_store
+
+
+def sources_found(rag_system):
+    return sorted(doc.metadata["source"] for doc in rag_system.abstract_store.similarity_search("thesis", k=10))
+
+
+def serve_across_ingestion(root, ready, ingested, results):
+    """A serving worker: opens the stores before the leader ingests, then answers again after it did."""
+    with mock.patch.object(SystemManager, "_open_stores", open_fake_stores), \
+            mock.patch.object(SystemManager, "create", FakeRAGSystem):
+        SystemManager.initialize(root)
+        results.put(sources_found(SystemManager.get_instance()))
+        ready.set()
+        ingested.wait(60)
+        with SystemManager.lease() as rag_system:
+            results.put(sources_found(rag_system))
+
+
+class TestIngestQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.queue = IngestQueue(os.path.join(self.tmpdir, "jobs.db"))
+
+    def test_job_claimed_once_and_resumed_when_stale(self):
+        job = self.queue.enqueue([thesis(1), thesis(2)])
+        self.assertEqual((job["state"], job["total"], job["processed"]), ("queued", 2, 0))
+
+        job_id, records, processed = self.queue.claim()
+        self.assertEqual((job_id, len(records), processed), (job["id"], 2, 0))
+        # Another process sharing the file cannot take it while it makes progress
+        self.assertIsNone(IngestQueue(self.queue.path).claim())
+
+        self.queue.progress(job_id, 1, abstracts=1, chunks=3)
+        time.sleep(0.01)
+        self.assertEqual(self.queue.claim(stale_after=0)[1:], (records, 1))
+
+    def test_finished_jobs_report_and_replay(self):
+        job_id = self.queue.enqueue([thesis(1), thesis(2)])["id"]
+        self.queue.claim()
+        self.queue.progress(job_id, 1, abstracts=1, chunks=1)
+        self.assertEqual(list(self.queue.ingested_records()), [[thesis(1)]])
+        self.queue.finish(job_id, error="boom")
+        self.assertEqual(self.queue.get(job_id)["state"], "failed")
+        self.assertEqual(self.queue.recent(10)[0]["error"], "boom")
+        self.assertIsNone(self.queue.get("missing"))
+
+    def test_pause_holds_off_every_process(self):
+        job_id = self.queue.enqueue([thesis(1)])["id"]
+        other = IngestQueue(self.queue.path)
+        other.pause("rebuild", ttl=30)
+        self.assertIsNone(self.queue.claim())
+        self.assertFalse(self.queue.begin_batch(job_id))
+
+        other.resume("rebuild")
+        self.assertEqual(self.queue.claim()[0], job_id)
+        self.assertTrue(self.queue.begin_batch(job_id))
+        self.assertEqual(other.batches_running(), 1)
+        self.queue.end_batch(job_id)
+        self.assertEqual(other.batches_running(), 0)
+
+        # A pause its holder stopped renewing lapses
+        other.pause("crashed", ttl=-1)
+        self.assertTrue(self.queue.begin_batch(job_id))
+
+
+class TestIngestWorker(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.addCleanup(SystemManager.reset)
+        # The leader lock sits beside the root
+        self.root = os.path.join(self.tmpdir, "chroma_db")
+        self.rag_system = FakeRAGSystem(*open_fake_stores(self.root))
+        SystemManager._root = self.root
+        SystemManager.swap(self.rag_system, self.root)
+        self.worker = IngestWorker(IngestQueue(os.path.join(self.tmpdir, "jobs.db")), root=self.root,
+                                   batch_size=2, max_defer=0, poll_interval=0.05)
+        self.addCleanup(self.worker.stop, 10)
+
+    def run_job(self, records):
+        job = self.worker.submit(records)
+        self.worker.process(*self.worker.queue.claim())
+        return self.worker.queue.get(job["id"])
+
+    def test_theses_upserted_in_batches(self):
+        job = self.run_job([thesis(1), thesis(2), thesis(3)])
+        self.assertEqual((job["state"], job["processed"], job["abstracts"]), ("completed", 3, 3))
+        self.assertEqual(len(self.rag_system.abstract_store.get()["ids"]), 3)
+        self.assertGreater(read_index_generation(self.root), 0)
+        # The stores of the process that ingested already show the theses, so it does not reopen them
+        SystemManager.get_instance()
+        self.assertIs(SystemManager._instance, self.rag_system)
+
+        # Resubmitting a thesis replaces its abstract and chunks
+        self.run_job([thesis(2, text="Revised rainfall trends in Sabah.")])
+        stored = self.rag_system.content_store.get(where={"source": "https://theses.example/2"})
+        self.assertEqual(stored["documents"], ["Revised rainfall trends in Sabah."])
+        self.assertEqual(len(self.rag_system.abstract_store.get()["ids"]), 3)
+
+    def test_paused_worker_waits_before_next_batch(self):
+        job_id = self.worker.submit([thesis(1)])["id"]
+        claimed = self.worker.queue.claim()
+        with self.worker.paused():
+            thread = threading.Thread(target=self.worker.process, args=claimed)
+            thread.start()
+            time.sleep(0.2)
+            self.assertEqual(self.worker.queue.get(job_id)["processed"], 0)
+        thread.join()
+        self.assertEqual(self.worker.queue.get(job_id)["state"], "completed")
+
+    def test_pause_waits_for_batches_of_other_processes(self):
+        other = IngestQueue(self.worker.queue.path)
+        other.begin_batch("elsewhere")
+        threading.Timer(0.2, other.end_batch, args=("elsewhere",)).start()
+        start = time.monotonic()
+        with self.worker.paused():
+            self.assertGreaterEqual(time.monotonic() - start, 0.2)
+            self.assertIsNone(other.claim())
+        self.assertEqual(other.batches_running(), 0)
+
+    def wait_for(self, job_id, state="completed", timeout=30):
+        deadline = time.monotonic() + timeout
+        while self.worker.queue.get(job_id)["state"] != state and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.worker.queue.get(job_id)["state"]
+
+    def test_only_the_leader_ingests(self):
+        # Held by another worker, which stops after a while
+        lead = ingest_leader_lock(self.root)
+        self.assertIsNotNone(lead)
+        self.worker.start()
+        job_id = self.worker.submit([thesis(1)])["id"]
+        time.sleep(0.3)
+        self.assertEqual(self.worker.queue.get(job_id)["state"], "queued")
+
+        lead.close()
+        self.assertEqual(self.wait_for(job_id), "completed")
+        self.assertIsNone(ingest_leader_lock(self.root))
+
+    def test_other_worker_serves_ingested_thesis(self):
+        self.run_job([thesis(1)])
+        context = multiprocessing.get_context("spawn")
+        ready, ingested, results = context.Event(), context.Event(), context.Queue()
+        other = context.Process(target=serve_across_ingestion, args=(self.root, ready, ingested, results))
+        other.start()
+        self.addCleanup(other.join, 30)
+        self.assertTrue(ready.wait(60))
+        self.assertEqual(results.get(timeout=10), ["https://theses.example/1"])
+
+        self.worker.start()
+        job_id = self.worker.submit([thesis(2)])["id"]
+        self.assertEqual(self.wait_for(job_id), "completed")
+        ingested.set()
+        self.assertEqual(results.get(timeout=60), ["https://theses.example/1", "https://theses.example/2"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,97 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from ..services import memory_manager
+from ..services.checkpointer import SQLiteCheckpointer
+from ..services.memory_manager import RAGMemoryManager, split_window, truncate_message
+from .test_checkpointer import RecordingRAG
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def words(n):
+    """Text of exactly `n` estimated tokens."""
+    return "abcd" * n
+
+
+class TestSplitWindow(unittest.TestCase):
+    def test_longest_suffix_within_budget(self):
+        messages = [HumanMessage(content=words(40)), AIMessage(content=words(30)),
+                    HumanMessage(content=words(20)), AIMessage(content=words(10))]
+        older, recent = split_window(messages, 60)
+        self.assertEqual((older, recent), (messages[:1], messages[1:]))
+        older, recent = split_window(messages, 59)
+        self.assertEqual((older, recent), (messages[:2], messages[2:]))
+
+    def test_window_does_not_start_on_a_tool_result(self):
+        messages = [HumanMessage(content=words(10)), AIMessage(content=words(50)),
+                    ToolMessage(content=words(10), tool_call_id="1"), HumanMessage(content=words(10))]
+        older, recent = split_window(messages, 25)
+        self.assertEqual(recent, messages[1:])
+
+    def test_oversized_last_message_kept_and_truncated(self):
+        messages = [HumanMessage(content=words(10)), HumanMessage(content=words(500), id="big")]
+        older, recent = split_window(messages, 100)
+        self.assertEqual((older, recent), (messages[:1], messages[1:]))
+
+        truncated = truncate_message(recent[-1], 100)
+        self.assertEqual(truncated.id, "big")
+        self.assertLessEqual(memory_manager.count_tokens([truncated]), 105)
+        self.assertIs(truncate_message(messages[0], 100), messages[0])
+
+
+class TestMemoryCompaction(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        patcher = mock.patch.object(memory_manager, "MEMORY_TOKEN_BUDGET", 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = RAGMemoryManager(
+            RecordingRAG(), checkpointer=SQLiteCheckpointer(os.path.join(self.tmpdir, "checkpoints.db"))
+        )
+        self.config = {"configurable": {"thread_id": "chat"}}
+
+    def ask(self, text):
+        with mock.patch.object(self.manager, "summarize", wraps=self.manager.summarize) as summarize:
+            self.manager.process_query_with_memory(text, "chat")
+        return summarize.call_count
+
+    def state(self):
+        return self.manager.app.get_state(self.config).values
+
+    def test_summarized_messages_removed_from_checkpoint(self):
+        # Each turn adds ~30 tokens (question) plus a short answer
+        calls = [self.ask(words(30)) for _ in range(3)]
+        self.assertEqual(calls, [0, 0, 0])
+        self.assertEqual(len(self.state()["messages"]), 6)
+
+        # Over the budget of 100: compacted down to half of it and summarized once
+        self.assertEqual(self.ask(words(30)), 1)
+        state = self.state()
+        self.assertEqual(state["summary"], "summary")
+        self.assertLessEqual(memory_manager.count_tokens(state["messages"]), 50 + 5)
+        context = self.manager.rag_system.contexts[-1]
+        self.assertEqual(context[0].type, "system")
+        self.assertIn("summary", context[0].content)
+
+        # Hysteresis: the next turn fits again and does not summarize
+        self.assertEqual(self.ask(words(10)), 0)
+
+    def test_oversized_question_truncated_for_the_model(self):
+        self.ask(words(1000))
+        question = self.manager.rag_system.contexts[-1][-1]
+        self.assertLessEqual(memory_manager.count_tokens([question]), 105)
+        self.assertTrue(question.content.endswith("[truncated]"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
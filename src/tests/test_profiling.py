@@ -0,0 +1,60 @@
+import logging
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..utils import profiling
+from ..utils.profiling import profile, reset_profiling, set_profiling
+from ..utils.tracing import reset_request_id, set_request_id
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def slow_pipeline_step():
+    return sum(i * i for i in range(200_000))
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        patcher = mock.patch.object(profiling, "PROFILE_DIR", os.path.join(self.tmpdir, "profiles"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        token = set_request_id("req123")
+        self.addCleanup(reset_request_id, token)
+
+    def test_off_unless_enabled_for_the_request(self):
+        with profile("query"):
+            slow_pipeline_step()
+        self.assertFalse(os.path.exists(profiling.PROFILE_DIR))
+
+    def test_profile_written_under_request_id(self):
+        files = []
+        token = set_profiling(files)
+        try:
+            with profile("query"):
+                slow_pipeline_step()
+        finally:
+            reset_profiling(token)
+
+        self.assertEqual(len(files), 1)
+        self.assertTrue(os.path.basename(files[0]).startswith("req123-query."))
+        if files[0].endswith(".prof"):
+            functions = {name for _, _, name in pstats.Stats(files[0]).stats}
+            self.assertIn("slow_pipeline_step", functions)
+        else:
+            with open(files[0]) as f:
+                self.assertIn("slow_pipeline_step", f.read())
+
+    def test_sampling_disabled_by_default(self):
+        self.assertFalse(any(profiling.sampled() for _ in range(1000)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
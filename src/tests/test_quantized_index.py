@@ -0,0 +1,212 @@
+import logging
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ..services.quantized_index import QuantizedChroma, QuantizedIndex
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def clustered_vectors(n, dim=384, clusters=20, seed=0):
+    """Unit vectors around a few centres, like sentence embeddings of a topical corpus"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def recall_at_k(index, vectors, queries, k=10):
+    hits = 0
+    for query in queries:
+        exact = set(np.argsort(((vectors - query) ** 2).sum(axis=1))[:k])
+        found = {int(id_) for id_, _ in index.search(query, k)}
+        hits += len(exact & found)
+    return hits / (k * len(queries))
+
+
+class TestQuantizedIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.vectors = clustered_vectors(3000)
+        # Queries close to some documents, as a question is to the passages answering it
+        rng = np.random.default_rng(1)
+        queries = self.vectors[rng.integers(0, len(self.vectors), 30)] + 0.03 * rng.normal(size=(30, self.vectors.shape[1]))
+        self.queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+        self.ids = [str(i) for i in range(len(self.vectors))]
+
+    def test_recall_and_memory(self):
+        for mode, min_recall, max_ratio in (("int8", 0.95, 0.26), ("binary", 0.8, 0.04)):
+            with self.subTest(mode=mode):
+                index = QuantizedIndex(f"{self.tmpdir}/{mode}", mode)
+                index.build(self.ids, self.vectors)
+                recall = recall_at_k(index, self.vectors, self.queries)
+                logger.info(f"{mode}: recall@10 {recall:.3f}, {index.memory_bytes()} bytes in memory")
+                self.assertGreaterEqual(recall, min_recall)
+                self.assertLessEqual(index.memory_bytes() / self.vectors.nbytes, max_ratio)
+
+    def test_distances_are_exact_and_index_reloads(self):
+        index = QuantizedIndex(self.tmpdir, "int8")
+        index.build(self.ids[:2000], self.vectors[:2000])
+        index.add(self.ids[2000:], self.vectors[2000:])
+
+        reloaded = QuantizedIndex.load(self.tmpdir)
+        query = self.vectors[2500]
+        (best_id, distance), = reloaded.search(query, k=1)
+        self.assertEqual(best_id, "2500")
+        self.assertAlmostEqual(distance, 0.0, places=5)
+
+        hits = reloaded.search(query, k=5, allowed_ids=["1", "2", "3"])
+        self.assertEqual({id_ for id_, _ in hits}, {"1", "2", "3"})
+        expected = sorted(float(((self.vectors[i] - query) ** 2).sum()) for i in (1, 2, 3))
+        np.testing.assert_allclose([d for _, d in hits], expected, rtol=1e-5)
+
+    def test_removed_rows_do_not_crowd_out_the_shortlist(self):
+        index = QuantizedIndex(self.tmpdir, "int8")
+        index.build(self.ids, self.vectors)
+        query = self.vectors[0]
+        nearest = np.argsort(((self.vectors - query) ** 2).sum(axis=1))
+        # Remove more neighbours than the shortlist (k * rescore factor) holds
+        index.remove([str(i) for i in nearest[:100]])
+        hits = index.search(query, k=5, rescore_factor=4)
+        self.assertEqual([id_ for id_, _ in hits], [str(i) for i in nearest[100:105]])
+
+    def test_search_during_concurrent_adds(self):
+        index = QuantizedIndex(self.tmpdir, "int8")
+        index.build(self.ids[:500], self.vectors[:500])
+        errors = []
+
+        def search():
+            try:
+                for query in self.queries:
+                    for id_, _ in index.search(query, k=10):
+                        self.assertIsNotNone(id_)
+            except Exception as e:
+                errors.append(e)
+
+        searchers = [threading.Thread(target=search) for _ in range(4)]
+        for thread in searchers:
+            thread.start()
+        for start in range(500, 3000, 100):
+            index.add(self.ids[start:start + 100], self.vectors[start:start + 100])
+            index.remove([self.ids[start - 1]])
+        for thread in searchers:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(index.ids), 3000)
+
+    def test_changes_by_other_processes(self):
+        # Separate instances on the same files, as in separate server workers
+        first = QuantizedIndex(self.tmpdir, "int8")
+        first.build(self.ids[:1000], self.vectors[:1000])
+        second = QuantizedIndex.load(self.tmpdir)
+        first.add(self.ids[1000:2000], self.vectors[1000:2000])
+        # Numbered after the rows the first one added, not from its stale state
+        second.add(self.ids[2000:], self.vectors[2000:])
+        second.remove(["5"])
+
+        # The first one sees them on its next search
+        self.assertEqual(first.search(self.vectors[2500], k=1)[0][0], "2500")
+        self.assertNotEqual(first.search(self.vectors[5], k=1)[0][0], "5")
+        reloaded = QuantizedIndex.load(self.tmpdir)
+        self.assertEqual(len(reloaded.ids), 3000)
+        for i in (10, 1500, 2999):
+            (best_id, distance), = reloaded.search(self.vectors[i], k=1)
+            self.assertEqual((best_id, round(distance, 5)), (str(i), 0.0))
+
+    def test_concurrent_adds_from_several_processes(self):
+        QuantizedIndex(self.tmpdir, "int8").build(self.ids[:600], self.vectors[:600])
+        workers = [QuantizedIndex.load(self.tmpdir) for _ in range(4)]
+
+        def ingest(index, first):
+            for start in range(first, 3000, 400):
+                index.add(self.ids[start:start + 100], self.vectors[start:start + 100])
+
+        threads = [threading.Thread(target=ingest, args=(index, 600 + 100 * n)) for n, index in enumerate(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        reloaded = QuantizedIndex.load(self.tmpdir)
+        self.assertEqual(sorted(reloaded.ids), sorted(self.ids))
+        for i in range(0, 3000, 97):
+            (best_id, distance), = reloaded.search(self.vectors[i], k=1)
+            self.assertEqual((best_id, round(distance, 5)), (str(i), 0.0))
+
+
+class LookupEmbeddings(Embeddings):
+    """Embeds the texts "0", "1", ... as the corresponding test vector"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[int(text)].tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[int(text)].tolist()
+
+
+class TestQuantizedChroma(unittest.TestCase):
+    def test_search_with_metadata_filter(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        vectors = clustered_vectors(200)
+        store = QuantizedChroma(
+            collection_name="test_quantized",
+            embedding_function=LookupEmbeddings(vectors),
+            persist_directory=f"{tmpdir}/chroma",
+            index_path=f"{tmpdir}/quantized",
+            quantization="int8",
+        )
+        store.add_texts([str(i) for i in range(200)], metadatas=[{"year": 2000 + i % 10} for i in range(200)])
+
+        docs = store.similarity_search("42", k=3)
+        self.assertEqual(docs[0].page_content, "42")
+        docs = store.similarity_search("42", k=3, filter={"year": 2003})
+        self.assertEqual(len(docs), 3)
+        self.assertTrue(all(doc.metadata["year"] == 2003 for doc in docs))
+
+        # The filter is evaluated by Chroma once, until the index changes
+        with mock.patch.object(store, "get", wraps=store.get) as get:
+            store.similarity_search("43", k=3, filter={"year": 2003})
+            self.assertEqual(len([c for c in get.call_args_list if "where" in c.kwargs]), 0)
+            store.add_texts(["199"], metadatas=[{"year": 2003}], ids=["199-again"])
+            docs = store.similarity_search("199", k=2, filter={"year": 2003})
+            self.assertEqual(docs[0].id, "199-again")
+            self.assertEqual(len([c for c in get.call_args_list if "where" in c.kwargs]), 1)
+
+    def test_deleted_documents_not_returned(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        vectors = clustered_vectors(50)
+        store = QuantizedChroma(
+            collection_name="test_quantized_delete",
+            embedding_function=LookupEmbeddings(vectors),
+            persist_directory=f"{tmpdir}/chroma",
+            index_path=f"{tmpdir}/quantized",
+            quantization="int8",
+        )
+        ids = store.add_texts([str(i) for i in range(50)])
+        store.delete(ids=[ids[42]])
+        store.add_texts(["42"], ids=["42-again"])
+
+        docs = store.similarity_search("42", k=3)
+        self.assertEqual([doc.id for doc in docs].count("42-again"), 1)
+        self.assertNotIn(ids[42], [doc.id for doc in docs])
+        self.assertEqual(len(docs), 3)
+        # The removal survives a reload
+        self.assertNotIn(ids[42], QuantizedIndex.load(f"{tmpdir}/quantized")._rows)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,183 @@
+import json
+import logging
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from ..custom_classes.redpill_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RedPillClient,
+    UpstreamError,
+)
+from ..utils.deadline import request_deadline
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+OK_BODY = {"choices": [{"message": {"content": "hello"}}], "usage": {"prompt_tokens": 3, "completion_tokens": 1}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Replays the server's script: one (status, delay, headers) step per request, the last step repeats."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            step = server.script[min(server.calls, len(server.script) - 1)]
+            server.calls += 1
+        status, delay, headers = step
+        time.sleep(delay)
+        body = json.dumps(OK_BODY if status == 200 else {"error": "injected"}).encode()
+        try:
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRedPillClient(unittest.TestCase):
+    def start_stub(self, script):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        server.script = script
+        server.calls = 0
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    def make_client(self, **kwargs):
+        options = dict(connect_timeout=1, read_timeout=1, max_retries=3, backoff_base=0.01, backoff_max=0.05)
+        options.update(kwargs)
+        return RedPillClient(**options)
+
+    def test_retries_rate_limit_and_honors_retry_after(self):
+        """A 429 with Retry-After is retried after (at least) the advertised delay"""
+        server, url = self.start_stub([(429, 0, {"Retry-After": "0.2"}), (200, 0, {})])
+        client = self.make_client(backoff_max=1)
+
+        start = time.perf_counter()
+        body = client.post(url, {}, {"model": "m"})
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(body, OK_BODY)
+        self.assertEqual(server.calls, 2)
+        self.assertGreaterEqual(elapsed, 0.2)
+
+    def test_client_errors_are_not_retried(self):
+        """A 400 is the caller's fault: fail immediately"""
+        server, url = self.start_stub([(400, 0, {})])
+        client = self.make_client()
+
+        with self.assertRaises(UpstreamError) as ctx:
+            client.post(url, {}, {})
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(server.calls, 1)
+        self.assertEqual(client.circuit_breaker.state, "closed")
+
+    def test_timeout_is_retried(self):
+        """A stalled response hits the read timeout and the retry succeeds"""
+        server, url = self.start_stub([(200, 1.0, {}), (200, 0, {})])
+        client = self.make_client(read_timeout=0.2)
+
+        self.assertEqual(client.post(url, {}, {}), OK_BODY)
+        self.assertEqual(server.calls, 2)
+
+    def test_no_retry_past_deadline(self):
+        """A retry that could only be sent after the request's deadline is not attempted"""
+        server, url = self.start_stub([(429, 0, {"Retry-After": "0.5"}), (200, 0, {})])
+        client = self.make_client(backoff_max=1)
+
+        start = time.perf_counter()
+        with request_deadline(0.2), self.assertRaises(UpstreamError):
+            client.post(url, {}, {})
+        self.assertEqual(server.calls, 1)
+        self.assertLess(time.perf_counter() - start, 0.2)
+
+    def test_circuit_opens_and_fails_fast(self):
+        """Consecutive failed calls open the circuit; later calls are rejected without reaching the server"""
+        server, url = self.start_stub([(503, 0, {})])
+        client = self.make_client(max_retries=1, circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.3))
+
+        for _ in range(2):
+            with self.assertRaises(UpstreamError):
+                client.post(url, {}, {})
+        self.assertEqual(client.circuit_breaker.state, "open")
+
+        calls = server.calls
+        with self.assertRaises(CircuitOpenError):
+            client.post(url, {}, {})
+        self.assertEqual(server.calls, calls)
+
+        # After the reset timeout a trial request goes through and closes the circuit
+        server.script = [(200, 0, {})]
+        time.sleep(0.35)
+        self.assertEqual(client.post(url, {}, {}), OK_BODY)
+        self.assertEqual(client.circuit_breaker.state, "closed")
+
+    def test_retried_call_counts_as_one_failure(self):
+        """A call that fails all its attempts is one failure; a 409 is neither retried nor counted"""
+        server, url = self.start_stub([(429, 0, {})])
+        client = self.make_client(max_retries=3, circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+
+        with self.assertRaises(UpstreamError):
+            client.post(url, {}, {})
+        self.assertEqual(server.calls, 4)
+        self.assertEqual(client.circuit_breaker.state, "closed")
+
+        server.script = [(409, 0, {})]
+        with self.assertRaises(UpstreamError) as ctx:
+            client.post(url, {}, {})
+        self.assertEqual(ctx.exception.status_code, 409)
+        self.assertEqual(server.calls, 5)
+        self.assertEqual(client.circuit_breaker.state, "closed")
+
+    def test_unexpected_error_ends_half_open_trial(self):
+        """A trial call failing with a non-requests error re-opens the circuit instead of blocking it"""
+        server, url = self.start_stub([(200, 0, {})])
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        client = self.make_client(circuit_breaker=breaker)
+        breaker.record_failure()
+        time.sleep(0.15)
+        self.assertEqual(breaker.state, "half-open")
+
+        with mock.patch.object(client, "_send", side_effect=RuntimeError("hedge pool shut down")):
+            with self.assertRaises(RuntimeError):
+                client.post(url, {}, {})
+        self.assertEqual(breaker.state, "open")
+
+        time.sleep(0.15)
+        self.assertEqual(client.post(url, {}, {}), OK_BODY)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_hedged_request_cuts_tail_latency(self):
+        """A slow first attempt is hedged after the p95 delay and the faster hedge wins"""
+        server, url = self.start_stub([(200, 2.0, {}), (200, 0, {})])
+        client = self.make_client(read_timeout=5, hedge_enabled=True, hedge_min_delay=0.1, hedge_min_samples=3)
+        for _ in range(3):
+            client.latencies.add(0.05)
+
+        start = time.perf_counter()
+        self.assertEqual(client.post(url, {}, {}), OK_BODY)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Hedged call took {elapsed:.2f}s")
+
+        self.assertEqual(server.calls, 2)
+        self.assertLess(elapsed, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
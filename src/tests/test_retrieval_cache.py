@@ -0,0 +1,82 @@
+import logging
+import shutil
+import tempfile
+import unittest
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ..services.retrieval_cache import RetrievalCache, bump_index_generation, read_index_generation
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    queries: int = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+class TestRetrievalCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.embeddings = CountingEmbedding(size=16)
+        self.store = Chroma(
+            collection_name="content_collection",
+            embedding_function=self.embeddings,
+            persist_directory=self.tmpdir,
+        )
+        self.store.add_documents(
+            [Document(page_content=f"Chunk {i} on floods", metadata={"year": 2015 + i}) for i in range(8)],
+            ids=[f"chunk-{i}" for i in range(8)],
+        )
+        self.cache = RetrievalCache(self.tmpdir, max_entries=16)
+
+    def search(self, query, **kwargs):
+        return self.cache.similarity_search(self.store, query, {"k": 3, **kwargs})
+
+    def test_repeated_search_skips_embedding_and_index(self):
+        first = self.search("flood risk")
+        again = self.search("  flood   risk ")
+        self.assertEqual(self.embeddings.queries, 1)
+        self.assertEqual([doc.id for doc in again], [doc.id for doc in first])
+        self.assertEqual([doc.page_content for doc in again], [doc.page_content for doc in first])
+        self.assertEqual(again[0].metadata, first[0].metadata)
+
+    def test_filter_and_k_are_part_of_the_key(self):
+        self.search("flood risk")
+        self.search("flood risk", filter={"year": {"$gte": 2020}})
+        self.cache.similarity_search(self.store, "flood risk", {"k": 5})
+        self.assertEqual(self.embeddings.queries, 3)
+        self.assertEqual(len(self.cache), 3)
+
+    def test_new_generation_invalidates_entries(self):
+        self.search("flood risk")
+        self.store.add_documents([Document(page_content="Chunk 8 on floods")], ids=["chunk-8"])
+        generation = bump_index_generation(self.tmpdir)
+        self.assertEqual(read_index_generation(self.tmpdir), generation)
+
+        self.search("flood risk")
+        self.assertEqual(self.embeddings.queries, 2)
+        # Another process's cache sees the bump too
+        self.assertEqual(RetrievalCache(self.tmpdir).generation(), generation)
+
+    def test_least_recently_used_entry_evicted(self):
+        cache = RetrievalCache(self.tmpdir, max_entries=2)
+        for query in ("floods", "droughts", "floods", "haze"):
+            cache.similarity_search(self.store, query, {"k": 2})
+        self.assertEqual(len(cache), 2)
+        cache.similarity_search(self.store, "floods", {"k": 2})
+        cache.similarity_search(self.store, "droughts", {"k": 2})
+        # floods stayed (used recently), droughts was evicted and searched again
+        self.assertEqual(self.embeddings.queries, 4)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.request
+from unittest import mock
+
+from .. import serve
+from ..services import system_manager
+from ..services.system_manager import SystemManager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Serves a stub app through the real server configuration (post_fork included)
+SMOKE_SERVER = """
+import os, sys
+from fastapi import FastAPI
+from src import serve
+
+app = FastAPI()
+
+@app.get("/ping")
+def ping():
+    return {"pid": os.getpid()}
+
+serve.RAGServer.load = lambda self: app
+options = serve.server_options()
+options.update(bind=f"127.0.0.1:{sys.argv[1]}", workers=2)
+serve.RAGServer(options).run()
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestServerConfig(unittest.TestCase):
+    def test_gunicorn_settings(self):
+        cfg = serve.RAGServer(serve.server_options()).cfg
+        self.assertEqual(cfg.workers, serve.SERVER_WORKERS)
+        self.assertEqual(cfg.worker_class_str, "uvicorn.workers.UvicornWorker")
+        self.assertEqual(cfg.bind, [f"{serve.SERVER_HOST}:{serve.SERVER_PORT}"])
+        self.assertTrue(cfg.preload_app)
+        self.assertIs(cfg.post_fork, serve.post_fork)
+
+    def test_workers_serve_requests(self):
+        port = free_port()
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        server = subprocess.Popen([sys.executable, "-c", SMOKE_SERVER, str(port)], cwd=root,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.addCleanup(server.wait, 10)
+        self.addCleanup(server.terminate)
+
+        pids = set()
+        deadline = time.monotonic() + 30
+        while len(pids) < 2 and time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ping", timeout=2) as response:
+                    pids.add(json.load(response)["pid"])
+            except OSError:
+                time.sleep(0.2)
+        self.assertIsNone(server.poll())
+        self.assertGreaterEqual(len(pids), 1)
+        self.assertNotIn(server.pid, pids)
+
+
+class TestFirstStart(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.root = os.path.join(self.tmpdir, "chroma_db")
+        self.builds = 0
+
+    def fake_build(self, data_path, directory):
+        self.builds += 1
+        time.sleep(0.2)
+        os.makedirs(directory)
+        return None, None, {}
+
+    def test_stores_built_once_by_concurrent_starts(self):
+        with mock.patch.object(system_manager, "preprocess_and_store_data", side_effect=self.fake_build):
+            threads = [threading.Thread(target=SystemManager.build_index, args=(self.root,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.builds, 1)
+
+    def test_master_builds_only_when_missing(self):
+        context = mock.Mock()
+        context.Process.return_value.exitcode = 1
+        with mock.patch.object(serve.multiprocessing, "get_context", return_value=context):
+            with self.assertRaises(RuntimeError):
+                serve.build_index(self.root)
+            context.Process.assert_called_once_with(target=SystemManager.build_index, args=(self.root,),
+                                                    name="index-build")
+
+            os.makedirs(self.root)
+            context.reset_mock()
+            serve.build_index(self.root)
+            context.Process.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,70 @@
+import logging
+import threading
+import time
+import unittest
+
+from ..utils.singleflight import SingleFlight, canonical_key
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, fn, n=8):
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(fn())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_identical_calls_run_once(self):
+        """Concurrent callers with the same key share one execution"""
+        flights = SingleFlight("test")
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"docs": ["a", "b"]}
+
+        results, errors = self.run_concurrently(lambda: flights.do("key", slow_call))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"docs": ["a", "b"]}] * 8)
+        # Every caller owns its result
+        self.assertEqual(len({id(r) for r in results}), 8)
+
+    def test_errors_are_shared_and_not_cached(self):
+        """Followers see the leader's error; the next call runs again"""
+        flights = SingleFlight("test")
+
+        def failing_call():
+            time.sleep(0.2)
+            raise RuntimeError("upstream down")
+
+        results, errors = self.run_concurrently(lambda: flights.do("key", failing_call), n=4)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 4)
+
+        self.assertEqual(flights.do("key", lambda: "recovered"), "recovered")
+
+    def test_canonical_key_ignores_key_order_and_whitespace(self):
+        a = {"model": "gpt-4o", "messages": [{"role": "user", "content": "What is  climate anxiety?\n"}]}
+        b = {"messages": [{"content": "What is climate anxiety?", "role": "user"}], "model": "gpt-4o"}
+        self.assertEqual(canonical_key(a), canonical_key(b))
+        self.assertNotEqual(canonical_key(a), canonical_key({**b, "model": "gpt-4o-mini"}))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
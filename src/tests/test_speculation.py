@@ -0,0 +1,95 @@
+import logging
+import time
+import unittest
+
+from langchain_core.documents import Document
+
+from ..services.speculation import SpeculativeRetrieval, speculated_search, use_speculation
+from ..utils.metrics import SPECULATION_EVENTS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class SlowStore:
+    """Vector store whose similarity search takes `delay` seconds and records its queries."""
+
+    def __init__(self, name, delay, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.queries = []
+
+    def similarity_search_with_score(self, query, k=4):
+        self.queries.append((query, k))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("vector store busy")
+        return [(Document(page_content=f"{self.name} {n}: {query}"), n / 10) for n in range(k)]
+
+
+class TestSpeculativeRetrieval(unittest.TestCase):
+    def setUp(self):
+        self.abstracts = SlowStore("abstract", 0.2)
+        self.contents = SlowStore("content", 0.2)
+        self.speculative = SpeculativeRetrieval(
+            {"abstract_store": lambda: self.abstracts, "content_store": lambda: self.contents},
+            ["abstract_store", "content_store"],
+            k=5,
+        )
+
+    def events(self, route, result):
+        return SPECULATION_EVENTS.labels(route=route, result=result)._value.get()
+
+    def test_search_overlaps_router(self):
+        """The search runs while the router decides; the chosen route's search reuses it"""
+        used, wasted = self.events("abstract_store", "used"), self.events("content_store", "wasted")
+
+        start = time.perf_counter()
+        speculation = self.speculative.start("heatwaves in Malaysia ")
+        time.sleep(0.2)  # the router LLM call
+        self.assertEqual(speculation.resolve("Abstract_Store"), "abstract_store")
+        with use_speculation(speculation):
+            results = speculated_search(self.abstracts, "heatwaves in Malaysia", 3)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([doc.page_content for doc, _ in results],
+                         [f"abstract {n}: heatwaves in Malaysia" for n in range(3)])
+        # Serially this would take 0.4s
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(self.abstracts.queries, [("heatwaves in Malaysia", 5)])
+        self.assertEqual(self.events("abstract_store", "used"), used + 1)
+        self.assertEqual(self.events("content_store", "wasted"), wasted + 1)
+
+    def test_other_searches_not_answered(self):
+        """A restated question, a larger k or another store searches normally"""
+        wasted = self.events("content_store", "wasted")
+        speculation = self.speculative.start("sea level rise")
+        speculation.resolve("Content_Store")
+        with use_speculation(speculation):
+            self.assertIsNone(speculated_search(self.contents, "How fast is the sea level rising in Penang?", 5))
+            self.assertIsNone(speculated_search(self.contents, "sea level rise", 10))
+            self.assertIsNone(speculated_search(self.abstracts, "sea level rise", 5))
+        self.assertEqual(self.events("content_store", "wasted"), wasted + 1)
+        # Outside the request nothing is speculated
+        self.assertIsNone(speculated_search(self.contents, "sea level rise", 5))
+
+    def test_failed_speculation_searches_again(self):
+        failing = SlowStore("abstract", 0, fail=True)
+        speculative = SpeculativeRetrieval({"abstract_store": lambda: failing}, ["abstract_store"], k=5)
+        failed = self.events("abstract_store", "failed")
+
+        speculation = speculative.start("sea level rise")
+        speculation.resolve("Abstract_Store")
+        with use_speculation(speculation):
+            self.assertIsNone(speculated_search(failing, "sea level rise", 5))
+        self.assertEqual(self.events("abstract_store", "failed"), failed + 1)
+
+    def test_unknown_route_rejected(self):
+        with self.assertRaises(ValueError):
+            SpeculativeRetrieval({"abstract_store": lambda: self.abstracts}, ["web"], k=5)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,40 @@
+import logging
+import unittest
+
+from langchain_core.language_models.fake import FakeListLLM
+
+from ..utils.tracing import StageTracingHandler
+from ..utils.usage import TierUsageLedger, tier_usage
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TestTierUsage(unittest.TestCase):
+    def test_report_shares(self):
+        ledger = TierUsageLedger()
+        ledger.record("router", "gpt-4o-mini", 0.5, prompt_tokens=100, completion_tokens=20)
+        ledger.record("router", "gpt-4o-mini", 0.5, prompt_tokens=100, completion_tokens=20)
+        ledger.record("answer", "gpt-4o", 3.0, prompt_tokens=1500, completion_tokens=260)
+
+        report = ledger.report()
+        self.assertEqual(report["router"]["calls"], 2)
+        self.assertEqual(report["router"]["models"], ["gpt-4o-mini"])
+        self.assertAlmostEqual(report["router"]["avg_latency_seconds"], 0.5)
+        self.assertAlmostEqual(report["answer"]["latency_share"], 0.75)
+        self.assertAlmostEqual(report["router"]["token_share"] + report["answer"]["token_share"], 1.0)
+
+    def test_calls_are_attributed_to_the_model_tier(self):
+        """The tier travels in the model's callback metadata"""
+        tier_usage.reset()
+        llm = FakeListLLM(responses=["Content_Store"], metadata={"tier": "router"})
+        llm.invoke("Where are theses on flooding?", config={"callbacks": [StageTracingHandler()]})
+
+        report = tier_usage.report()
+        self.assertEqual(list(report), ["router"])
+        self.assertEqual(report["router"]["calls"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
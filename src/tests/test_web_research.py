@@ -0,0 +1,191 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from ..custom_imported_classes import page_loader, search
+from ..custom_imported_classes.page_loader import ConcurrentPageLoader
+from ..custom_imported_classes.retrievers import CustomWebResearchRetriever
+from ..custom_imported_classes.search import FilteredGoogleSearchAPIWrapper
+from ..utils.disk_cache import TTLDiskCache
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PAGES = {
+    "/heatwaves": ("text/html", "<html><head><title>Heatwaves</title></head><body><p>Heatwaves are getting longer.</p></body></html>"),
+    "/floods": ("text/html", "<html><head><title>Floods</title></head><body><p>Coastal floods are more frequent.</p></body></html>"),
+    "/big": ("text/html", "<html><body>" + "x" * 50_000 + "</body></html>"),
+    "/report.pdf": ("application/pdf", "%PDF-1.4"),
+}
+
+
+class FakePageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        if self.path == "/slow":
+            time.sleep(1.0)
+            content_type, body = "text/html", "<html><body>late</body></html>"
+        elif self.path == "/trickle":
+            # Each read gets some bytes well within the read timeout, but the page takes 3s in total
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(30 * 100))
+                self.end_headers()
+                for _ in range(30):
+                    self.wfile.write(b"x" * 100)
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            return
+        else:
+            content_type, body = PAGES[self.path]
+        data = body.encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSearchEngine:
+    """Mimics googleapiclient's `cse().list(...).execute()` and records the queries it receives."""
+
+    def __init__(self, results):
+        self.results = results
+        self.queries = []
+
+    def cse(self):
+        return self
+
+    def list(self, q, cx, **kwargs):
+        self.queries.append(q)
+        return self
+
+    def execute(self):
+        return {"items": self.results}
+
+
+class TestWebResearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        cache_path = os.path.join(self.tmpdir, "web_cache.db")
+        search._search_cache = TTLDiskCache(cache_path, "search_results", ttl=60)
+        page_loader._page_cache = TTLDiskCache(cache_path, "page_text", ttl=60)
+        self.addCleanup(setattr, search, "_search_cache", None)
+        self.addCleanup(setattr, page_loader, "_page_cache", None)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakePageHandler)
+        self.server.hits = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def test_page_loader_limits_and_cache(self):
+        """Slow and non-HTML pages are skipped, big pages truncated, and extracted text is cached"""
+        loader = ConcurrentPageLoader(max_concurrency=4, max_bytes=1000, timeout=0.3)
+        urls = [self.base_url + path for path in ("/heatwaves", "/big", "/slow", "/report.pdf")]
+
+        start = time.perf_counter()
+        docs = {doc.metadata["source"]: doc for doc in loader.load(urls)}
+        logger.info(f"Loaded {len(docs)} pages in {time.perf_counter() - start:.2f}s")
+
+        self.assertEqual(set(docs), {self.base_url + "/heatwaves", self.base_url + "/big"})
+        self.assertEqual(docs[self.base_url + "/heatwaves"].metadata["title"], "Heatwaves")
+        self.assertLessEqual(len(docs[self.base_url + "/big"].page_content), 1000)
+
+        hits = len(self.server.hits)
+        loader.load([self.base_url + "/heatwaves"])
+        self.assertEqual(len(self.server.hits), hits)
+
+    def test_page_timeout_bounds_whole_download(self):
+        """A page that keeps sending bytes slowly is abandoned at the timeout, not when it finishes"""
+        loader = ConcurrentPageLoader(max_concurrency=1, max_bytes=10_000, timeout=0.5)
+
+        start = time.perf_counter()
+        docs = loader.load([self.base_url + "/trickle", self.base_url + "/heatwaves"])
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([doc.metadata["source"] for doc in docs], [self.base_url + "/heatwaves"])
+        self.assertLess(elapsed, 1.5)
+
+    def test_repeat_question_uses_cached_search_and_pages(self):
+        """A repeat (or differently punctuated) question costs no search API call and no page load"""
+        engine = FakeSearchEngine([
+            {"title": "Heatwaves", "link": self.base_url + "/heatwaves"},
+            {"title": "Floods", "link": self.base_url + "/floods"},
+        ])
+        wrapper = FilteredGoogleSearchAPIWrapper.model_construct(
+            search_engine=engine, google_cse_id="cx", google_api_key="key", k=10, siterestrict=False
+        )
+
+        def build_retriever():
+            return CustomWebResearchRetriever.from_llm(
+                vectorstore=InMemoryVectorStore(DeterministicFakeEmbedding(size=16)),
+                llm=FakeListLLM(responses=['1. "Climate change heatwaves"\n2. "Coastal floods"']),
+                search=wrapper,
+                num_search_results=2,
+                allow_dangerous_requests=True,
+            )
+
+        docs = build_retriever().invoke("How does climate change affect heatwaves?")
+        self.assertEqual({doc.metadata["title"] for doc in docs}, {"Heatwaves", "Floods"})
+        self.assertEqual(len(engine.queries), 2)
+        page_hits = len(self.server.hits)
+
+        build_retriever().invoke("How does climate change affect heatwaves?")
+        self.assertEqual(len(engine.queries), 2)
+        self.assertEqual(len(self.server.hits), page_hits)
+
+        self.assertEqual(wrapper.results("COASTAL floods!", 2), wrapper.results("coastal floods", 2))
+        self.assertEqual(len(engine.queries), 2)
+
+    def test_pages_go_to_bounded_scratch_index(self):
+        """Web chunks are never written to the shared vectorstore, and each request indexes at most the cap"""
+        engine = FakeSearchEngine([
+            {"title": "Heatwaves", "link": self.base_url + "/heatwaves"},
+            {"title": "Big", "link": self.base_url + "/big"},
+        ])
+        wrapper = FilteredGoogleSearchAPIWrapper.model_construct(
+            search_engine=engine, google_cse_id="cx", google_api_key="key", k=10, siterestrict=False
+        )
+        shared_store = InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+        retriever = CustomWebResearchRetriever.from_llm(
+            vectorstore=shared_store,
+            llm=FakeListLLM(responses=['1. "Heatwaves"']),
+            search=wrapper,
+            num_search_results=2,
+            allow_dangerous_requests=True,
+            max_scratch_chunks=3,
+            text_splitter=RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=0),
+        )
+
+        docs = retriever.invoke("Are heatwaves getting longer?")
+        self.assertEqual(len(shared_store.store), 0)
+        self.assertLessEqual(len(docs), 3)
+        # Round-robin keeps the small page even though the big one has many more chunks
+        self.assertIn("Heatwaves", {doc.metadata["title"] for doc in docs})
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
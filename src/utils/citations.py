@@ -0,0 +1,95 @@
+"""
+Numbered context and server-side reference rendering.
+
+The generation prompts only ask the model for inline markers such as [1] or
+[2][3]; the reference list is rendered here from the metadata we store with
+every document (`title`, `year`, `source`), instead of being written out by
+the model token by token.
+"""
+
+import re
+from typing import Any, Dict, List, Sequence
+
+from langchain_core.documents import Document
+
+_MARKER = re.compile(r"\[(\d+(?:\s*,\s*\d+)*)\]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _as_document(item: Any) -> Document:
+    # RAG fusion returns (document, score) pairs
+    return item[0] if isinstance(item, tuple) else item
+
+
+def number_sources(docs: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    Group the retrieved documents by source, in retrieval order.
+
+    Chunks of the same thesis share one number, so the model cites the thesis
+    rather than individual chunks.
+    """
+    sources: Dict[str, Dict[str, Any]] = {}
+    for item in docs:
+        doc = _as_document(item)
+        metadata = doc.metadata or {}
+        key = metadata.get("source") or metadata.get("title") or f"chunk-{len(sources)}"
+        if key not in sources:
+            sources[key] = {"number": len(sources) + 1, "metadata": metadata, "chunks": []}
+        sources[key]["chunks"].append(doc.page_content)
+    return list(sources.values())
+
+
+def format_context(docs: Sequence[Any]) -> str:
+    """Render the retrieved documents as numbered sources for the prompt."""
+    blocks = []
+    for source in number_sources(docs):
+        metadata = source["metadata"]
+        header = f"[{source['number']}] {metadata.get('title', 'Untitled')}"
+        if metadata.get("year"):
+            header += f" ({metadata['year']})"
+        blocks.append(header + "\n" + "\n...\n".join(source["chunks"]))
+    return "\n\n".join(blocks)
+
+
+def cited_numbers(answer: str) -> List[int]:
+    """Citation numbers used in the answer, in order of first use."""
+    numbers: List[int] = []
+    for match in _MARKER.finditer(answer):
+        for number in match.group(1).split(","):
+            number = int(number)
+            if number not in numbers:
+                numbers.append(number)
+    return numbers
+
+
+def format_reference(number: int, metadata: Dict[str, Any]) -> str:
+    """APA-style reference with a clickable link, e.g. `[1] _Title._ (2021). [url](url)`"""
+    reference = f"[{number}] _{metadata.get('title', 'Untitled').strip()}._"
+    if metadata.get("year"):
+        reference += f" ({metadata['year']})."
+    source = (metadata.get("source") or "").strip()
+    if source:
+        reference += f" [{source}]({source})"
+    return reference
+
+
+def add_references(answer: str, docs: Sequence[Any], with_groundtruth: bool = False) -> str:
+    """
+    Append the reference list for the sources cited in `answer`.
+
+    Markers that don't match a retrieved source are left as they are. With
+    `with_groundtruth`, each reference is followed by the opening sentences of
+    the cited text (used by the evaluation prompt).
+    """
+    sources = {source["number"]: source for source in number_sources(docs)}
+    cited = [number for number in cited_numbers(answer) if number in sources]
+    if not cited:
+        return answer
+
+    lines = []
+    for number in cited:
+        lines.append(format_reference(number, sources[number]["metadata"]))
+        if with_groundtruth:
+            sentences = _SENTENCE_END.split(sources[number]["chunks"][0].strip())
+            lines.append(f"Groundtruth: \"{' '.join(sentences[:3])}\"")
+    return f"{answer.rstrip()}\n\n### References\n" + "\n\n".join(lines) + "\n"
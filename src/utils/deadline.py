@@ -0,0 +1,70 @@
+"""
+Request deadlines and graceful degradation.
+
+Every query runs under a time budget (REQUEST_DEADLINE seconds) set by the
+API route. The budget is kept in a context variable, so it follows the query
+into LangChain runnables and the worker threads they use.
+
+Stages that can be shortened ask `should_degrade(step)` before they start.
+A step is taken once the remaining budget drops below its threshold in
+DEGRADATION_THRESHOLDS; the thresholds decrease in the order the steps are
+given up, so the cheapest loss of quality always comes first:
+
+1. "single_query": no RAG fusion, the content store is searched with the question only
+2. "lower_k": fewer retrieved documents are passed to generation
+3. "skip_compression": the retrieved chunks are not re-scored sentence by sentence
+4. "skip_web_search": OTHER queries are answered from the content store instead
+
+The steps taken are recorded for the request and returned with the answer.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from ..config.settings import DEGRADATION_THRESHOLDS
+from .metrics import DEGRADATIONS
+
+logger = logging.getLogger(__name__)
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+# Shared (not copied) by the threads a request fans out to, so every step is reported
+_degradations: ContextVar[Optional[List[str]]] = ContextVar("degradations", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """Run the block under a budget of `seconds` (no deadline if None)."""
+    deadline_token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    degradations_token = _degradations.set([])
+    try:
+        yield
+    finally:
+        _degradations.reset(degradations_token)
+        _deadline.reset(deadline_token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def should_degrade(step: str) -> bool:
+    """Whether `step` must be taken given the remaining budget; records it if so."""
+    left = remaining()
+    if left is None or left >= DEGRADATION_THRESHOLDS[step]:
+        return False
+    taken = _degradations.get()
+    if taken is not None and step not in taken:
+        taken.append(step)
+        DEGRADATIONS.labels(step=step).inc()
+        logger.warning(f"Degrading ({step}): {max(left, 0):.1f}s of the request budget left")
+    return True
+
+
+def degradations() -> List[str]:
+    """Steps taken so far in the current request, in the order they were taken."""
+    return list(_degradations.get() or [])
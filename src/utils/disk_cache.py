@@ -0,0 +1,53 @@
+"""
+Small TTL'd key/value cache persisted in SQLite.
+
+Values are stored as JSON, so anything cached must be JSON-serializable.
+Expired entries are ignored on read and purged opportunistically on write.
+Hits and misses are counted in the `climarag_cache_events_total` metric
+under the cache's name.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from .metrics import CACHE_EVENTS
+
+
+class TTLDiskCache:
+    def __init__(self, path: str, name: str, ttl: float) -> None:
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.name} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.name} WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        CACHE_EVENTS.labels(cache=self.name, result="hit" if row else "miss").inc()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            # Keep the file from growing with dead entries
+            if random.random() < 0.01:
+                self._conn.execute(f"DELETE FROM {self.name} WHERE expires_at <= ?", (time.time(),))
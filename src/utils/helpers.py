@@ -1,4 +1,21 @@
 import json
+import math
+import os
+import threading
+
+def estimate_tokens(text) -> int:
+    """Cheap token estimate (~4 characters per token for English text), good enough for budgeting."""
+    return math.ceil(len(str(text)) / 4)
+
+def lower_thread_priority(niceness: int) -> None:
+    """
+    Raise the nice value of the calling thread only (Linux schedules threads
+    individually), so background work yields the CPU to request handlers.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except (AttributeError, OSError):
+        pass
 
 def load_corpus(filepath):
     with open(filepath, "r", encoding='utf-8') as file:
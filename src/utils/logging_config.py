@@ -0,0 +1,143 @@
+"""
+Logging setup for the API server.
+
+`configure_logging` replaces the per-module `basicConfig` handlers with a
+single handler whose format carries the id of the request that emitted the
+line, so the log lines of one query can be grepped out of a busy server.
+
+With `LOG_ASYNC` enabled the handler sits behind a queue: request threads
+only merge the arguments into the message and enqueue the record, and a
+background listener thread formats the line and writes it to stdout.
+
+Large objects (prompts, answers, retrieved documents) should be logged with
+`log_payload`, which truncates and samples them unless the request was sent
+with the debug header and an admin token (see `src/app.py`).
+"""
+
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+import random
+from typing import Any, Optional
+
+from ..config.settings import LOG_ASYNC, LOG_PAYLOAD_MAX_CHARS, LOG_PAYLOAD_SAMPLE_RATE
+from .tracing import debug_payloads_enabled, get_request_id
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+_factory_installed = False
+_listener: Optional[logging.handlers.QueueListener] = None
+_exception_formatter = logging.Formatter()
+
+
+def _install_request_id_factory() -> None:
+    """Attach the current request id to every LogRecord, whichever logger creates it."""
+    global _factory_installed
+    if _factory_installed:
+        return
+    base_factory = logging.getLogRecordFactory()
+
+    def record_factory(*args, **kwargs):
+        record = base_factory(*args, **kwargs)
+        record.request_id = get_request_id() or "-"
+        return record
+
+    logging.setLogRecordFactory(record_factory)
+    _factory_installed = True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves the line formatting to the listener thread.
+
+    The message arguments are still merged into the message in the calling
+    thread, since mutable arguments may change before the listener gets to the
+    record; the timestamp, level and request id prefix, and the write itself,
+    are done by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks reference live frames; render them now as well
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level: int = logging.INFO, use_queue: bool = LOG_ASYNC) -> None:
+    """Configure root logging with request ids. Safe to call more than once."""
+    global _listener
+    _install_request_id_factory()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    if use_queue:
+        log_queue: queue.Queue = queue.Queue(-1)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        handlers = [_DeferredQueueHandler(log_queue)]
+    else:
+        handlers = [stream_handler]
+
+    logging.basicConfig(level=level, handlers=handlers, force=True)
+
+
+def shutdown_logging() -> None:
+    """Flush the queued records and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} chars truncated]"
+
+
+class _Payload:
+    """Log argument that renders (and truncates) the wrapped object only when the record is formatted."""
+
+    __slots__ = ("obj", "limit")
+
+    def __init__(self, obj: Any, limit: Optional[int]) -> None:
+        self.obj = obj
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = str(self.obj)
+        return text if self.limit is None else _truncate(text, self.limit)
+
+
+def log_payload(
+    logger: logging.Logger,
+    msg: str,
+    payload: Any,
+    level: int = logging.INFO,
+    limit: int = LOG_PAYLOAD_MAX_CHARS,
+) -> None:
+    """
+    Log a potentially large object.
+
+    `msg` must contain a single `%s` placeholder for the payload. In debug
+    requests the full payload is logged; otherwise only a sampled fraction of
+    payload lines is emitted, truncated to `limit` characters.
+    """
+    if debug_payloads_enabled():
+        logger.log(level, msg, _Payload(payload, None))
+        return
+    if not logger.isEnabledFor(level) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, msg, _Payload(payload, limit))
@@ -0,0 +1,115 @@
+"""
+Prometheus metrics shared by the API layer and the RAG pipeline.
+
+All metrics are registered on the default `prometheus_client` registry and
+exported by the `/metrics` endpoint in `src/app.py`.
+"""
+
+from prometheus_client import Counter, Histogram
+
+# Buckets tuned for LLM-bound stages (tens of milliseconds up to a minute)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+DOCS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+REQUEST_LATENCY = Histogram(
+    "climarag_http_request_latency_seconds",
+    "End-to-end HTTP request latency",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+STAGE_LATENCY = Histogram(
+    "climarag_stage_latency_seconds",
+    "Latency of a single pipeline stage (router, self_query, retrieval, generation, ...)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_LATENCY = Histogram(
+    "climarag_llm_latency_seconds",
+    "Latency of a single upstream LLM call, by model and pipeline tier",
+    ["model", "tier"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_TOKENS = Histogram(
+    "climarag_llm_tokens",
+    "Tokens consumed per upstream LLM call, by model and pipeline tier",
+    ["model", "tier", "kind"],
+    buckets=TOKEN_BUCKETS,
+)
+
+DOCS_RETRIEVED = Histogram(
+    "climarag_docs_retrieved",
+    "Number of documents returned by a retriever call",
+    ["retriever"],
+    buckets=DOCS_BUCKETS,
+)
+
+LLM_UPSTREAM_EVENTS = Counter(
+    "climarag_llm_upstream_events_total",
+    "Upstream LLM API resilience events (retry, hedge, circuit_opened, circuit_rejected, deadline_exceeded)",
+    ["event"],
+)
+
+COALESCED_REQUESTS = Counter(
+    "climarag_coalesced_requests_total",
+    "Requests served by waiting on an identical in-flight call instead of issuing their own",
+    ["kind"],
+)
+
+HISTORY_BATCH = Histogram(
+    "climarag_history_batch_turns",
+    "Chat turns persisted per history transaction",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+
+CACHE_EVENTS = Counter(
+    "climarag_cache_events_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    ["cache", "result"],
+)
+
+SPECULATION_EVENTS = Counter(
+    "climarag_speculative_retrievals_total",
+    "Retrievals started before routing, by route and outcome (used/wasted/failed)",
+    ["route", "result"],
+)
+
+DEGRADATIONS = Counter(
+    "climarag_degradations_total",
+    "Queries degraded to stay within their deadline, by degradation step",
+    ["step"],
+)
+
+SPECULATION_SAVED = Histogram(
+    "climarag_speculation_saved_seconds",
+    "Wall-clock time saved by retrieving concurrently with the router",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+
+FUSION_DECISIONS = Counter(
+    "climarag_fusion_decisions_total",
+    "Content queries answered with RAG fusion or from a single retrieval (fused/skipped)",
+    ["decision"],
+)
+
+FUSION_QUERIES = Histogram(
+    "climarag_fusion_queries",
+    "Sub-queries generated per fused content query",
+    buckets=(1, 2, 3, 4, 5, 6, 8),
+)
+
+FUSION_SAVED = Histogram(
+    "climarag_fusion_saved_seconds",
+    "Estimated retrieval time saved per skipped fusion, against the average fusion latency",
+    buckets=LATENCY_BUCKETS,
+)
+
+COMPRESSION_RATIO = Histogram(
+    "climarag_compression_ratio",
+    "Characters of retrieved context kept by extractive compression, as a fraction of the input",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0),
+)
@@ -0,0 +1,107 @@
+"""
+Opt-in profiling of the query pipeline.
+
+Profiling is off unless a request turns it on: admins can ask for it with the
+`X-Profile: 1` header or the `profile=1` query parameter (together with their
+X-Admin-Token), and PROFILE_SAMPLE_RATE profiles a random fraction of
+requests (0 by default). For a profiled request, the blocks wrapped in
+`profile` are run under pyinstrument, if it is installed, and written to
+PROFILE_DIR as a speedscope file (https://www.speedscope.app) named after the
+request id; without pyinstrument, cProfile stats (`.prof`, e.g. for snakeviz)
+are written instead. The files written are listed in the X-Profile response
+header.
+
+Only the thread running the block is profiled; work handed to thread pools
+(speculative retrieval, page fetching) shows up as time waiting on them.
+"""
+
+import cProfile
+import logging
+import os
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from ..config.settings import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_SAMPLE_RATE
+from .tracing import get_request_id, new_request_id
+
+logger = logging.getLogger(__name__)
+
+# Files written for the current request; None when it is not profiled
+_profiles: ContextVar[Optional[List[str]]] = ContextVar("profiles", default=None)
+
+
+def sampled() -> bool:
+    """Whether a request without a profiling flag is profiled anyway."""
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def set_profiling(files: Optional[List[str]]):
+    """
+    Profile the current context, collecting the written files into `files`
+    (None disables profiling). Returns a token for `reset_profiling`.
+    """
+    return _profiles.set(files)
+
+
+def reset_profiling(token) -> None:
+    _profiles.reset(token)
+
+
+def _start():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="disabled")
+    profiler.start()
+    return profiler
+
+
+def _save(profiler, base: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if isinstance(profiler, cProfile.Profile):
+        path = f"{base}.prof"
+        profiler.dump_stats(path)
+        return path
+    from pyinstrument.renderers import SpeedscopeRenderer
+
+    path = f"{base}.speedscope.json"
+    with open(path, "w") as f:
+        f.write(profiler.output(renderer=SpeedscopeRenderer()))
+    return path
+
+
+@contextmanager
+def profile(name: str):
+    """Profile the wrapped block if the current request is profiled."""
+    files = _profiles.get()
+    if files is None:
+        yield
+        return
+    try:
+        profiler = _start()
+    except (RuntimeError, ValueError) as e:
+        # e.g. another profiler is already active in this thread
+        logger.warning(f"Could not start profiling {name}: {str(e)}")
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+        base = os.path.join(PROFILE_DIR, f"{get_request_id() or new_request_id()}-{name}")
+        try:
+            path = _save(profiler, base)
+        except OSError as e:
+            logger.warning(f"Could not write the profile of {name}: {str(e)}")
+        else:
+            files.append(path)
+            logger.info(f"Profile of {name} written to {path}")
@@ -0,0 +1,83 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+When many users ask the same question at the same moment, each request would
+otherwise trigger its own LLM and retrieval calls. `SingleFlight.do` runs the
+call once per key: the first caller (the leader) executes it, and callers that
+arrive while it is in flight wait for and share its result.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from .metrics import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def canonical_key(obj: Any) -> str:
+    """Stable hash of a JSON-like object (dict key order and surrounding whitespace do not matter)."""
+    def normalize(value):
+        if isinstance(value, str):
+            return " ".join(value.split())
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    encoded = json.dumps(normalize(obj), sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Thread-safe single-flight group. `kind` labels the coalesced-request metric."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED_REQUESTS.labels(kind=self.kind).inc()
+            logger.info(f"Coalesced {self.kind} request with an identical in-flight call")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Each follower gets its own copy so nobody can mutate a shared result
+            return copy.deepcopy(call.result)
+
+        try:
+            result = fn()
+            # Snapshot for the followers, taken before the leader's caller can mutate the result
+            call.result = copy.deepcopy(result)
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -0,0 +1,166 @@
+"""
+Request-scoped tracing for the RAG pipeline.
+
+Every HTTP request gets a request id (stored in a context variable so it
+follows the request into LangChain runnables and worker threads). Pipeline
+stages are recorded as spans, either explicitly with `trace_stage` or
+through `StageTracingHandler`, a LangChain callback handler that times the
+runnables, retrievers and LLM calls we have given a stage name.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from uuid import UUID, uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from .metrics import DOCS_RETRIEVED, LLM_LATENCY, LLM_TOKENS, STAGE_LATENCY
+from .usage import tier_usage
+
+logger = logging.getLogger(__name__)
+
+# Run names given to the pipeline runnables in RAGSystem; only these are traced
+# as stages so that the internal plumbing of LangChain does not flood the metrics.
+TRACED_STAGES = {
+    "router",
+    "self_query",
+    "fusion_query_generation",
+    "abstract_retrieval",
+    "content_retrieval",
+    "reciprocal_rank_fusion",
+    "generation",
+    "memory_summary",
+}
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_debug_payloads: ContextVar[bool] = ContextVar("debug_payloads", default=False)
+
+
+def new_request_id() -> str:
+    return uuid4().hex[:12]
+
+
+def get_request_id() -> Optional[str]:
+    """Return the id of the request being processed, if any."""
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str]):
+    """Bind a request id to the current context. Returns a token for `reset_request_id`."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token) -> None:
+    _request_id.reset(token)
+
+
+def debug_payloads_enabled() -> bool:
+    """Whether the current request asked for full, untruncated payloads in the logs."""
+    return _debug_payloads.get()
+
+
+def set_debug_payloads(enabled: bool):
+    """Enable full payload logging for the current context. Returns a token for `reset_debug_payloads`."""
+    return _debug_payloads.set(enabled)
+
+
+def reset_debug_payloads(token) -> None:
+    _debug_payloads.reset(token)
+
+
+@contextmanager
+def trace_stage(stage: str):
+    """Record the wrapped block as a span of the given pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage=stage).observe(elapsed)
+        logger.info(f"Stage {stage} took {elapsed * 1000:.1f} ms")
+
+
+class StageTracingHandler(BaseCallbackHandler):
+    """LangChain callback handler that turns named runs into stage spans."""
+
+    def __init__(self) -> None:
+        self._starts: Dict[UUID, Any] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, name: str) -> None:
+        with self._lock:
+            self._starts[run_id] = (name, time.perf_counter())
+
+    def _end(self, run_id: UUID):
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+        if started is None:
+            return None, 0.0
+        name, start = started
+        return name, time.perf_counter() - start
+
+    def _record_stage(self, run_id: UUID) -> None:
+        name, elapsed = self._end(run_id)
+        if name is not None:
+            STAGE_LATENCY.labels(stage=name).observe(elapsed)
+            logger.info(f"Stage {name} took {elapsed * 1000:.1f} ms")
+
+    # Chains -----------------------------------------------------------------
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs: Any) -> None:
+        name = kwargs.get("name")
+        if name in TRACED_STAGES:
+            self._start(run_id, name)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs: Any) -> None:
+        self._record_stage(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._record_stage(run_id)
+
+    # Retrievers -------------------------------------------------------------
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs: Any) -> None:
+        self._start(run_id, kwargs.get("name") or "retriever")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs: Any) -> None:
+        name, elapsed = self._end(run_id)
+        if name is None:
+            return
+        DOCS_RETRIEVED.labels(retriever=name).observe(len(documents))
+        if name in TRACED_STAGES:
+            STAGE_LATENCY.labels(stage=name).observe(elapsed)
+        logger.info(f"Retriever {name} returned {len(documents)} docs in {elapsed * 1000:.1f} ms")
+
+    def on_retriever_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    # LLMs -------------------------------------------------------------------
+    # The tier is the pipeline stage the model was configured for (see STAGE_MODELS)
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs: Any) -> None:
+        self._start(run_id, (kwargs.get("metadata") or {}).get("tier", "untiered"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs: Any) -> None:
+        self._start(run_id, (kwargs.get("metadata") or {}).get("tier", "untiered"))
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs: Any) -> None:
+        tier, elapsed = self._end(run_id)
+        tier = tier or "untiered"
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name", "unknown")
+        LLM_LATENCY.labels(model=model, tier=tier).observe(elapsed)
+
+        token_usage = llm_output.get("token_usage") or {}
+        tokens = {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(token_usage.get(kind), int):
+                tokens[kind] = token_usage[kind]
+                LLM_TOKENS.labels(model=model, tier=tier, kind=kind.split("_")[0]).observe(token_usage[kind])
+        tier_usage.record(tier, model, elapsed, **tokens)
+        logger.info(f"LLM call to {model} ({tier}) took {elapsed * 1000:.1f} ms, usage: {token_usage}")
+
+    def on_llm_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._end(run_id)
@@ -0,0 +1,52 @@
+"""
+Per-tier accounting of LLM latency and token usage.
+
+Each LLM built by `RAGSystem.setup_llms` carries its pipeline stage ("tier")
+in its callback metadata; `StageTracingHandler` records every call here, and
+the admin usage endpoint reports what each tier contributes since startup.
+"""
+
+import threading
+from typing import Any, Dict
+
+
+class TierUsageLedger:
+    def __init__(self) -> None:
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tier: str, model: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        with self._lock:
+            usage = self._tiers.setdefault(tier, {
+                "models": set(),
+                "calls": 0,
+                "latency_seconds": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+            })
+            usage["models"].add(model)
+            usage["calls"] += 1
+            usage["latency_seconds"] += latency
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Totals per tier, with each tier's share of the overall LLM latency and tokens."""
+        with self._lock:
+            tiers = {tier: dict(usage, models=sorted(usage["models"])) for tier, usage in self._tiers.items()}
+
+        total_latency = sum(usage["latency_seconds"] for usage in tiers.values())
+        total_tokens = sum(usage["prompt_tokens"] + usage["completion_tokens"] for usage in tiers.values())
+        for usage in tiers.values():
+            tokens = usage["prompt_tokens"] + usage["completion_tokens"]
+            usage["avg_latency_seconds"] = usage["latency_seconds"] / usage["calls"]
+            usage["latency_share"] = usage["latency_seconds"] / total_latency if total_latency else 0.0
+            usage["token_share"] = tokens / total_tokens if total_tokens else 0.0
+        return tiers
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tiers.clear()
+
+
+tier_usage = TierUsageLedger()